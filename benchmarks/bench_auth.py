@@ -0,0 +1,355 @@
+"""
+Offline benchmarks of the authentication hot path and the token views.
+
+Keycloak is replaced by the in-process emulator (django_drf_keycloak_auth.emulator),
+so no network is used.
+Every authentication strategy runs in its own process, configured through environment variables
+like a real deployment.
+
+Usage:
+    python benchmarks/bench_auth.py [--iterations 1000] [--threads 1,4,16]
+                                    [--keycloak-latency 0] [--output bench.json]
+"""
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SERVER_URL = "http://keycloak.bench"
+REALM = "bench"
+CLIENT_ID = "bench-api"
+
+STRATEGIES = {
+    "introspect": {"KEYCLOAK_AUTH_MODE": "introspect"},
+    "introspect_cached": {
+        "KEYCLOAK_AUTH_MODE": "introspect",
+        "KEYCLOAK_TOKEN_CACHE_TTL": "300",
+    },
+    "local": {"KEYCLOAK_AUTH_MODE": "local"},
+    "local_cached": {"KEYCLOAK_AUTH_MODE": "local", "KEYCLOAK_TOKEN_CACHE_TTL": "300"},
+}
+
+
+def build_claims(roles: str) -> dict:
+    now = int(time.time())
+    claims = {
+        "iss": f"{SERVER_URL}/realms/{REALM}",
+        "exp": now + 3600,
+        "iat": now,
+        "typ": "Bearer",
+        "azp": CLIENT_ID,
+        "sub": "f3b2c1d0-0000-4000-8000-000000000000",
+        "preferred_username": "bench",
+        "email": "bench@example.com",
+        "email_verified": True,
+        "realm_access": {"roles": ["default-roles-bench", "user"]},
+        "resource_access": {CLIENT_ID: {"roles": ["read"]}},
+    }
+    if roles == "large":
+        claims["realm_access"]["roles"] += [f"realm-role-{i}" for i in range(200)]
+        claims["resource_access"] = {
+            f"client-{c}": {"roles": [f"role-{r}" for r in range(20)]} for c in range(50)
+        }
+    return claims
+
+
+def percentiles(samples: list) -> dict:
+    samples = sorted(samples)
+    cuts = statistics.quantiles(samples, n=100, method="inclusive")
+    return {
+        "mean": round(statistics.fmean(samples) * 1e6, 2),
+        "p50": round(cuts[49] * 1e6, 2),
+        "p90": round(cuts[89] * 1e6, 2),
+        "p99": round(cuts[98] * 1e6, 2),
+        "max": round(samples[-1] * 1e6, 2),
+    }
+
+
+def measure(fn, args: list, threads: int) -> dict:
+    """
+    Call `fn` once per item of `args` on `threads` threads and collect the latency of every call.
+    """
+
+    chunks = [args[i::threads] for i in range(threads)]
+
+    def run(chunk):
+        samples = []
+        for arg in chunk:
+            start = time.perf_counter()
+            fn(arg)
+            samples.append(time.perf_counter() - start)
+        return samples
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        samples = [s for result in executor.map(run, chunks) for s in result]
+    elapsed = time.perf_counter() - start
+
+    return {
+        "iterations": len(samples),
+        "ops_per_sec": round(len(samples) / elapsed, 1),
+        "latency_us": percentiles(samples),
+    }
+
+
+def setup_worker(env: dict, latency: float):
+    """
+    Configure Django and the package in this process, with Keycloak replaced by the emulator.
+    """
+
+    sys.path.insert(0, ROOT)
+
+    from django_drf_keycloak_auth.emulator import KeycloakEmulator
+
+    emulator = KeycloakEmulator(
+        server_url=SERVER_URL,
+        realm=REALM,
+        client_id=CLIENT_ID,
+        client_secret="bench-secret",
+        latency=latency,
+    )
+    emulator.add_user("bench", roles=["default-roles-bench", "user"])
+    os.environ.update(**emulator.environ(), **env)
+
+    import django
+    from django.conf import settings
+
+    settings.configure(
+        SECRET_KEY="bench",
+        ALLOWED_HOSTS=["*"],
+        INSTALLED_APPS=[
+            "django.contrib.contenttypes",
+            "django.contrib.auth",
+            "rest_framework",
+            "drf_spectacular",
+        ],
+        REST_FRAMEWORK={"UNAUTHENTICATED_USER": None},
+    )
+    django.setup()
+
+    from django_drf_keycloak_auth.keycloak_utils import get_keycloak_transport
+
+    transport = get_keycloak_transport()
+    emulator.install(transport)
+
+    return emulator, transport
+
+
+def run_auth_worker(strategy: str, iterations: int, threads: list, latency: float):
+    emulator, transport = setup_worker(STRATEGIES[strategy], latency)
+
+    from django.test import RequestFactory
+
+    from django_drf_keycloak_auth.authentication import KeycloakAuthentication
+    from django_drf_keycloak_auth.cache import get_token_cache
+
+    factory = RequestFactory()
+    authentication = KeycloakAuthentication()
+
+    def authenticate(token: str):
+        request = factory.get("/", HTTP_AUTHORIZATION=f"Bearer {token}")
+        authentication.authenticate(request)
+
+    results = []
+    for roles in ("small", "large"):
+        # Distinct tokens so that the "cold" runs never hit a cache
+        cold_tokens = [
+            emulator.register({**build_claims(roles), "jti": f"{roles}-{i}"})
+            for i in range(iterations)
+        ]
+        warm_token = emulator.register({**build_claims(roles), "jti": f"{roles}-warm"})
+
+        for cache in ("cold", "warm"):
+            for thread_count in threads:
+                get_token_cache().clear()
+                if cache == "warm":
+                    authenticate(warm_token)
+                    tokens = [warm_token] * iterations
+                else:
+                    tokens = cold_tokens
+
+                calls_before = sum(transport.requests.values())
+                result = measure(authenticate, tokens, thread_count)
+                calls = sum(transport.requests.values()) - calls_before
+
+                results.append(
+                    {
+                        "name": f"authenticate[{strategy},{cache},{roles},threads={thread_count}]",
+                        "group": "authenticate",
+                        "strategy": strategy,
+                        "cache": cache,
+                        "roles": roles,
+                        "threads": thread_count,
+                        "keycloak_calls_per_op": round(calls / result["iterations"], 3),
+                        **result,
+                    }
+                )
+
+    return results
+
+
+def run_views_worker(iterations: int, threads: list, latency: float):
+    emulator, transport = setup_worker(STRATEGIES["local"], latency)
+
+    from rest_framework.test import APIRequestFactory
+
+    from django_drf_keycloak_auth.models.user import User
+    from django_drf_keycloak_auth.views import GenerateTokenView, RefreshTokenView
+
+    factory = APIRequestFactory()
+    generate_token = GenerateTokenView.as_view()
+    refresh_token = RefreshTokenView.as_view()
+
+    redirect_uri = "http://localhost:3000/auth/callback"
+
+    def call_generate_token(code):
+        request = factory.get("/oauth2/token/", {"redirect_uri": redirect_uri, "code": code})
+        assert generate_token(request).status_code == 200
+
+    def call_refresh_token(token):
+        request = factory.post("/oauth2/refresh/", {"refresh_token": token}, format="json")
+        assert refresh_token(request).status_code == 200
+
+    results = []
+    for name, fn, build_input in (
+        (
+            "GenerateTokenView",
+            call_generate_token,
+            lambda: emulator.create_code("bench", redirect_uri),
+        ),
+        (
+            "RefreshTokenView",
+            call_refresh_token,
+            lambda: emulator.issue_tokens("bench")["refresh_token"],
+        ),
+    ):
+        for thread_count in threads:
+            # Authorization codes are single use, and recent refreshes are served from a cache
+            inputs = [build_input() for _ in range(iterations)]
+            calls_before = sum(transport.requests.values())
+            result = measure(fn, inputs, thread_count)
+            calls = sum(transport.requests.values()) - calls_before
+            results.append(
+                {
+                    "name": f"view[{name},threads={thread_count}]",
+                    "group": "view",
+                    "view": name,
+                    "threads": thread_count,
+                    "keycloak_calls_per_op": round(calls / result["iterations"], 3),
+                    **result,
+                }
+            )
+
+    for roles in ("small", "large"):
+        claims = build_claims(roles)
+
+        def build_user(_):
+            user = User(claims=claims)
+            user.has_role("user")
+            user.to_dict()
+
+        result = measure(build_user, [None] * iterations, 1)
+        results.append(
+            {
+                "name": f"user[{roles}]",
+                "group": "user",
+                "roles": roles,
+                "threads": 1,
+                **result,
+            }
+        )
+
+    return results
+
+
+def run_worker(spec: dict):
+    if spec["kind"] == "auth":
+        results = run_auth_worker(
+            spec["strategy"], spec["iterations"], spec["threads"], spec["latency"]
+        )
+    else:
+        results = run_views_worker(spec["iterations"], spec["threads"], spec["latency"])
+    json.dump(results, sys.stdout)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    parser.add_argument("--iterations", type=int, default=1000)
+    parser.add_argument("--threads", default="1,4,16", help="Comma separated thread counts")
+    parser.add_argument(
+        "--keycloak-latency",
+        type=float,
+        default=0,
+        help="Simulated Keycloak latency per call, in milliseconds",
+    )
+    parser.add_argument(
+        "--strategies",
+        default=",".join(STRATEGIES),
+        help="Comma separated authentication strategies",
+    )
+    parser.add_argument("--output", help="Write the JSON results to this file")
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker(json.loads(args.worker))
+        return
+
+    common = {
+        "iterations": args.iterations,
+        "threads": [int(t) for t in args.threads.split(",")],
+        "latency": args.keycloak_latency / 1000,
+    }
+    specs = [
+        {"kind": "auth", "strategy": strategy, **common}
+        for strategy in args.strategies.split(",")
+    ] + [{"kind": "views", **common}]
+
+    results = []
+    for spec in specs:
+        output = subprocess.run(
+            [sys.executable, __file__, "--worker", json.dumps(spec)],
+            check=True,
+            capture_output=True,
+            text=True,
+        ).stdout
+        results.extend(json.loads(output))
+
+    sys.path.insert(0, ROOT)
+    from django_drf_keycloak_auth.version import __version__
+
+    report = {
+        "metadata": {
+            "version": __version__,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "keycloak_latency_ms": args.keycloak_latency,
+        },
+        "results": results,
+    }
+
+    print(f"{'benchmark':<60} {'ops/s':>10} {'p50 us':>10} {'p99 us':>10} {'kc/op':>6}")
+    for result in results:
+        print(
+            f"{result['name']:<60} {result['ops_per_sec']:>10} "
+            f"{result['latency_us']['p50']:>10} {result['latency_us']['p99']:>10} "
+            f"{result.get('keycloak_calls_per_op', ''):>6}"
+        )
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""
+Import-time budget of the package.
+
+Django and DRF are imported first, as they are in any project using the package, then the module is
+imported under `python -X importtime` and its cumulative import time is compared with the budget.
+The check also fails if the import pulled in one of the heavy dependencies that are only needed on first use.
+
+Usage:
+    python benchmarks/import_time.py [--module django_drf_keycloak_auth.authentication]
+                                     [--budget-ms 30] [--repeat 5]
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Cumulative import time (milliseconds) the package commits to, per module
+BUDGETS_MS = {
+    "django_drf_keycloak_auth.authentication": 30,
+    "django_drf_keycloak_auth.permissions": 30,
+    "django_drf_keycloak_auth.urls": 30,
+    "django_drf_keycloak_auth.views": 30,
+}
+
+# Imported on first use only
+LAZY_MODULES = ["dotenv", "httpx", "jwcrypto", "keycloak", "requests", "drf_spectacular"]
+
+PRELUDE = """
+import django
+from django.conf import settings
+
+settings.configure(
+    INSTALLED_APPS=["django.contrib.contenttypes", "django.contrib.auth", "rest_framework"],
+)
+django.setup()
+
+import rest_framework.authentication
+import rest_framework.permissions
+import rest_framework.views
+import sys
+
+before = set(sys.modules)
+print("START", file=sys.stderr)
+"""
+
+CHECK = """
+imported = [name for name in {lazy_modules!r} if name in sys.modules and name not in before]
+print("LAZY:" + ",".join(imported), file=sys.stderr)
+"""
+
+
+def measure(module: str) -> tuple:
+    """
+    Import `module` in a fresh interpreter.
+
+    return:
+    - The cumulative import time of the module in milliseconds
+    - The lazy modules that were imported by it
+    """
+
+    code = PRELUDE + f"import {module}\n" + CHECK.format(lazy_modules=LAZY_MODULES)
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=ROOT,
+        env={**os.environ, "PYTHONPATH": ROOT},
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+
+    lines = result.stderr.splitlines()
+    lines = lines[lines.index("START") + 1 :]
+    elapsed_us = None
+    imported = []
+    for line in lines:
+        if line.startswith("LAZY:"):
+            imported = [name for name in line[len("LAZY:") :].split(",") if name]
+        elif line.startswith("import time:"):
+            _, cumulative, name = line[len("import time:") :].split("|")
+            if name.strip() == module:
+                elapsed_us = int(cumulative)
+
+    if elapsed_us is None:
+        raise RuntimeError(f"{module} was already imported by the prelude")
+    return elapsed_us / 1000, imported
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--module", action="append", help="Module to check (repeatable)")
+    parser.add_argument("--budget-ms", type=float, help="Override the budget of the modules")
+    parser.add_argument("--repeat", type=int, default=5, help="The median of the runs is used")
+    args = parser.parse_args()
+
+    failed = False
+    for module in args.module or list(BUDGETS_MS):
+        budget = args.budget_ms or BUDGETS_MS.get(module, 30)
+        runs = [measure(module) for _ in range(args.repeat)]
+        elapsed = statistics.median(elapsed for elapsed, _ in runs)
+        imported = runs[-1][1]
+
+        ok = elapsed <= budget and not imported
+        failed |= not ok
+        print(
+            f"{'ok  ' if ok else 'FAIL'} {module}: {elapsed:.1f} ms (budget {budget:g} ms)"
+            + (f", imported eagerly: {', '.join(imported)}" if imported else "")
+        )
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,369 @@
+"""
+End-to-end load test of the oauth2 endpoints of django_drf_keycloak_auth.urls and of a protected view.
+
+The app is served by a threaded WSGI server (wsgiref) in its own process, and Keycloak by the emulator
+(django_drf_keycloak_auth.emulator) on localhost, with a simulated latency, so every call to Keycloak
+goes over a real socket. Every authentication configuration runs in its own server process,
+configured through environment variables like a real deployment.
+The load is generated from this process, by concurrent HTTP clients.
+
+Usage:
+    python benchmarks/loadtest.py [--requests 1000] [--concurrency 8] [--keycloak-latency 5]
+                                  [--configs local,local_cached] [--scenarios protected,token]
+                                  [--output loadtest.json]
+"""
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from itertools import cycle
+
+import httpx
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+REDIRECT_URI = "http://localhost:3000/auth/callback"
+
+CONFIGS = {
+    "introspect": {"KEYCLOAK_AUTH_MODE": "introspect"},
+    "introspect_cached": {
+        "KEYCLOAK_AUTH_MODE": "introspect",
+        "KEYCLOAK_TOKEN_CACHE_TTL": "300",
+    },
+    "local": {"KEYCLOAK_AUTH_MODE": "local"},
+    "local_cached": {"KEYCLOAK_AUTH_MODE": "local", "KEYCLOAK_TOKEN_CACHE_TTL": "300"},
+}
+
+# Scenario: fixture kind of its inputs (None if it needs none) and expected status code
+SCENARIOS = {
+    "protected": ("access_tokens", 200),
+    "login": (None, 302),
+    "token": ("codes", 200),
+    "callback": ("codes", 200),
+    "refresh": ("refresh_tokens", 200),
+    "revoke": ("refresh_tokens", 204),
+    "logout": ("refresh_tokens", 204),
+}
+
+# URL patterns of the server process, set once Django is configured
+urlpatterns = []
+
+
+def serve(config: dict, latency: float, users: int):
+    """
+    Serve the app in this process, with Keycloak replaced by the emulator served on localhost.
+    Writes the URL of the app to stdout, then serves until killed.
+    """
+
+    sys.path.insert(0, ROOT)
+
+    from django_drf_keycloak_auth.emulator import KeycloakEmulator
+
+    emulator = KeycloakEmulator(
+        realm="loadtest",
+        client_id="loadtest-api",
+        client_secret="loadtest-secret",
+        latency=latency,
+    )
+    for i in range(users):
+        emulator.add_user(f"user{i}", roles=["user"])
+    emulator.serve()
+    os.environ.update(**emulator.environ(), **config)
+
+    import django
+    from django.conf import settings
+
+    settings.configure(
+        SECRET_KEY="loadtest",
+        ALLOWED_HOSTS=["*"],
+        ROOT_URLCONF=__name__,
+        INSTALLED_APPS=[
+            "django.contrib.contenttypes",
+            "django.contrib.auth",
+            "rest_framework",
+            "drf_spectacular",
+        ],
+        REST_FRAMEWORK={"UNAUTHENTICATED_USER": None},
+    )
+    django.setup()
+
+    from django.core.wsgi import get_wsgi_application
+    from django.urls import include, path
+    from rest_framework import permissions
+    from rest_framework.response import Response
+    from rest_framework.views import APIView
+
+    from django_drf_keycloak_auth.authentication import KeycloakAuthentication
+
+    class ProtectedView(APIView):
+        authentication_classes = [KeycloakAuthentication]
+        permission_classes = [permissions.IsAuthenticated]
+
+        def get(self, request):
+            return Response({"username": request.user.username})
+
+    class FixturesView(APIView):
+        """
+        Inputs of the scenarios, created directly in the emulator so that they are not counted as calls.
+        """
+
+        authentication_classes = []
+        permission_classes = [permissions.AllowAny]
+
+        def post(self, request):
+            kind, count = request.data["kind"], request.data["count"]
+            usernames = cycle(emulator.users)
+            if kind == "codes":
+                items = [
+                    emulator.create_code(next(usernames), REDIRECT_URI)
+                    for _ in range(count)
+                ]
+            else:
+                key = kind[:-1]
+                items = [emulator.issue_tokens(next(usernames))[key] for _ in range(count)]
+            return Response(items)
+
+    class KeycloakCallsView(APIView):
+        authentication_classes = []
+        permission_classes = [permissions.AllowAny]
+
+        def get(self, request):
+            return Response(dict(emulator.requests))
+
+    urlpatterns.extend(
+        [
+            path("", include("django_drf_keycloak_auth.urls")),
+            path("api/protected/", ProtectedView.as_view()),
+            path("loadtest/fixtures/", FixturesView.as_view()),
+            path("loadtest/keycloak-calls/", KeycloakCallsView.as_view()),
+        ]
+    )
+
+    from socketserver import ThreadingMixIn
+    from wsgiref.simple_server import WSGIRequestHandler, WSGIServer, make_server
+
+    class ThreadingWSGIServer(ThreadingMixIn, WSGIServer):
+        daemon_threads = True
+        request_queue_size = 1024
+
+    class QuietHandler(WSGIRequestHandler):
+        disable_nagle_algorithm = True
+
+        def log_message(self, format, *args):
+            pass
+
+    server = make_server(
+        "127.0.0.1",
+        0,
+        get_wsgi_application(),
+        server_class=ThreadingWSGIServer,
+        handler_class=QuietHandler,
+    )
+    print(json.dumps({"url": f"http://127.0.0.1:{server.server_address[1]}"}), flush=True)
+    server.serve_forever()
+
+
+def percentiles(samples: list) -> dict:
+    samples = sorted(samples)
+    cuts = statistics.quantiles(samples, n=100, method="inclusive")
+    return {
+        "mean": round(statistics.fmean(samples) * 1e3, 3),
+        "p50": round(cuts[49] * 1e3, 3),
+        "p90": round(cuts[89] * 1e3, 3),
+        "p99": round(cuts[98] * 1e3, 3),
+        "max": round(samples[-1] * 1e3, 3),
+    }
+
+
+def build_request(scenario: str, item):
+    """
+    Get the arguments of `httpx.Client.request` for one request of a scenario.
+    """
+
+    if scenario == "protected":
+        return "GET", "/api/protected/", {"headers": {"Authorization": f"Bearer {item}"}}
+    if scenario == "login":
+        params = {"redirect_uri": REDIRECT_URI, "state": "state", "nonce": "nonce"}
+        return "GET", "/oauth2/login/", {"params": params}
+    if scenario == "token":
+        return "GET", "/oauth2/token/", {"params": {"redirect_uri": REDIRECT_URI, "code": item}}
+    if scenario == "callback":
+        return "GET", "/oauth2/callback/", {"params": {"code": item}}
+    if scenario == "refresh":
+        return "POST", "/oauth2/refresh/", {"json": {"refresh_token": item}}
+    if scenario == "revoke":
+        data = {"token": item, "token_type_hint": "refresh_token"}
+        return "POST", "/oauth2/revoke/", {"json": data}
+    return "POST", "/oauth2/logout/", {"json": {"refresh_token": item}}
+
+
+def run_scenario(
+    client: httpx.Client, scenario: str, requests: int, concurrency: int, warmup: int, users: int
+) -> dict:
+    kind, expected_status = SCENARIOS[scenario]
+
+    def get_fixtures(count: int) -> list:
+        if kind is None:
+            return [None] * count
+        # Access tokens are reused, like the tokens of the active users of a deployment
+        fixture_count = min(count, users) if kind == "access_tokens" else count
+        response = client.post("/loadtest/fixtures/", json={"kind": kind, "count": fixture_count})
+        response.raise_for_status()
+        items = response.json()
+        return [items[i % len(items)] for i in range(count)]
+
+    def send(item) -> tuple:
+        method, url, kwargs = build_request(scenario, item)
+        start = time.perf_counter()
+        try:
+            status_code = client.request(method, url, **kwargs).status_code
+        except httpx.HTTPError as e:
+            status_code = type(e).__name__
+        return time.perf_counter() - start, status_code
+
+    for item in get_fixtures(warmup):
+        send(item)
+
+    items = get_fixtures(requests)
+    calls_before = Counter(client.get("/loadtest/keycloak-calls/").json())
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(send, items))
+    elapsed = time.perf_counter() - start
+
+    calls = Counter(client.get("/loadtest/keycloak-calls/").json())
+    calls.subtract(calls_before)
+    statuses = Counter(str(status_code) for _, status_code in results)
+    errors = sum(
+        count
+        for status_code, count in statuses.items()
+        if status_code != str(expected_status)
+    )
+
+    return {
+        "requests": len(results),
+        "requests_per_sec": round(len(results) / elapsed, 1),
+        "latency_ms": percentiles([latency for latency, _ in results]),
+        "error_rate": round(errors / len(results), 4),
+        "statuses": dict(statuses),
+        "keycloak_calls_per_request": round(sum(calls.values()) / len(results), 3),
+        "keycloak_calls": {endpoint: count for endpoint, count in calls.items() if count},
+    }
+
+
+def run_config(name: str, args) -> list:
+    spec = {"config": CONFIGS[name], "latency": args.keycloak_latency / 1000, "users": args.users}
+    server = subprocess.Popen(
+        [sys.executable, __file__, "--serve", json.dumps(spec)],
+        stdout=subprocess.PIPE,
+        text=True,
+    )
+    try:
+        url = json.loads(server.stdout.readline())["url"]
+        limits = httpx.Limits(
+            max_connections=args.concurrency,
+            max_keepalive_connections=args.concurrency,
+        )
+        results = []
+        with httpx.Client(base_url=url, limits=limits, timeout=30) as client:
+            for scenario in args.scenarios.split(","):
+                result = run_scenario(
+                    client, scenario, args.requests, args.concurrency, args.warmup, args.users
+                )
+                results.append(
+                    {
+                        "name": f"{scenario}[{name},concurrency={args.concurrency}]",
+                        "scenario": scenario,
+                        "config": name,
+                        "concurrency": args.concurrency,
+                        **result,
+                    }
+                )
+        return results
+    finally:
+        server.kill()
+        server.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    parser.add_argument("--requests", type=int, default=1000, help="Requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=8, help="Concurrent clients")
+    parser.add_argument(
+        "--warmup", type=int, default=20, help="Requests per scenario before measuring"
+    )
+    parser.add_argument("--users", type=int, default=100, help="Distinct users and access tokens")
+    parser.add_argument(
+        "--keycloak-latency",
+        type=float,
+        default=5,
+        help="Simulated Keycloak latency per call, in milliseconds",
+    )
+    parser.add_argument(
+        "--configs",
+        default=",".join(CONFIGS),
+        help="Comma separated authentication configurations",
+    )
+    parser.add_argument(
+        "--scenarios",
+        default=",".join(SCENARIOS),
+        help="Comma separated scenarios",
+    )
+    parser.add_argument("--output", help="Write the JSON results to this file")
+    parser.add_argument("--serve", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        spec = json.loads(args.serve)
+        serve(spec["config"], spec["latency"], spec["users"])
+        return
+
+    results = []
+    for name in args.configs.split(","):
+        results.extend(run_config(name, args))
+
+    sys.path.insert(0, ROOT)
+    from django_drf_keycloak_auth.version import __version__
+
+    report = {
+        "metadata": {
+            "version": __version__,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "server": "wsgiref (threaded)",
+            "keycloak_latency_ms": args.keycloak_latency,
+            "concurrency": args.concurrency,
+            "requests": args.requests,
+        },
+        "results": results,
+    }
+
+    print(
+        f"{'scenario':<45} {'req/s':>8} {'p50 ms':>8} {'p90 ms':>8} {'p99 ms':>8} "
+        f"{'errors':>7} {'kc/req':>7}"
+    )
+    for result in results:
+        print(
+            f"{result['name']:<45} {result['requests_per_sec']:>8} "
+            f"{result['latency_ms']['p50']:>8} {result['latency_ms']['p90']:>8} "
+            f"{result['latency_ms']['p99']:>8} {result['error_rate']:>7.2%} "
+            f"{result['keycloak_calls_per_request']:>7}"
+        )
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
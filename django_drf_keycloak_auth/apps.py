@@ -0,0 +1,14 @@
+from django.apps import AppConfig
+
+
+class DjangoDrfKeycloakAuthConfig(AppConfig):
+    name = "django_drf_keycloak_auth"
+    verbose_name = "Django DRF Keycloak Auth"
+
+    def ready(self):
+        from django_drf_keycloak_auth.conf import keycloak_settings
+
+        if keycloak_settings.KEYCLOAK_WARMUP:
+            from django_drf_keycloak_auth.warmup import get_warmup
+
+            get_warmup().start()
@@ -1,41 +1,569 @@
+import asyncio
+import logging
+import threading
+import time
+from typing import Optional, Set, Tuple
+
+from asgiref.sync import sync_to_async
 from django.http import HttpRequest
 from rest_framework.authentication import BaseAuthentication
 from rest_framework.exceptions import AuthenticationFailed
 
-from django_drf_keycloak_auth.keycloak_utils import get_keycloak_openid
+from django_drf_keycloak_auth.cache import (
+    get_shared_token_cache,
+    get_token_cache,
+    hash_token,
+)
+from django_drf_keycloak_auth.keycloak_utils import (
+    a_get_userinfo,
+    a_introspect_token,
+    decode_access_token,
+    get_jwks,
+    get_metrics,
+    get_token_header,
+    get_token_payload,
+    get_userinfo,
+    introspect_token,
+)
+from django_drf_keycloak_auth.metrics import MetricsSink
 from django_drf_keycloak_auth.models.user import User
+from django_drf_keycloak_auth.realms import (
+    Realm,
+    get_realm_registry,
+    get_settings,
+    use_realm,
+)
+from django_drf_keycloak_auth.resilience import (
+    KeycloakUnavailableError,
+    is_keycloak_unavailable,
+    run_in_background,
+)
+from django_drf_keycloak_auth.revocation import get_revocation_list
+from django_drf_keycloak_auth.singleflight import AsyncSingleFlight, SingleFlight
+
+logger = logging.getLogger(__name__)
+
+
+def get_django_request(request: HttpRequest) -> HttpRequest:
+    """
+    Get the Django request of a DRF request, or the request itself.
+    """
+
+    return getattr(request, "_request", request)
 
 
 class KeycloakAuthentication(BaseAuthentication):
     """Authentication that accepts Keycloak Bearer tokens."""
 
+    # Shared by all instances, DRF creates one per request
+    validation_flight = SingleFlight()
+    revalidating: Set[str] = set()
+    revalidating_lock = threading.Lock()
+
+    # Attribute of the Django request the results of `authenticate` are memoised in, by `get_result_key`,
+    # so that KeycloakAuthenticationMiddleware and DRF validate a token once per request
+    result_attr = "_keycloak_authentication"
+
     def authenticate(self, request: HttpRequest):
 
-        # Get request header of [Authorization: Bearer <token>]
-        auth: str = request.META.get("HTTP_AUTHORIZATION", "")
-        if not auth:
+        django_request = get_django_request(request)
+        result = self.get_result(django_request)
+        if result is None:
+            try:
+                result = (self.authenticate_bearer(request), None)
+            except (AuthenticationFailed, KeycloakUnavailableError) as e:
+                result = (None, e)
+            self.set_result(django_request, result)
+
+        user_auth, error = result
+        if error is not None:
+            raise error
+        return user_auth
+
+    def get_result_key(self) -> str:
+        """
+        Key of the memoised result of `authenticate`.
+        Subclasses may get the token or the user differently, so every class has its own result.
+        """
+
+        cls = type(self)
+        return f"{cls.__module__}.{cls.__qualname__}"
+
+    def get_result(self, django_request: HttpRequest) -> Optional[tuple]:
+        results = getattr(django_request, self.result_attr, None)
+        return results.get(self.get_result_key()) if results is not None else None
+
+    def set_result(self, django_request: HttpRequest, result: tuple):
+        results = getattr(django_request, self.result_attr, None)
+        if results is None:
+            results = {}
+            setattr(django_request, self.result_attr, results)
+        results[self.get_result_key()] = result
+
+    def authenticate_bearer(self, request: HttpRequest) -> Optional[Tuple[User, str]]:
+        """
+        Authenticate the Bearer token of the Authorization header.
+
+        return:
+        - The user and the access token, None if there is no Authorization header
+        - raise AuthenticationFailed if the token is invalid
+        """
+
+        access_token = self.get_access_token(request)
+        if access_token is None:
             # If None is returned,
             # it indicates that the authentication class has not authenticated the request.
             # (DRF will continue to try other authentication classes or consider the request anonymous).
             return None
+
+        realm = self.get_realm(access_token)
+        with use_realm(realm):
+            metrics = get_metrics()
+        if not metrics.enabled:
+            return (self.get_user(access_token, realm), access_token)
+
+        start = time.monotonic()
+        try:
+            user = self.get_user(access_token, realm)
+        except Exception as e:
+            self.record_authentication(metrics, start, e)
+            raise
+        self.record_authentication(metrics, start)
+        return (user, access_token)
+
+    @staticmethod
+    def record_authentication(
+        metrics: MetricsSink, start: float, error: Optional[Exception] = None
+    ):
+        if error is None:
+            outcome = "success"
+        elif isinstance(error, KeycloakUnavailableError):
+            outcome = "unavailable"
+        elif isinstance(error, AuthenticationFailed):
+            outcome = "failed"
+        else:
+            outcome = type(error).__name__
+
+        metrics.increment("keycloak_authentications_total", tags={"outcome": outcome})
+        metrics.observe(
+            "keycloak_authentication_duration_seconds",
+            time.monotonic() - start,
+            tags={"outcome": outcome},
+        )
+
+    @staticmethod
+    def get_realm(access_token: str) -> Realm:
+        """
+        Get the realm that issued a token, by its unverified "iss" claim.
+        The claims are verified later, against the keys and settings of that realm.
+
+        return:
+        - The realm, the default realm when only one is served
+        - raise AuthenticationFailed if no realm has this issuer
+        """
+
+        registry = get_realm_registry()
+        if not registry.multiple:
+            return registry.default
+
+        try:
+            issuer = get_token_payload(access_token).get("iss")
+        except Exception:
+            raise AuthenticationFailed("Invalid access_token")
+
+        realm = registry.get_by_issuer(issuer)
+        if realm is None:
+            raise AuthenticationFailed("Unknown token issuer")
+        return realm
+
+    def get_access_token(self, request: HttpRequest) -> Optional[str]:
+        """
+        Get the access token from the request header.
+
+        return:
+        - The access token, None if there is no Authorization header
+        - raise AuthenticationFailed if the header is not a Bearer token
+        """
+
+        # Get request header of [Authorization: Bearer <token>]
+        auth: str = request.META.get("HTTP_AUTHORIZATION", "")
+        if not auth:
+            return None
         elif not auth.startswith("Bearer "):
             raise AuthenticationFailed("Invalid token header. No credentials provided.")
 
         # Get access token from header
-        access_token = auth.split(" ", 1)[1].strip()
+        return auth.split(" ", 1)[1].strip()
+
+    def get_user(self, access_token: str, realm: Optional[Realm] = None) -> User:
+        """
+        Get the user of a token, looking it up in the in-process cache, then in the shared cache,
+        and validating the token only when both miss.
+
+        Concurrent lookups of the same token are coalesced into one.
+        A stale cached user is returned at once and revalidated in the background.
+        The token is validated in `realm`, by default in the realm that issued it.
+        """
+
+        with use_realm(realm or self.get_realm(access_token)):
+            return self.get_realm_user(access_token)
+
+    def get_realm_user(self, access_token: str) -> User:
+        """
+        Get the user of a token issued by the current realm, see `get_user`.
+        """
+
+        token_cache = get_token_cache()
+        token_hash = hash_token(access_token)
+
+        if token_cache.enabled:
+            entry = token_cache.get_entry(token_hash)
+            if entry is not None:
+                user, stale = entry
+                self.check_revocation(access_token, token_hash, user.claims)
+                if stale:
+                    self.revalidate_in_background(access_token, token_hash)
+                return user
+
+        claims, exp = self.validation_flight.do(
+            token_hash, self.get_claims, access_token, token_hash
+        )
+        self.check_revocation(access_token, token_hash, claims)
+
+        user = User(claims=claims)
+        if token_cache.enabled:
+            token_cache.set(token_hash, user, expires_at=exp)
+        return user
 
-        keycloak_openid = get_keycloak_openid()
+    def check_revocation(self, access_token: str, token_hash: str, claims: dict):
+        """
+        Check the token against the revocation denylist, when configured.
+
+        return:
+        - None if the token is not revoked
+        - raise AuthenticationFailed if it is
+        """
+
+        revocation_list = get_revocation_list()
+        if revocation_list is None:
+            return
+
+        if revocation_list.is_revoked(
+            token_hash, self.get_token_claims(access_token, claims)
+        ):
+            raise AuthenticationFailed("Token has been revoked")
+
+    @staticmethod
+    def get_token_claims(access_token: str, claims: dict) -> dict:
+        # With introspection the user claims come from userinfo, which has no "jti" nor "sid".
+        # The token is valid at this point, so its own payload can be trusted.
+        if "jti" in claims:
+            return claims
+        try:
+            return get_token_payload(access_token)
+        except Exception:
+            return {}
+
+    def revalidate_in_background(self, access_token: str, token_hash: str):
+        """
+        Validate a stale cached token again, at most once at a time per token.
+        """
+
+        with self.revalidating_lock:
+            if token_hash in self.revalidating:
+                return
+            self.revalidating.add(token_hash)
+
+        run_in_background(self.revalidate, access_token, token_hash)
+
+    def revalidate(self, access_token: str, token_hash: str):
+        token_cache = get_token_cache()
+        try:
+            claims, exp = self.validation_flight.do(
+                token_hash, self.get_claims, access_token, token_hash
+            )
+            token_cache.set(token_hash, User(claims=claims), expires_at=exp)
+        except AuthenticationFailed:
+            # The token is no longer valid, stop serving it
+            token_cache.delete(token_hash)
+        except Exception:
+            # Keycloak is unavailable, keep serving the stale user until its grace period ends
+            logger.warning("Failed to revalidate a cached token", exc_info=True)
+        finally:
+            with self.revalidating_lock:
+                self.revalidating.discard(token_hash)
+
+    def get_claims(
+        self, access_token: str, token_hash: str
+    ) -> Tuple[dict, Optional[float]]:
+        """
+        Get the claims of a token from the shared cache, or validate it on a miss.
+        """
+
+        shared_cache = get_shared_token_cache()
+        if shared_cache is None:
+            return self.validate(access_token)
+
+        entry = shared_cache.get(token_hash)
+        if entry is not None:
+            return entry["claims"], entry["exp"]
+
+        claims, exp = self.validate(access_token)
+        shared_cache.set(token_hash, {"claims": claims, "exp": exp}, expires_at=exp)
+        return claims, exp
+
+    def validate(self, access_token: str) -> Tuple[dict, Optional[float]]:
+        """
+        Validate the token.
+
+        return:
+        - The claims of the user and the expiration time of the token
+        - raise AuthenticationFailed if invalid
+        """
+
+        if get_settings().KEYCLOAK_AUTH_MODE == "introspect":
+            return self.introspect(access_token)
+        return self.decode(access_token)
+
+    def decode(self, access_token: str) -> Tuple[dict, Optional[float]]:
+        """Validate the token locally and return its claims."""
+
+        try:
+            claims = decode_access_token(access_token)
+        except Exception as e:
+            # The key set could not be fetched: the token may well be valid
+            if is_keycloak_unavailable(e):
+                raise KeycloakUnavailableError() from e
+            raise AuthenticationFailed("Invalid access_token")
+
+        return claims, claims.get("exp")
+
+    def introspect(self, access_token: str) -> Tuple[dict, Optional[float]]:
+        """Validate the token with Keycloak and return the userinfo claims."""
 
         try:
             # Check whether the token is valid
-            result = keycloak_openid.introspect(access_token)
+            result = introspect_token(access_token)
             if not result.get("active"):
                 raise AuthenticationFailed("Token is not active")
 
             # userinfo raises if token invalid
-            userinfo = keycloak_openid.userinfo(access_token)
+            userinfo = get_userinfo(access_token)
+        except AuthenticationFailed:
+            raise
         except Exception as e:
+            if isinstance(e, KeycloakUnavailableError):
+                raise
+            if is_keycloak_unavailable(e):
+                raise KeycloakUnavailableError() from e
             raise AuthenticationFailed("Invalid access_token")
 
-        user = User(claims=userinfo)
+        return userinfo, result.get("exp")
+
+
+class AsyncKeycloakAuthentication(KeycloakAuthentication):
+    """
+    Authentication that accepts Keycloak Bearer tokens, for async views and async middleware.
+
+    Keycloak is awaited through the pooled async client of the shared transport, so no thread is blocked
+    during the round trip.
+    `authenticate` is a coroutine, use it with async DRF views (e.g. adrf) or call `a_get_user` directly.
+    """
+
+    # Shared by all instances, DRF creates one per request
+    async_validation_flight = AsyncSingleFlight()
+    revalidation_tasks: Set[asyncio.Task] = set()
+
+    def get_result_key(self) -> str:
+        # Validates tokens like KeycloakAuthentication: sync and async code share the result
+        if type(self) is AsyncKeycloakAuthentication:
+            return f"{__name__}.KeycloakAuthentication"
+        return super().get_result_key()
+
+    async def authenticate(self, request: HttpRequest):
+
+        django_request = get_django_request(request)
+        result = self.get_result(django_request)
+        if result is None:
+            try:
+                result = (await self.a_authenticate_bearer(request), None)
+            except (AuthenticationFailed, KeycloakUnavailableError) as e:
+                result = (None, e)
+            self.set_result(django_request, result)
+
+        user_auth, error = result
+        if error is not None:
+            raise error
+        return user_auth
+
+    async def a_authenticate_bearer(
+        self, request: HttpRequest
+    ) -> Optional[Tuple[User, str]]:
+        """
+        Async version of `authenticate_bearer`.
+        """
+
+        access_token = self.get_access_token(request)
+        if access_token is None:
+            return None
+
+        realm = self.get_realm(access_token)
+        with use_realm(realm):
+            metrics = get_metrics()
+        if not metrics.enabled:
+            return (await self.a_get_user(access_token, realm), access_token)
+
+        start = time.monotonic()
+        try:
+            user = await self.a_get_user(access_token, realm)
+        except Exception as e:
+            self.record_authentication(metrics, start, e)
+            raise
+        self.record_authentication(metrics, start)
         return (user, access_token)
+
+    async def a_get_user(self, access_token: str, realm: Optional[Realm] = None) -> User:
+        """
+        Async version of `get_user`.
+        """
+
+        with use_realm(realm or self.get_realm(access_token)):
+            return await self.a_get_realm_user(access_token)
+
+    async def a_get_realm_user(self, access_token: str) -> User:
+        """
+        Async version of `get_realm_user`.
+        """
+
+        token_cache = get_token_cache()
+        token_hash = hash_token(access_token)
+
+        if token_cache.enabled:
+            entry = token_cache.get_entry(token_hash)
+            if entry is not None:
+                user, stale = entry
+                await self.a_check_revocation(access_token, token_hash, user.claims)
+                if stale:
+                    self.a_revalidate_in_background(access_token, token_hash)
+                return user
+
+        claims, exp = await self.async_validation_flight.do(
+            token_hash, self.a_get_claims, access_token, token_hash
+        )
+        await self.a_check_revocation(access_token, token_hash, claims)
+
+        user = User(claims=claims)
+        if token_cache.enabled:
+            token_cache.set(token_hash, user, expires_at=exp)
+        return user
+
+    async def a_check_revocation(self, access_token: str, token_hash: str, claims: dict):
+        """
+        Async version of `check_revocation`.
+        """
+
+        revocation_list = get_revocation_list()
+        if revocation_list is None:
+            return
+
+        if await revocation_list.a_is_revoked(
+            token_hash, self.get_token_claims(access_token, claims)
+        ):
+            raise AuthenticationFailed("Token has been revoked")
+
+    def a_revalidate_in_background(self, access_token: str, token_hash: str):
+        """
+        Async version of `revalidate_in_background`, the revalidation runs as a task of the event loop.
+        """
+
+        with self.revalidating_lock:
+            if token_hash in self.revalidating:
+                return
+            self.revalidating.add(token_hash)
+
+        # Keep a reference to the task, the event loop only keeps a weak one
+        task = asyncio.get_running_loop().create_task(
+            self.a_revalidate(access_token, token_hash)
+        )
+        self.revalidation_tasks.add(task)
+        task.add_done_callback(self.revalidation_tasks.discard)
+
+    async def a_revalidate(self, access_token: str, token_hash: str):
+        token_cache = get_token_cache()
+        try:
+            claims, exp = await self.async_validation_flight.do(
+                token_hash, self.a_get_claims, access_token, token_hash
+            )
+            token_cache.set(token_hash, User(claims=claims), expires_at=exp)
+        except AuthenticationFailed:
+            token_cache.delete(token_hash)
+        except Exception:
+            logger.warning("Failed to revalidate a cached token", exc_info=True)
+        finally:
+            with self.revalidating_lock:
+                self.revalidating.discard(token_hash)
+
+    async def a_get_claims(
+        self, access_token: str, token_hash: str
+    ) -> Tuple[dict, Optional[float]]:
+        """
+        Async version of `get_claims`.
+        """
+
+        shared_cache = get_shared_token_cache()
+        if shared_cache is None:
+            return await self.a_validate(access_token)
+
+        entry = await shared_cache.aget(token_hash)
+        if entry is not None:
+            return entry["claims"], entry["exp"]
+
+        claims, exp = await self.a_validate(access_token)
+        await shared_cache.aset(
+            token_hash, {"claims": claims, "exp": exp}, expires_at=exp
+        )
+        return claims, exp
+
+    async def a_validate(self, access_token: str) -> Tuple[dict, Optional[float]]:
+        """
+        Async version of `validate`.
+        """
+
+        if get_settings().KEYCLOAK_AUTH_MODE == "introspect":
+            return await self.a_introspect(access_token)
+        return await self.a_decode(access_token)
+
+    async def a_decode(self, access_token: str) -> Tuple[dict, Optional[float]]:
+        """Validate the token locally and return its claims."""
+
+        try:
+            kid = get_token_header(access_token).get("kid")
+        except Exception:
+            raise AuthenticationFailed("Invalid access_token")
+
+        # Verifying with a known key is CPU only, fetching the key set is moved off the event loop
+        if get_jwks().has_key(kid):
+            return self.decode(access_token)
+        return await sync_to_async(self.decode, thread_sensitive=False)(access_token)
+
+    async def a_introspect(self, access_token: str) -> Tuple[dict, Optional[float]]:
+        """Validate the token with Keycloak and return the userinfo claims."""
+
+        try:
+            # Check whether the token is valid
+            result = await a_introspect_token(access_token)
+            if not result.get("active"):
+                raise AuthenticationFailed("Token is not active")
+
+            # userinfo raises if token invalid
+            userinfo = await a_get_userinfo(access_token)
+        except AuthenticationFailed:
+            raise
+        except Exception as e:
+            if isinstance(e, KeycloakUnavailableError):
+                raise
+            if is_keycloak_unavailable(e):
+                raise KeycloakUnavailableError() from e
+            raise AuthenticationFailed("Invalid access_token")
+
+        return userinfo, result.get("exp")
@@ -0,0 +1,294 @@
+import hashlib
+import logging
+import math
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Optional, Tuple
+
+from django.core.cache import caches
+
+from django_drf_keycloak_auth.keycloak_utils import get_metrics
+from django_drf_keycloak_auth.metrics import MetricsSink, NullSink
+from django_drf_keycloak_auth.realms import (
+    get_current_realm,
+    get_realm_registry,
+    get_settings,
+    realm_cache,
+)
+
+logger = logging.getLogger(__name__)
+
+
+def hash_token(token: str) -> str:
+    """
+    Hash a token so that it can be used as a cache key without keeping the raw token.
+    """
+
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+
+def get_key_prefix(kind: str) -> str:
+    """
+    Get the prefix of the keys of the current realm in a shared cache, e.g. "keycloak:token:".
+    """
+
+    if get_realm_registry().multiple:
+        return f"keycloak:{get_current_realm().name}:{kind}:"
+    return f"keycloak:{kind}:"
+
+
+class TTLCache:
+    """
+    Thread-safe in-process LRU cache whose entries expire at an absolute time.
+
+    An entry is fresh until the earlier of `now + ttl` and the `expires_at` given when it is set.
+    It then stays available as stale for `grace` more seconds, but never past `expires_at`.
+    When the cache is full, the least recently used entry is evicted.
+    Lookups are counted in the metrics sink under `name`.
+    """
+
+    def __init__(
+        self,
+        max_size: int,
+        ttl: float,
+        grace: float = 0,
+        name: str = "default",
+        metrics: Optional[MetricsSink] = None,
+    ):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.grace = grace
+        self.name = name
+        self.metrics = metrics or NullSink()
+
+        self._entries: "OrderedDict[str, tuple[Any, float, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_size > 0 and self.ttl > 0
+
+    def get(self, key: str) -> Optional[Any]:
+        entry = self.get_entry(key, allow_stale=False)
+        return entry[0] if entry is not None else None
+
+    def get_entry(self, key: str, allow_stale: bool = True) -> Optional[Tuple[Any, bool]]:
+        """
+        Get a value and whether it is stale.
+        """
+
+        entry = self._get_entry(key, allow_stale)
+        if self.metrics.enabled:
+            result = "miss" if entry is None else "stale" if entry[1] else "hit"
+            self.metrics.increment(
+                "keycloak_cache_requests_total",
+                tags={"cache": self.name, "result": result},
+            )
+        return entry
+
+    def _get_entry(self, key: str, allow_stale: bool) -> Optional[Tuple[Any, bool]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            value, fresh_until, stale_until = entry
+            now = time.time()
+            if stale_until <= now:
+                del self._entries[key]
+                self.misses += 1
+                return None
+
+            stale = fresh_until <= now
+            if stale and not allow_stale:
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            if stale:
+                self.stale_hits += 1
+            else:
+                self.hits += 1
+            return value, stale
+
+    def set(self, key: str, value: Any, expires_at: Optional[float] = None):
+        now = time.time()
+        expires_at = expires_at or float("inf")
+        fresh_until = min(now + self.ttl, expires_at)
+        stale_until = min(fresh_until + self.grace, expires_at)
+        if stale_until <= now:
+            return
+
+        with self._lock:
+            self._entries[key] = (value, fresh_until, stale_until)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key: str):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "stale_hits": self.stale_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+class SharedCache:
+    """
+    Cache shared by all processes, backed by a Django cache alias (Redis, Memcached, database, ...).
+
+    Values must be picklable. Errors of the backend are logged and treated as misses,
+    so an unavailable cache server never fails a request.
+    """
+
+    def __init__(
+        self,
+        alias: str,
+        ttl: float,
+        key_prefix: str,
+        name: str = "shared",
+        metrics: Optional[MetricsSink] = None,
+    ):
+        self.alias = alias
+        self.ttl = ttl
+        self.key_prefix = key_prefix
+        self.name = name
+        self.metrics = metrics or NullSink()
+
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+
+    @property
+    def backend(self):
+        return caches[self.alias]
+
+    def get(self, key: str) -> Optional[Any]:
+        try:
+            value = self.backend.get(self.key_prefix + key)
+        except Exception:
+            logger.warning("Failed to read from cache %r", self.alias, exc_info=True)
+            self.errors += 1
+            value = None
+
+        self._count(value)
+        return value
+
+    def set(self, key: str, value: Any, expires_at: Optional[float] = None):
+        timeout = min(self.ttl, (expires_at or float("inf")) - time.time())
+        if timeout <= 0:
+            return
+
+        try:
+            self.backend.set(self.key_prefix + key, value, timeout=math.ceil(timeout))
+        except Exception:
+            logger.warning("Failed to write to cache %r", self.alias, exc_info=True)
+            self.errors += 1
+
+    async def aget(self, key: str) -> Optional[Any]:
+        try:
+            value = await self.backend.aget(self.key_prefix + key)
+        except Exception:
+            logger.warning("Failed to read from cache %r", self.alias, exc_info=True)
+            self.errors += 1
+            value = None
+
+        self._count(value)
+        return value
+
+    async def aset(self, key: str, value: Any, expires_at: Optional[float] = None):
+        timeout = min(self.ttl, (expires_at or float("inf")) - time.time())
+        if timeout <= 0:
+            return
+
+        try:
+            await self.backend.aset(
+                self.key_prefix + key, value, timeout=math.ceil(timeout)
+            )
+        except Exception:
+            logger.warning("Failed to write to cache %r", self.alias, exc_info=True)
+            self.errors += 1
+
+    def delete(self, key: str):
+        try:
+            self.backend.delete(self.key_prefix + key)
+        except Exception:
+            logger.warning("Failed to delete from cache %r", self.alias, exc_info=True)
+            self.errors += 1
+
+    def _count(self, value: Optional[Any]):
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+
+        if self.metrics.enabled:
+            self.metrics.increment(
+                "keycloak_cache_requests_total",
+                tags={"cache": self.name, "result": "miss" if value is None else "hit"},
+            )
+
+    def stats(self) -> dict:
+        return {
+            "alias": self.alias,
+            "hits": self.hits,
+            "misses": self.misses,
+            "errors": self.errors,
+        }
+
+
+@realm_cache
+def get_token_cache() -> TTLCache:
+    """
+    Get the cache of authenticated users of the current realm, keyed by access token hash.
+    """
+
+    realm_settings = get_settings()
+    return TTLCache(
+        max_size=realm_settings.KEYCLOAK_TOKEN_CACHE_MAX_SIZE,
+        ttl=realm_settings.KEYCLOAK_TOKEN_CACHE_TTL,
+        grace=realm_settings.KEYCLOAK_TOKEN_CACHE_GRACE,
+        name="token",
+        metrics=get_metrics(),
+    )
+
+
+@realm_cache
+def get_shared_token_cache() -> Optional[SharedCache]:
+    """
+    Get the cache of validated token claims of the current realm shared between nodes,
+    None if not configured.
+    """
+
+    realm_settings = get_settings()
+    alias = realm_settings.KEYCLOAK_TOKEN_CACHE_ALIAS
+    ttl = realm_settings.KEYCLOAK_TOKEN_CACHE_TTL
+    if not alias or ttl <= 0:
+        return None
+
+    return SharedCache(
+        alias=alias,
+        ttl=ttl,
+        key_prefix=get_key_prefix("token"),
+        name="shared_token",
+        metrics=get_metrics(),
+    )
@@ -0,0 +1,241 @@
+"""
+Settings of the package.
+
+Every KEYCLOAK_* setting is resolved on first access and then cached: from the Django settings if defined there,
+otherwise from the environment (the .env file is loaded at that point), otherwise from its default.
+Nothing is read when the package is imported.
+
+    from django_drf_keycloak_auth.conf import keycloak_settings
+
+    if keycloak_settings.KEYCLOAK_AUTH_MODE == "introspect":
+        ...
+"""
+
+import json
+import os
+import threading
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+
+def _parse_str(value: Any) -> str:
+    return str(value).strip()
+
+
+def _parse_lower(value: Any) -> str:
+    return str(value).strip().lower()
+
+
+def _parse_bool(value: Any) -> bool:
+    if isinstance(value, bool):
+        return value
+    return str(value).strip().lower() in ("1", "true", "yes", "on")
+
+
+def _parse_list(value: Any) -> List[str]:
+    # "a, b" -> ["a", "b"]
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return list(value)
+    return [item.strip() for item in str(value).split(",") if item.strip()]
+
+
+def _parse_dict(value: Any) -> Dict[str, float]:
+    # "key1=1.5,key2=3" -> {"key1": 1.5, "key2": 3.0}
+    if isinstance(value, dict):
+        return {key: float(item) for key, item in value.items()}
+    items = [item.split("=", 1) for item in str(value).split(",") if "=" in item]
+    return {key.strip(): float(item) for key, item in items}
+
+
+def _parse_realms(value: Any) -> Dict[str, dict]:
+    # JSON object in the environment, e.g. '{"acme": {"SERVER_URL": "...", "REALM": "acme"}}'
+    if isinstance(value, dict):
+        return value
+    return json.loads(value)
+
+
+def _default_issuer(settings: "KeycloakSettings") -> Optional[str]:
+    server_url = settings.KEYCLOAK_SERVER_URL
+    realm = settings.KEYCLOAK_REALM
+    return f"{server_url.rstrip('/')}/realms/{realm}" if server_url and realm else None
+
+
+# Name: (parser, default). A callable default is computed from the other settings.
+SETTINGS: Dict[str, Tuple[Callable[[Any], Any], Any]] = {
+    "KEYCLOAK_SERVER_URL": (_parse_str, None),
+    "KEYCLOAK_REALM": (_parse_str, None),
+    "KEYCLOAK_CLIENT_ID": (_parse_str, None),
+    "KEYCLOAK_CLIENT_SECRET": (_parse_str, None),
+    # Realms served besides (or instead of) the one above, by name. Each realm overrides any of these settings,
+    # given without the KEYCLOAK_ prefix. See django_drf_keycloak_auth.realms.
+    "KEYCLOAK_REALMS": (_parse_realms, {}),
+    # Realm used when none is selected: "default" (the realm above) when KEYCLOAK_REALM is set,
+    # otherwise the only realm of KEYCLOAK_REALMS
+    "KEYCLOAK_DEFAULT_REALM": (_parse_str, None),
+    # How access tokens are validated by KeycloakAuthentication:
+    # - "local": verify the signature and claims against the realm's public keys (no round trip)
+    # - "introspect": call the introspection and userinfo endpoints on every request
+    "KEYCLOAK_AUTH_MODE": (_parse_lower, "introspect"),
+    # Expected issuer, defaults to "<server_url>/realms/<realm>"
+    "KEYCLOAK_ISSUER": (_parse_str, _default_issuer),
+    # Comma separated list of accepted audiences. The "aud" claim is not checked when empty.
+    "KEYCLOAK_AUDIENCE": (_parse_list, []),
+    # Whether the "azp" claim must be the configured client id. Off by default, as introspection
+    # accepts the tokens issued to the other clients of the realm.
+    "KEYCLOAK_VERIFY_AZP": (_parse_bool, False),
+    # Accepted signature algorithms and clock skew (seconds) for "exp" and "nbf"
+    "KEYCLOAK_JWT_ALGORITHMS": (_parse_list, ["RS256"]),
+    "KEYCLOAK_JWT_LEEWAY": (int, 60),
+    # Whether GenerateTokenView and CallbackView build "userinfo" from the verified id_token instead of
+    # calling the userinfo endpoint. The endpoint is still called when one of KEYCLOAK_USERINFO_REQUIRED_CLAIMS
+    # (comma separated) is missing from the id_token.
+    "KEYCLOAK_USERINFO_FROM_ID_TOKEN": (_parse_bool, False),
+    "KEYCLOAK_USERINFO_REQUIRED_CLAIMS": (_parse_list, []),
+    # Lifetime (seconds) of the fetched realm keys and discovery document, and the minimum interval (seconds)
+    # between two fetches triggered by an unknown "kid"
+    "KEYCLOAK_JWKS_TTL": (float, 3600.0),
+    "KEYCLOAK_JWKS_MIN_REFRESH_INTERVAL": (float, 10.0),
+    # File where the realm keys and discovery document are saved after each fetch. New processes load it at startup,
+    # serve from it right away and revalidate it in the background.
+    "KEYCLOAK_SNAPSHOT_PATH": (_parse_str, None),
+    # Warm up the client, the connection pool, the discovery document and the realm keys in the background when
+    # Django starts (requires "django_drf_keycloak_auth" in INSTALLED_APPS), opening KEYCLOAK_WARMUP_CONNECTIONS
+    # connections per realm
+    "KEYCLOAK_WARMUP": (_parse_bool, False),
+    "KEYCLOAK_WARMUP_CONNECTIONS": (int, 1),
+    # Seconds before a failed warm-up starts again, doubled after every failure up to the max (0 does not retry)
+    "KEYCLOAK_WARMUP_RETRY_INTERVAL": (float, 5.0),
+    "KEYCLOAK_WARMUP_MAX_RETRY_INTERVAL": (float, 300.0),
+    # In-process cache of authenticated users.
+    # Entries live for at most KEYCLOAK_TOKEN_CACHE_TTL seconds (0 disables the cache) and never past the token's "exp".
+    "KEYCLOAK_TOKEN_CACHE_TTL": (float, 0.0),
+    "KEYCLOAK_TOKEN_CACHE_MAX_SIZE": (int, 10000),
+    # Seconds a cached user is still served after KEYCLOAK_TOKEN_CACHE_TTL, while it is revalidated
+    # in the background or while Keycloak is unavailable. Never past the token's "exp".
+    "KEYCLOAK_TOKEN_CACHE_GRACE": (float, 0.0),
+    # Django cache alias (e.g. "default") used to share validated tokens between processes and nodes
+    "KEYCLOAK_TOKEN_CACHE_ALIAS": (_parse_str, None),
+    # Concurrent exchanges of the same refresh token are coalesced, and the result is kept KEYCLOAK_REFRESH_CACHE_TTL
+    # seconds (0 disables it) for callers arriving just after, in process and, with KEYCLOAK_REFRESH_CACHE_ALIAS,
+    # in a Django cache shared by all nodes. Off by default: a used refresh token gets the kept result again
+    "KEYCLOAK_REFRESH_CACHE_TTL": (float, 0.0),
+    "KEYCLOAK_REFRESH_CACHE_MAX_SIZE": (int, 10000),
+    "KEYCLOAK_REFRESH_CACHE_ALIAS": (_parse_str, None),
+    # Tokens exchanged for downstream services are kept at most KEYCLOAK_TOKEN_EXCHANGE_CACHE_TTL seconds (0 disables
+    # the cache) and until KEYCLOAK_TOKEN_EXCHANGE_EXPIRY_MARGIN seconds before they expire
+    "KEYCLOAK_TOKEN_EXCHANGE_CACHE_TTL": (float, 300.0),
+    "KEYCLOAK_TOKEN_EXCHANGE_CACHE_MAX_SIZE": (int, 10000),
+    "KEYCLOAK_TOKEN_EXCHANGE_EXPIRY_MARGIN": (float, 10.0),
+    # Service account tokens (client credentials) are refreshed in the background KEYCLOAK_SERVICE_TOKEN_REFRESH_MARGIN
+    # seconds before they expire
+    "KEYCLOAK_SERVICE_TOKEN_REFRESH_MARGIN": (float, 30.0),
+    # Django cache alias (e.g. "default") of the denylist of revoked tokens and logged out sessions,
+    # shared by all nodes. Tokens validated locally or from a cache are checked against it.
+    "KEYCLOAK_REVOCATION_CACHE_ALIAS": (_parse_str, None),
+    # Bulk revocation: maximum number of tokens per request, and of concurrent calls to Keycloak
+    "KEYCLOAK_BULK_REVOKE_MAX_TOKENS": (int, 100),
+    "KEYCLOAK_BULK_REVOKE_CONCURRENCY": (int, 20),
+    # Connection pool and timeouts (seconds) of the HTTP transport shared by all calls to Keycloak.
+    # KEYCLOAK_HTTP_TIMEOUTS overrides the timeout per operation, e.g. "introspect=2,userinfo=2".
+    "KEYCLOAK_HTTP_MAX_CONNECTIONS": (int, 100),
+    "KEYCLOAK_HTTP_MAX_KEEPALIVE_CONNECTIONS": (int, 20),
+    "KEYCLOAK_HTTP_KEEPALIVE_EXPIRY": (float, 30.0),
+    "KEYCLOAK_HTTP2": (_parse_bool, False),
+    "KEYCLOAK_HTTP_CONNECT_TIMEOUT": (float, 5.0),
+    "KEYCLOAK_HTTP_TIMEOUT": (float, 10.0),
+    "KEYCLOAK_HTTP_TIMEOUTS": (_parse_dict, {}),
+    # Circuit breaker of the calls to Keycloak: it opens when at least KEYCLOAK_CIRCUIT_BREAKER_ERROR_RATE
+    # of the last KEYCLOAK_CIRCUIT_BREAKER_WINDOW calls failed or took longer than KEYCLOAK_CIRCUIT_BREAKER_SLOW_CALL
+    # seconds, and lets a trial call through after KEYCLOAK_CIRCUIT_BREAKER_RESET_TIMEOUT seconds.
+    "KEYCLOAK_CIRCUIT_BREAKER": (_parse_bool, True),
+    "KEYCLOAK_CIRCUIT_BREAKER_WINDOW": (int, 20),
+    "KEYCLOAK_CIRCUIT_BREAKER_MIN_CALLS": (int, 10),
+    "KEYCLOAK_CIRCUIT_BREAKER_ERROR_RATE": (float, 0.5),
+    "KEYCLOAK_CIRCUIT_BREAKER_SLOW_CALL": (float, 5.0),
+    "KEYCLOAK_CIRCUIT_BREAKER_RESET_TIMEOUT": (float, 30.0),
+    # Metrics sink: "none" (default), "prometheus", "statsd" or the dotted path of a MetricsSink subclass.
+    # The StatsD server is KEYCLOAK_METRICS_STATSD_HOST:KEYCLOAK_METRICS_STATSD_PORT.
+    "KEYCLOAK_METRICS": (_parse_str, "none"),
+    "KEYCLOAK_METRICS_STATSD_HOST": (_parse_str, "localhost"),
+    "KEYCLOAK_METRICS_STATSD_PORT": (int, 8125),
+    "KEYCLOAK_METRICS_STATSD_PREFIX": (_parse_str, ""),
+}
+
+
+_dotenv_loaded = False
+_dotenv_lock = threading.Lock()
+
+
+def _load_dotenv():
+    global _dotenv_loaded
+
+    if _dotenv_loaded:
+        return
+    with _dotenv_lock:
+        if not _dotenv_loaded:
+            from dotenv import load_dotenv
+
+            load_dotenv()
+            _dotenv_loaded = True
+
+
+class KeycloakSettings:
+    """
+    Lazily resolved KEYCLOAK_* settings, see the module docstring.
+
+    A resolved value is stored on the instance, so later reads are plain attribute reads.
+    Objects built from the settings (transport, caches, ...) are built once, on first use.
+    """
+
+    def __getattr__(self, name: str) -> Any:
+        try:
+            parser, default = SETTINGS[name]
+        except KeyError:
+            raise AttributeError(f"Unknown Keycloak setting: {name}") from None
+
+        value = self.get_raw_value(name)
+        if value is None or value == "":
+            value = default(self) if callable(default) else default
+        else:
+            value = parser(value)
+
+        self.__dict__[name] = value
+        return value
+
+    @staticmethod
+    def get_raw_value(name: str) -> Any:
+        from django.conf import settings
+
+        if settings.configured and hasattr(settings, name):
+            return getattr(settings, name)
+
+        _load_dotenv()
+        return os.environ.get(name)
+
+    def reload(self):
+        """
+        Forget the resolved values, e.g. in tests after changing the settings.
+        """
+
+        for name in SETTINGS:
+            self.__dict__.pop(name, None)
+
+
+class RealmSettings(KeycloakSettings):
+    """
+    Settings of one realm of KEYCLOAK_REALMS: the realm's own values, then the package settings.
+    """
+
+    def __init__(self, overrides: Dict[str, Any], defaults: KeycloakSettings):
+        self.overrides = {
+            name if name.startswith("KEYCLOAK_") else f"KEYCLOAK_{name}": value
+            for name, value in overrides.items()
+        }
+        self.defaults = defaults
+
+    def get_raw_value(self, name: str) -> Any:
+        if name in self.overrides:
+            return self.overrides[name]
+        return self.defaults.get_raw_value(name)
+
+
+keycloak_settings = KeycloakSettings()
@@ -0,0 +1,621 @@
+"""
+Local Keycloak stand-in for tests, benchmarks and load tests.
+
+The emulator implements the endpoints used by this package (auth, token, introspect, userinfo,
+logout, revoke, certs and well-known discovery) for one realm and one confidential client,
+and issues RS256-signed JWTs. Latency and failures can be injected.
+
+It can be plugged in-process into the shared transport:
+
+    emulator = KeycloakEmulator()
+    emulator.add_user("alice", password="secret", roles=["admin"])
+    emulator.install()  # all calls of the package now go to the emulator
+
+or served on localhost for tools that need a real URL:
+
+    server_url = emulator.serve()  # e.g. "http://127.0.0.1:54321"
+    ...
+    emulator.stop()
+
+The package resolves its Keycloak configuration on first use, from the Django settings or the environment.
+Use `emulator.environ()` to get the matching KEYCLOAK_* variables, and call `keycloak_settings.reload()`
+when they change after the settings were first read, e.g. between tests.
+"""
+
+import asyncio
+import random
+import secrets
+import threading
+import time
+import uuid
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Iterable, List, Optional
+from urllib.parse import urlencode
+
+import httpx
+from jwcrypto import jwk, jwt
+
+
+class KeycloakEmulator:
+    """
+    In-process emulation of a Keycloak realm.
+    """
+
+    def __init__(
+        self,
+        server_url: str = "http://keycloak.local",
+        realm: str = "test",
+        client_id: str = "test-client",
+        client_secret: str = "test-secret",
+        access_token_lifespan: int = 300,
+        refresh_token_lifespan: int = 1800,
+        rotate_refresh_tokens: bool = False,
+        latency: float = 0,
+        failure_rate: float = 0,
+        key_size: int = 2048,
+    ):
+        self.server_url = server_url.rstrip("/")
+        self.realm = realm
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.access_token_lifespan = access_token_lifespan
+        self.refresh_token_lifespan = refresh_token_lifespan
+        # Refresh tokens can only be used once, like Keycloak's "Revoke Refresh Token" setting
+        self.rotate_refresh_tokens = rotate_refresh_tokens
+
+        # Seconds added to every response, and fraction of requests answered with a 503
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self._failures: List[int] = []
+
+        self.key = jwk.JWK.generate(
+            kty="RSA", size=key_size, kid=secrets.token_hex(8), alg="RS256"
+        )
+
+        self.users: Dict[str, dict] = {}
+        self.codes: Dict[str, dict] = {}
+        self.sessions: Dict[str, str] = {}
+        self.tokens: Dict[str, dict] = {}
+        self.revoked: set = set()
+        self.requests = Counter()
+        self._lock = threading.Lock()
+        self._server: Optional[ThreadingHTTPServer] = None
+
+    # Configuration
+
+    @property
+    def issuer(self) -> str:
+        return f"{self.server_url}/realms/{self.realm}"
+
+    def environ(self) -> Dict[str, str]:
+        """
+        Get the KEYCLOAK_* environment variables pointing the package at the emulator.
+        """
+
+        return {
+            "KEYCLOAK_SERVER_URL": self.server_url,
+            "KEYCLOAK_REALM": self.realm,
+            "KEYCLOAK_CLIENT_ID": self.client_id,
+            "KEYCLOAK_CLIENT_SECRET": self.client_secret,
+        }
+
+    def add_user(
+        self,
+        username: str,
+        password: Optional[str] = None,
+        roles: Iterable[str] = (),
+        client_roles: Optional[Dict[str, Iterable[str]]] = None,
+        **claims,
+    ) -> dict:
+        """
+        Add a user with realm roles, client roles ({"client-id": ["role", ...]}) and extra claims.
+        """
+
+        user = {
+            "password": password,
+            "claims": {
+                "sub": str(uuid.uuid5(uuid.NAMESPACE_URL, f"{self.issuer}/{username}")),
+                "preferred_username": username,
+                "email": f"{username}@example.com",
+                "email_verified": True,
+                "realm_access": {"roles": list(roles)},
+                "resource_access": {
+                    client: {"roles": list(names)}
+                    for client, names in (client_roles or {}).items()
+                },
+                **claims,
+            },
+        }
+        self.users[username] = user
+        return user
+
+    def fail_next(self, count: int = 1, status_code: int = 503):
+        """
+        Answer the next `count` requests with `status_code`.
+        """
+
+        with self._lock:
+            self._failures.extend([status_code] * count)
+
+    # Tokens
+
+    def sign(self, claims: dict) -> str:
+        token = jwt.JWT(
+            header={"alg": "RS256", "kid": self.key["kid"], "typ": "JWT"}, claims=claims
+        )
+        token.make_signed_token(self.key)
+        return token.serialize()
+
+    def issue_tokens(
+        self,
+        username: str,
+        nonce: Optional[str] = None,
+        scope: str = "openid profile email",
+        session_id: Optional[str] = None,
+    ) -> dict:
+        """
+        Log a user in and return the token response, as the token endpoint would.
+        """
+
+        user = self.users[username]
+        now = int(time.time())
+        session_id = session_id or str(uuid.uuid4())
+        self.sessions[session_id] = username
+
+        common = {
+            "iss": self.issuer,
+            "iat": now,
+            "auth_time": now,
+            "sub": user["claims"]["sub"],
+            "azp": self.client_id,
+            "sid": session_id,
+        }
+        profile = {
+            key: value
+            for key, value in user["claims"].items()
+            if key not in ("realm_access", "resource_access")
+        }
+
+        access_claims = {
+            **common,
+            **user["claims"],
+            "exp": now + self.access_token_lifespan,
+            "jti": str(uuid.uuid4()),
+            "typ": "Bearer",
+            "aud": "account",
+            "scope": scope,
+        }
+        id_claims = {
+            **common,
+            **profile,
+            "exp": now + self.access_token_lifespan,
+            "jti": str(uuid.uuid4()),
+            "typ": "ID",
+            "aud": self.client_id,
+        }
+        if nonce:
+            access_claims["nonce"] = nonce
+            id_claims["nonce"] = nonce
+        refresh_claims = {
+            **common,
+            "exp": now + self.refresh_token_lifespan,
+            "jti": str(uuid.uuid4()),
+            "typ": "Refresh",
+            "aud": self.issuer,
+            "scope": scope,
+        }
+
+        access_token = self.register(access_claims)
+        refresh_token = self.register(refresh_claims)
+
+        return {
+            "access_token": access_token,
+            "expires_in": self.access_token_lifespan,
+            "refresh_expires_in": self.refresh_token_lifespan,
+            "refresh_token": refresh_token,
+            "token_type": "Bearer",
+            "id_token": self.sign(id_claims),
+            "not-before-policy": 0,
+            "session_state": session_id,
+            "scope": scope,
+        }
+
+    def create_code(
+        self,
+        username: str,
+        redirect_uri: str,
+        nonce: Optional[str] = None,
+        scope: str = "openid profile email",
+    ) -> str:
+        """
+        Create an authorization code, as if the user had logged in on the auth endpoint.
+        """
+
+        code = secrets.token_urlsafe(24)
+        self.codes[code] = {
+            "username": username,
+            "nonce": nonce,
+            "redirect_uri": redirect_uri,
+            "scope": scope,
+        }
+        return code
+
+    def issue_access_token(self, claims: dict) -> str:
+        """
+        Issue an access token with arbitrary claims, filled with sensible defaults.
+        """
+
+        now = int(time.time())
+        return self.register(
+            {
+                "iss": self.issuer,
+                "iat": now,
+                "exp": now + self.access_token_lifespan,
+                "jti": str(uuid.uuid4()),
+                "typ": "Bearer",
+                "azp": self.client_id,
+                "aud": "account",
+                **claims,
+            }
+        )
+
+    def register(self, claims: dict) -> str:
+        """
+        Sign claims and remember the token, so that it can be introspected.
+        """
+
+        token = self.sign(claims)
+        self.tokens[token] = claims
+        return token
+
+    def get_active_claims(self, token: str, typ: Optional[str] = None) -> Optional[dict]:
+        """
+        Get the claims of a token issued by the emulator, None if it is unknown, expired or revoked.
+        """
+
+        claims = self.tokens.get(token)
+        if claims is None or (typ is not None and claims.get("typ") != typ):
+            return None
+        if claims["exp"] <= time.time() or claims["jti"] in self.revoked:
+            return None
+        if claims.get("sid") and claims["sid"] not in self.sessions:
+            return None
+        return claims
+
+    # HTTP
+
+    def handle(self, request: httpx.Request) -> httpx.Response:
+        """
+        Answer a request, for httpx.MockTransport.
+        """
+
+        failure = self._inject()
+        if self.latency:
+            time.sleep(self.latency)
+        return failure or self.dispatch(request)
+
+    async def a_handle(self, request: httpx.Request) -> httpx.Response:
+        """
+        Async version of `handle`, the latency does not block the event loop.
+        """
+
+        failure = self._inject()
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        await request.aread()
+        return failure or self.dispatch(request)
+
+    def transport(self) -> httpx.MockTransport:
+        return httpx.MockTransport(self.handle)
+
+    def async_transport(self) -> httpx.MockTransport:
+        return httpx.MockTransport(self.a_handle)
+
+    def install(self, keycloak_transport=None):
+        """
+        Send the calls of a KeycloakTransport (the shared one by default) to the emulator.
+        """
+
+        if keycloak_transport is None:
+            from django_drf_keycloak_auth.keycloak_utils import get_keycloak_transport
+
+            keycloak_transport = get_keycloak_transport()
+
+        keycloak_transport.transport = self.transport()
+        keycloak_transport.async_transport = self.async_transport()
+        keycloak_transport.close()
+        keycloak_transport._async_clients.clear()
+
+    def serve(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        """
+        Serve the emulator on localhost in a background thread and return its URL.
+        """
+
+        emulator = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # Headers and body are written separately, do not let delayed ACKs hold the body back
+            disable_nagle_algorithm = True
+
+            def _handle(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                request = httpx.Request(
+                    self.command,
+                    f"{emulator.server_url}{self.path}",
+                    headers=dict(self.headers),
+                    content=self.rfile.read(length) if length else b"",
+                )
+                response = emulator.handle(request)
+                body = response.content
+
+                self.send_response(response.status_code)
+                for name, value in response.headers.items():
+                    if name.lower() not in ("content-length", "transfer-encoding"):
+                        self.send_header(name, value)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            do_GET = do_POST = _handle
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        self.server_url = f"http://{host}:{self._server.server_address[1]}"
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self.server_url
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def dispatch(self, request: httpx.Request) -> httpx.Response:
+        prefix = f"/realms/{self.realm}/"
+        path = request.url.path
+        if not path.startswith(prefix):
+            return httpx.Response(404, json={"error": "Realm does not exist"})
+
+        endpoint = path[len(prefix) :].removeprefix("protocol/openid-connect/")
+        self.requests[endpoint] += 1
+
+        handler = self.ENDPOINTS.get((request.method, endpoint))
+        if handler is None:
+            return httpx.Response(404, json={"error": "unknown_endpoint"})
+
+        data = {}
+        if request.method == "POST":
+            data = dict(httpx.QueryParams(request.content.decode()))
+        return handler(self, request, data)
+
+    def _inject(self) -> Optional[httpx.Response]:
+        with self._lock:
+            status_code = self._failures.pop(0) if self._failures else None
+        if status_code is None and self.failure_rate and random.random() < self.failure_rate:
+            status_code = 503
+        if status_code is None:
+            return None
+        return httpx.Response(status_code, json={"error": "injected_failure"})
+
+    # Endpoints
+
+    def _well_known(self, request, data):
+        base = f"{self.issuer}/protocol/openid-connect"
+        return httpx.Response(
+            200,
+            json={
+                "issuer": self.issuer,
+                "authorization_endpoint": f"{base}/auth",
+                "token_endpoint": f"{base}/token",
+                "introspection_endpoint": f"{base}/token/introspect",
+                "userinfo_endpoint": f"{base}/userinfo",
+                "end_session_endpoint": f"{base}/logout",
+                "revocation_endpoint": f"{base}/revoke",
+                "jwks_uri": f"{base}/certs",
+                "grant_types_supported": [
+                    "authorization_code",
+                    "refresh_token",
+                    "password",
+                    "client_credentials",
+                    "urn:ietf:params:oauth:grant-type:token-exchange",
+                ],
+                "response_types_supported": ["code"],
+                "id_token_signing_alg_values_supported": ["RS256"],
+            },
+        )
+
+    def _certs(self, request, data):
+        return httpx.Response(200, json={"keys": [self.key.export_public(as_dict=True)]})
+
+    def _auth(self, request, data):
+        # There is no login form: the user named by "login_hint", or the first user, is logged in
+        params = request.url.params
+        username = params.get("login_hint") or next(iter(self.users), None)
+        if params.get("client_id") != self.client_id or username not in self.users:
+            return httpx.Response(400, json={"error": "invalid_request"})
+
+        code = self.create_code(
+            username,
+            params.get("redirect_uri"),
+            nonce=params.get("nonce"),
+            scope=params.get("scope") or "openid",
+        )
+        query = {"code": code, "session_state": str(uuid.uuid4())}
+        if params.get("state"):
+            query["state"] = params["state"]
+        return httpx.Response(
+            302, headers={"Location": f"{params.get('redirect_uri')}?{urlencode(query)}"}
+        )
+
+    def _token(self, request, data):
+        error = self._authenticate_client(data)
+        if error:
+            return error
+
+        grant_type = data.get("grant_type")
+        if grant_type == "authorization_code":
+            code = self.codes.pop(data.get("code", ""), None)
+            if code is None or code["redirect_uri"] != data.get("redirect_uri"):
+                return self._error("invalid_grant", "Code not valid")
+            return httpx.Response(
+                200,
+                json=self.issue_tokens(
+                    code["username"], nonce=code["nonce"], scope=code["scope"]
+                ),
+            )
+
+        if grant_type == "refresh_token":
+            claims = self.get_active_claims(data.get("refresh_token", ""), typ="Refresh")
+            if claims is None:
+                return self._error("invalid_grant", "Token is not active")
+            if self.rotate_refresh_tokens:
+                self.revoked.add(claims["jti"])
+            username = self.sessions[claims["sid"]]
+            return httpx.Response(
+                200,
+                json=self.issue_tokens(
+                    username, scope=claims["scope"], session_id=claims["sid"]
+                ),
+            )
+
+        if grant_type == "password":
+            user = self.users.get(data.get("username"))
+            if user is None or user["password"] != data.get("password"):
+                return self._error("invalid_grant", "Invalid user credentials", 401)
+            return httpx.Response(
+                200,
+                json=self.issue_tokens(data["username"], scope=data.get("scope") or "openid"),
+            )
+
+        if grant_type == "client_credentials":
+            now = int(time.time())
+            claims = {
+                "iss": self.issuer,
+                "iat": now,
+                "exp": now + self.access_token_lifespan,
+                "jti": str(uuid.uuid4()),
+                "typ": "Bearer",
+                "azp": self.client_id,
+                "aud": data.get("audience") or "account",
+                "sub": str(uuid.uuid5(uuid.NAMESPACE_URL, f"{self.issuer}/{self.client_id}")),
+                "preferred_username": f"service-account-{self.client_id}",
+                "scope": data.get("scope") or "profile email",
+            }
+            return httpx.Response(
+                200,
+                json={
+                    "access_token": self.register(claims),
+                    "expires_in": self.access_token_lifespan,
+                    "refresh_expires_in": 0,
+                    "token_type": "Bearer",
+                    "not-before-policy": 0,
+                    "scope": claims["scope"],
+                },
+            )
+
+        if grant_type == "urn:ietf:params:oauth:grant-type:token-exchange":
+            subject = self.get_active_claims(data.get("subject_token", ""), typ="Bearer")
+            if subject is None:
+                return self._error("invalid_token", "Subject token not active")
+            now = int(time.time())
+            claims = {
+                **subject,
+                "iat": now,
+                "exp": min(now + self.access_token_lifespan, subject["exp"]),
+                "jti": str(uuid.uuid4()),
+                "azp": self.client_id,
+                "aud": data.get("audience") or self.client_id,
+                "scope": data.get("scope") or subject.get("scope", ""),
+            }
+            return httpx.Response(
+                200,
+                json={
+                    "access_token": self.register(claims),
+                    "expires_in": claims["exp"] - now,
+                    "refresh_expires_in": 0,
+                    "token_type": "Bearer",
+                    "issued_token_type": "urn:ietf:params:oauth:token-type:access_token",
+                    "not-before-policy": 0,
+                    "scope": claims["scope"],
+                },
+            )
+
+        return self._error("unsupported_grant_type", "Unsupported grant_type")
+
+    def _introspect(self, request, data):
+        error = self._authenticate_client(data)
+        if error:
+            return error
+
+        claims = self.get_active_claims(data.get("token", ""))
+        if claims is None:
+            return httpx.Response(200, json={"active": False})
+        return httpx.Response(
+            200,
+            json={**claims, "client_id": claims.get("azp"), "active": True},
+        )
+
+    def _userinfo(self, request, data):
+        authorization = request.headers.get("Authorization", "")
+        token = authorization.split(" ", 1)[1] if " " in authorization else ""
+        claims = self.get_active_claims(token, typ="Bearer")
+        if claims is None:
+            return self._error("invalid_token", "Token verification failed", 401)
+
+        # Roles are included, like with the "roles" client scope mapped to userinfo
+        user = self.users.get(self.sessions.get(claims.get("sid"), ""))
+        return httpx.Response(200, json=user["claims"] if user else claims)
+
+    def _logout(self, request, data):
+        error = self._authenticate_client(data)
+        if error:
+            return error
+
+        claims = self.get_active_claims(data.get("refresh_token", ""), typ="Refresh")
+        if claims is None:
+            return self._error("invalid_grant", "Invalid refresh token")
+        self.sessions.pop(claims["sid"], None)
+        return httpx.Response(204)
+
+    def _revoke(self, request, data):
+        error = self._authenticate_client(data)
+        if error:
+            return error
+
+        claims = self.tokens.get(data.get("token", ""))
+        if claims is not None:
+            self.revoked.add(claims["jti"])
+            if claims.get("typ") == "Refresh":
+                self.sessions.pop(claims.get("sid"), None)
+        # Like Keycloak, unknown tokens are not an error
+        return httpx.Response(200)
+
+    def _authenticate_client(self, data: dict) -> Optional[httpx.Response]:
+        if data.get("client_id") != self.client_id or data.get(
+            "client_secret"
+        ) != self.client_secret:
+            return self._error("unauthorized_client", "Invalid client credentials", 401)
+        return None
+
+    @staticmethod
+    def _error(error: str, description: str, status_code: int = 400) -> httpx.Response:
+        return httpx.Response(
+            status_code, json={"error": error, "error_description": description}
+        )
+
+    ENDPOINTS = {
+        ("GET", ".well-known/openid-configuration"): _well_known,
+        ("GET", "certs"): _certs,
+        ("GET", "auth"): _auth,
+        ("POST", "token"): _token,
+        ("POST", "token/introspect"): _introspect,
+        ("GET", "userinfo"): _userinfo,
+        ("POST", "userinfo"): _userinfo,
+        ("POST", "logout"): _logout,
+        ("POST", "revoke"): _revoke,
+    }
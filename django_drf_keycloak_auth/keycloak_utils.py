@@ -1,23 +1,52 @@
-import os
+import base64
+import hmac
+import json
+import logging
+import threading
+import time
 from functools import cache
-from typing import Optional
-from urllib.parse import urljoin
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Optional
+from urllib.parse import urlencode, urljoin
 
-import httpx
 from django.conf import settings
 from django.http import HttpRequest
-from dotenv import load_dotenv
-from keycloak import KeycloakOpenID
-from keycloak.exceptions import KeycloakOperationError
-from rest_framework import status
-from rest_framework.exceptions import ValidationError
+from django.utils.module_loading import import_string
 
-load_dotenv()
+from django_drf_keycloak_auth.conf import keycloak_settings
+from django_drf_keycloak_auth.metrics import (
+    MetricsSink,
+    NullSink,
+    PrometheusSink,
+    StatsDSink,
+    TaggedSink,
+)
+from django_drf_keycloak_auth.realms import (
+    get_current_realm,
+    get_realm_registry,
+    get_settings,
+    realm_cache,
+)
+from django_drf_keycloak_auth.singleflight import SingleFlight
+from django_drf_keycloak_auth.snapshot import RealmSnapshot, expires_at, get_snapshot
 
-KEYCLOAK_SERVER_URL = os.getenv("KEYCLOAK_SERVER_URL")
-KEYCLOAK_REALM = os.getenv("KEYCLOAK_REALM")
-KEYCLOAK_CLIENT_ID = os.getenv("KEYCLOAK_CLIENT_ID")
-KEYCLOAK_CLIENT_SECRET = os.getenv("KEYCLOAK_CLIENT_SECRET")
+# keycloak (with requests), jwcrypto (with cryptography) and httpx are slow to import,
+# they are imported on first use so that importing the package stays cheap
+if TYPE_CHECKING:
+    from jwcrypto import jwk
+    from keycloak import KeycloakOpenID
+    from keycloak.exceptions import KeycloakOperationError
+
+    from django_drf_keycloak_auth.transport import KeycloakTransport
+
+logger = logging.getLogger(__name__)
+
+
+def __getattr__(name: str) -> Any:
+    # The KEYCLOAK_* settings used to be constants of this module, read from the environment at import.
+    # They are still available here, resolved on first access.
+    if name.startswith("KEYCLOAK_"):
+        return getattr(keycloak_settings, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 @cache
@@ -31,15 +60,606 @@ def get_keycloak_settings():
 
 
 @cache
-def get_keycloak_openid():
+def get_metrics_sink() -> MetricsSink:
+    """
+    Get the metrics sink selected by KEYCLOAK_METRICS, shared by all realms.
+    """
+
+    name = keycloak_settings.KEYCLOAK_METRICS.lower()
+    if name in ("", "none"):
+        return NullSink()
+    if name == "prometheus":
+        return PrometheusSink()
+    if name == "statsd":
+        return StatsDSink(
+            host=keycloak_settings.KEYCLOAK_METRICS_STATSD_HOST,
+            port=keycloak_settings.KEYCLOAK_METRICS_STATSD_PORT,
+            prefix=keycloak_settings.KEYCLOAK_METRICS_STATSD_PREFIX,
+        )
+    return import_string(keycloak_settings.KEYCLOAK_METRICS)()
+
+
+@realm_cache
+def get_metrics() -> MetricsSink:
+    """
+    Get the metrics sink of the current realm, which tags the metrics with the realm when several are served.
+    """
+
+    sink = get_metrics_sink()
+    if not sink.enabled or not get_realm_registry().multiple:
+        return sink
+    return TaggedSink(sink, {"realm": get_current_realm().name})
+
+
+@realm_cache
+def get_keycloak_transport() -> "KeycloakTransport":
+    """
+    Get the pooled HTTP transport shared by all calls to Keycloak of the current realm.
+    """
+
+    from django_drf_keycloak_auth.resilience import CircuitBreaker
+    from django_drf_keycloak_auth.transport import KeycloakTransport
+
+    realm_settings = get_settings()
+
+    return KeycloakTransport(
+        max_connections=realm_settings.KEYCLOAK_HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections=realm_settings.KEYCLOAK_HTTP_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=realm_settings.KEYCLOAK_HTTP_KEEPALIVE_EXPIRY,
+        http2=realm_settings.KEYCLOAK_HTTP2,
+        connect_timeout=realm_settings.KEYCLOAK_HTTP_CONNECT_TIMEOUT,
+        timeout=realm_settings.KEYCLOAK_HTTP_TIMEOUT,
+        operation_timeouts=realm_settings.KEYCLOAK_HTTP_TIMEOUTS,
+        metrics=get_metrics(),
+        breaker=(
+            CircuitBreaker(
+                window=realm_settings.KEYCLOAK_CIRCUIT_BREAKER_WINDOW,
+                min_calls=realm_settings.KEYCLOAK_CIRCUIT_BREAKER_MIN_CALLS,
+                error_rate=realm_settings.KEYCLOAK_CIRCUIT_BREAKER_ERROR_RATE,
+                slow_call_duration=realm_settings.KEYCLOAK_CIRCUIT_BREAKER_SLOW_CALL,
+                reset_timeout=realm_settings.KEYCLOAK_CIRCUIT_BREAKER_RESET_TIMEOUT,
+            )
+            if realm_settings.KEYCLOAK_CIRCUIT_BREAKER
+            else None
+        ),
+    )
+
+
+def get_openid_connect_url(endpoint: str) -> str:
+    """
+    Get the URL of an OpenID Connect endpoint of the realm, such as "token" or "revoke".
+    """
+
+    realm_settings = get_settings()
+
+    return urljoin(
+        realm_settings.KEYCLOAK_SERVER_URL.rstrip("/"),
+        f"/realms/{realm_settings.KEYCLOAK_REALM}/protocol/openid-connect/{endpoint}",
+    )
+
+
+def get_well_known_url() -> str:
+    """
+    Get the URL of the OpenID Connect discovery document of the realm.
+    """
+
+    realm_settings = get_settings()
+
+    return urljoin(
+        realm_settings.KEYCLOAK_SERVER_URL.rstrip("/"),
+        f"/realms/{realm_settings.KEYCLOAK_REALM}/.well-known/openid-configuration",
+    )
+
+
+def revalidate_in_background(name: str, fn: Callable[[], Any]):
+    """
+    Run `fn` on the background thread pool, logging its errors.
+    """
+
+    from django_drf_keycloak_auth.resilience import run_in_background
+
+    def revalidate():
+        try:
+            fn()
+        except Exception:
+            logger.warning("Failed to revalidate the %s", name, exc_info=True)
+
+    run_in_background(revalidate)
+
+
+@realm_cache
+def get_keycloak_openid() -> "KeycloakOpenID":
+    from keycloak import KeycloakOpenID
+
+    realm_settings = get_settings()
+
     return KeycloakOpenID(
-        server_url=KEYCLOAK_SERVER_URL,
-        realm_name=KEYCLOAK_REALM,
-        client_id=KEYCLOAK_CLIENT_ID,
-        client_secret_key=KEYCLOAK_CLIENT_SECRET,
+        server_url=realm_settings.KEYCLOAK_SERVER_URL,
+        realm_name=realm_settings.KEYCLOAK_REALM,
+        client_id=realm_settings.KEYCLOAK_CLIENT_ID,
+        client_secret_key=realm_settings.KEYCLOAK_CLIENT_SECRET,
     )
 
 
+class JWKSManager:
+    """
+    Process wide store of the realm signing keys, indexed by "kid".
+
+    The key set is fetched once and only fetched again when the TTL runs out or an unknown "kid" shows up.
+    Concurrent callers share a single in-flight fetch, and fetches for unknown "kid"s are
+    limited to one per `min_refresh_interval` seconds.
+    With a `snapshot`, every fetched key set that changed (or whose saved copy is half a TTL old)
+    is saved to it, and `load_snapshot` starts from the saved one until it expires.
+    """
+
+    def __init__(
+        self,
+        fetch_certs: Callable[[], dict],
+        ttl: float = 3600,
+        min_refresh_interval: float = 10,
+        snapshot: Optional[RealmSnapshot] = None,
+    ):
+        self.fetch_certs = fetch_certs
+        self.ttl = ttl
+        self.min_refresh_interval = min_refresh_interval
+        self.snapshot = snapshot
+
+        self._certs: Optional[dict] = None
+        self._keys: Dict[str, "jwk.JWK"] = {}
+        self._expires_at = 0.0
+        self._last_fetch_at: Optional[float] = None
+        # When the key set was last saved to the snapshot (time.time())
+        self._saved_at = 0.0
+        # Whether the last fetch failed, e.g. because Keycloak could not be reached
+        self._last_fetch_failed = False
+        self._lock = threading.Lock()
+        self._inflight: Optional[threading.Event] = None
+
+    def get_key(self, kid: Optional[str]) -> "jwk.JWK":
+        """
+        Get the public key for `kid`.
+
+        return:
+        - The public key
+        - raise LookupError if the realm has no such key
+        - raise KeycloakUnavailableError (or the error of the fetch) if the key set can not be fetched
+        """
+
+        key = self._lookup(kid)
+        now = time.monotonic()
+
+        if key is not None and now < self._expires_at:
+            return key
+
+        # Do not fetch again right after a fetch, so bogus "kid"s can not stampede Keycloak
+        if (
+            self._last_fetch_at is not None
+            and now - self._last_fetch_at < self.min_refresh_interval
+        ):
+            if key is None:
+                self._raise_missing(kid)
+            return key
+
+        try:
+            self.refresh()
+        except Exception:
+            # Keep serving the known keys while Keycloak can not be reached
+            if key is None:
+                raise
+            logger.warning("Failed to refresh the realm keys", exc_info=True)
+            return key
+
+        key = self._lookup(kid)
+        if key is None:
+            # The fetch of another caller may have failed
+            self._raise_missing(kid)
+        return key
+
+    def _raise_missing(self, kid: Optional[str]):
+        if self._last_fetch_failed:
+            from django_drf_keycloak_auth.resilience import KeycloakUnavailableError
+
+            raise KeycloakUnavailableError()
+        raise LookupError(f"Unknown signing key: {kid}")
+
+    def has_key(self, kid: Optional[str]) -> bool:
+        """
+        Whether the key for `kid` can be returned without fetching the key set.
+        """
+
+        return self._lookup(kid) is not None and time.monotonic() < self._expires_at
+
+    @property
+    def key_ids(self) -> List[Optional[str]]:
+        """
+        The "kid"s of the known signing keys.
+        """
+
+        return list(self._keys)
+
+    def refresh(self):
+        """
+        Fetch the key set from Keycloak, or wait for the fetch already in flight.
+        """
+
+        with self._lock:
+            event = self._inflight
+            leader = event is None
+            if leader:
+                event = self._inflight = threading.Event()
+
+        if not leader:
+            event.wait()
+            return
+
+        try:
+            try:
+                certs = self.fetch_certs()
+            except Exception:
+                self._last_fetch_failed = True
+                raise
+            self._last_fetch_failed = False
+            self._keys = self.parse_certs(certs)
+            self._expires_at = time.monotonic() + self.ttl
+            if self.snapshot is not None and (
+                certs != self._certs or time.time() - self._saved_at >= self.ttl / 2
+            ):
+                self.snapshot.save("certs", certs)
+                self._saved_at = time.time()
+            self._certs = certs
+        finally:
+            self._last_fetch_at = time.monotonic()
+            with self._lock:
+                self._inflight = None
+            event.set()
+
+    def load_snapshot(self) -> bool:
+        """
+        Start from the key set of the snapshot. Its keys are served until the next refresh,
+        and past their expiry only while the key set can not be fetched.
+
+        return:
+        - Whether a key set was loaded
+        """
+
+        if self.snapshot is None:
+            return False
+        certs, saved_at = self.snapshot.load("certs")
+        if not certs:
+            return False
+
+        try:
+            self._keys = self.parse_certs(certs)
+        except Exception:
+            logger.warning("Ignoring the realm keys of the snapshot", exc_info=True)
+            return False
+        self._certs = certs
+        self._saved_at = saved_at
+        self._expires_at = expires_at(saved_at, self.ttl)
+        return True
+
+    @staticmethod
+    def parse_certs(certs: dict) -> Dict[str, "jwk.JWK"]:
+        """
+        Build the signing keys of a JWKS document, indexed by "kid".
+        """
+
+        from jwcrypto import jwk
+
+        keys = {}
+        for data in certs.get("keys", []):
+            if data.get("use", "sig") != "sig":
+                continue
+            key = jwk.JWK(**data)
+            # Build the underlying public key object now instead of on first verification
+            key.get_op_key("verify")
+            keys[data.get("kid")] = key
+        return keys
+
+    def _lookup(self, kid: Optional[str]) -> Optional["jwk.JWK"]:
+        keys = self._keys
+        if kid is None and len(keys) == 1:
+            return next(iter(keys.values()))
+        return keys.get(kid)
+
+
+@realm_cache
+def get_jwks() -> JWKSManager:
+    realm = get_current_realm()
+    realm_settings = realm.settings
+
+    jwks = JWKSManager(
+        fetch_certs=realm.bind(get_certs),
+        ttl=realm_settings.KEYCLOAK_JWKS_TTL,
+        min_refresh_interval=realm_settings.KEYCLOAK_JWKS_MIN_REFRESH_INTERVAL,
+        snapshot=get_snapshot(),
+    )
+    if jwks.load_snapshot():
+        revalidate_in_background("realm keys", jwks.refresh)
+    return jwks
+
+
+class WellKnownManager:
+    """
+    Process wide copy of the realm discovery document.
+
+    The document is fetched once and fetched again when the TTL runs out, by a single caller at a time.
+    The known document is still served while Keycloak can not be reached.
+    With a `snapshot`, every fetched document that changed (or whose saved copy is half a TTL old)
+    is saved to it, and `load_snapshot` starts from the saved one until it expires.
+    """
+
+    def __init__(
+        self,
+        fetch_well_known: Callable[[], dict],
+        ttl: float = 3600,
+        snapshot: Optional[RealmSnapshot] = None,
+    ):
+        self.fetch_well_known = fetch_well_known
+        self.ttl = ttl
+        self.snapshot = snapshot
+
+        self._document: Optional[dict] = None
+        self._expires_at = 0.0
+        # When the document was last saved to the snapshot (time.time())
+        self._saved_at = 0.0
+        self._flight = SingleFlight()
+
+    def get(self) -> dict:
+        document = self._document
+        if document is not None and time.monotonic() < self._expires_at:
+            return document
+
+        try:
+            return self._flight.do("well_known", self.refresh)
+        except Exception:
+            if document is None:
+                raise
+            logger.warning("Failed to refresh the discovery document", exc_info=True)
+            return document
+
+    def refresh(self) -> dict:
+        document = self.fetch_well_known()
+        if self.snapshot is not None and (
+            document != self._document or time.time() - self._saved_at >= self.ttl / 2
+        ):
+            self.snapshot.save("well_known", document)
+            self._saved_at = time.time()
+        self._document = document
+        self._expires_at = time.monotonic() + self.ttl
+        return document
+
+    def load_snapshot(self) -> bool:
+        """
+        Start from the document of the snapshot. It is served until the next refresh,
+        and past its expiry only while the document can not be fetched.
+
+        return:
+        - Whether a document was loaded
+        """
+
+        if self.snapshot is None:
+            return False
+        document, saved_at = self.snapshot.load("well_known")
+        if not document:
+            return False
+
+        self._document = document
+        self._saved_at = saved_at
+        self._expires_at = expires_at(saved_at, self.ttl)
+        return True
+
+
+@realm_cache
+def get_discovery() -> WellKnownManager:
+    discovery = WellKnownManager(
+        fetch_well_known=get_current_realm().bind(get_well_known),
+        ttl=get_settings().KEYCLOAK_JWKS_TTL,
+        snapshot=get_snapshot(),
+    )
+    if discovery.load_snapshot():
+        revalidate_in_background("discovery document", discovery.refresh)
+    return discovery
+
+
+def get_authorization_url(redirect_uri: str, scope: str, state: str, nonce: str) -> str:
+    """
+    Get the URL of the authorization endpoint that starts the authorization code flow.
+    """
+
+    realm_settings = get_settings()
+
+    params = {
+        "client_id": realm_settings.KEYCLOAK_CLIENT_ID,
+        "response_type": "code",
+        "redirect_uri": redirect_uri,
+        "scope": scope,
+        "state": state,
+        "nonce": nonce,
+    }
+    return f"{get_discovery().get()['authorization_endpoint']}?{urlencode(params)}"
+
+
+def _decode_segment(segment: str) -> dict:
+    return json.loads(base64.urlsafe_b64decode(segment + "=" * (-len(segment) % 4)))
+
+
+def get_token_header(token: str) -> dict:
+    """
+    Get the unverified JOSE header of a JWT.
+    """
+
+    return _decode_segment(token.split(".", 1)[0])
+
+
+def get_token_payload(token: str) -> dict:
+    """
+    Get the unverified claims of a JWT.
+    """
+
+    return _decode_segment(token.split(".", 2)[1])
+
+
+def decode_access_token(access_token: str) -> dict:
+    """
+    Verify an access token locally against the realm's public keys.
+
+    The signature, "exp", "nbf", "iss", "typ" and, when configured, "aud" and "azp" are checked.
+
+    return:
+    - The claims of the token if valid
+    - raise an exception if invalid
+    """
+
+    realm_settings = get_settings()
+
+    keycloak_openid = get_keycloak_openid()
+    key = get_jwks().get_key(get_token_header(access_token).get("kid"))
+
+    claims: dict = keycloak_openid.decode_token(
+        access_token,
+        key=key,
+        algs=realm_settings.KEYCLOAK_JWT_ALGORITHMS,
+        check_claims={
+            "iss": realm_settings.KEYCLOAK_ISSUER,
+            "exp": None,
+            "typ": "Bearer",
+        },
+        leeway=realm_settings.KEYCLOAK_JWT_LEEWAY,
+    )
+
+    # "nbf" is optional in Keycloak tokens, so it is only checked when present
+    nbf = claims.get("nbf")
+    if nbf and nbf > time.time() + realm_settings.KEYCLOAK_JWT_LEEWAY:
+        raise ValueError("Token is not yet valid")
+
+    if realm_settings.KEYCLOAK_AUDIENCE:
+        aud = claims.get("aud") or []
+        audiences = {aud} if isinstance(aud, str) else set(aud)
+        if audiences.isdisjoint(realm_settings.KEYCLOAK_AUDIENCE):
+            raise ValueError("Invalid token audience")
+
+    if (
+        realm_settings.KEYCLOAK_VERIFY_AZP
+        and claims.get("azp") != realm_settings.KEYCLOAK_CLIENT_ID
+    ):
+        raise ValueError("Invalid token authorized party")
+
+    return claims
+
+
+class InvalidNonceError(ValueError):
+    """
+    The nonce of an id_token is not the one sent with the authorization request,
+    or the id_token it must be checked against can not be verified.
+    """
+
+
+# Claims of an id_token that describe the token rather than the user
+ID_TOKEN_PROTOCOL_CLAIMS = frozenset(
+    {
+        "iss",
+        "aud",
+        "exp",
+        "iat",
+        "nbf",
+        "auth_time",
+        "jti",
+        "typ",
+        "azp",
+        "nonce",
+        "sid",
+        "session_state",
+        "at_hash",
+        "c_hash",
+        "acr",
+    }
+)
+
+
+def decode_id_token(id_token: str, nonce: Optional[str] = None) -> dict:
+    """
+    Verify an id_token locally against the realm's public keys.
+
+    The signature, "exp", "iss", "typ", "aud" (the client id) and, when given, "nonce" are checked.
+
+    return:
+    - The claims of the token if valid
+    - raise InvalidNonceError if the nonce does not match
+    - raise an exception if invalid
+    """
+
+    realm_settings = get_settings()
+
+    keycloak_openid = get_keycloak_openid()
+    key = get_jwks().get_key(get_token_header(id_token).get("kid"))
+
+    claims: dict = keycloak_openid.decode_token(
+        id_token,
+        key=key,
+        algs=realm_settings.KEYCLOAK_JWT_ALGORITHMS,
+        check_claims={
+            "iss": realm_settings.KEYCLOAK_ISSUER,
+            "exp": None,
+            "typ": "ID",
+            "aud": realm_settings.KEYCLOAK_CLIENT_ID,
+        },
+        leeway=realm_settings.KEYCLOAK_JWT_LEEWAY,
+    )
+
+    # Compared as bytes, compare_digest rejects non ASCII str
+    if nonce is not None and not hmac.compare_digest(
+        str(claims.get("nonce", "")).encode(), nonce.encode()
+    ):
+        raise InvalidNonceError("Invalid id_token nonce")
+
+    return claims
+
+
+def get_login_userinfo(token: dict, nonce: Optional[str] = None) -> dict:
+    """
+    Get the userinfo of the user who just got `token` from the token endpoint.
+
+    With KEYCLOAK_USERINFO_FROM_ID_TOKEN, the claims of the verified id_token are used and the userinfo
+    endpoint is only called when the id_token lacks one of KEYCLOAK_USERINFO_REQUIRED_CLAIMS,
+    or when it is unusable and no nonce was given.
+
+    return:
+    - The userinfo claims, {} if they can not be fetched
+    - raise InvalidNonceError if a nonce was given and the id_token is missing, invalid or has another nonce
+    """
+
+    realm_settings = get_settings()
+
+    id_token = token.get("id_token")
+    if realm_settings.KEYCLOAK_USERINFO_FROM_ID_TOKEN and (id_token or nonce is not None):
+        try:
+            if not id_token:
+                raise InvalidNonceError("Missing id_token")
+            claims = decode_id_token(id_token, nonce)
+        except InvalidNonceError:
+            raise
+        except Exception:
+            logger.warning("Failed to decode the id_token", exc_info=True)
+            # The nonce can not be checked, do not fall back to the userinfo endpoint
+            if nonce is not None:
+                raise InvalidNonceError("Invalid id_token")
+            claims = None
+
+        required_claims = realm_settings.KEYCLOAK_USERINFO_REQUIRED_CLAIMS
+        if claims is not None and all(claim in claims for claim in required_claims):
+            return {
+                name: value
+                for name, value in claims.items()
+                if name not in ID_TOKEN_PROTOCOL_CLAIMS
+            }
+
+    try:
+        return get_userinfo(token.get("access_token"))
+    except Exception:
+        return {}
+
+
 def get_access_token_from_header(request: HttpRequest) -> Optional[str]:
 
     # Get request header of [Authorization: Bearer <token>]
@@ -50,7 +670,7 @@ def get_access_token_from_header(request: HttpRequest) -> Optional[str]:
     return auth.split(" ", 1)[1].strip()
 
 
-def get_keycloak_error_description(error: KeycloakOperationError) -> str:
+def get_keycloak_error_description(error: "KeycloakOperationError") -> str:
 
     error_message = error.error_message
 
@@ -64,6 +684,233 @@ def get_keycloak_error_description(error: KeycloakOperationError) -> str:
         return error_message
 
 
+def introspect_token(token: str) -> dict:
+    """
+    Introspect a token.
+
+    return:
+    - The introspection result, with "active" set to False if the token is not valid
+    - raise KeycloakPostError if failed
+    """
+
+    from keycloak.exceptions import KeycloakPostError, raise_error_from_response
+
+    response = get_keycloak_transport().request(
+        "introspect",
+        "POST",
+        get_openid_connect_url("token/introspect"),
+        data=_with_client_credentials({"token": token}),
+    )
+
+    return raise_error_from_response(response, KeycloakPostError)
+
+
+async def a_introspect_token(token: str) -> dict:
+    """
+    Async version of `introspect_token`.
+    """
+
+    from keycloak.exceptions import KeycloakPostError, raise_error_from_response
+
+    response = await get_keycloak_transport().a_request(
+        "introspect",
+        "POST",
+        get_openid_connect_url("token/introspect"),
+        data=_with_client_credentials({"token": token}),
+    )
+
+    return raise_error_from_response(response, KeycloakPostError)
+
+
+def get_userinfo(access_token: str) -> dict:
+    """
+    Get the claims of the user from the userinfo endpoint.
+
+    return:
+    - The userinfo claims
+    - raise KeycloakGetError if failed
+    """
+
+    from keycloak.exceptions import KeycloakGetError, raise_error_from_response
+
+    response = get_keycloak_transport().request(
+        "userinfo",
+        "GET",
+        get_openid_connect_url("userinfo"),
+        headers={"Authorization": f"Bearer {access_token}"},
+    )
+
+    return raise_error_from_response(response, KeycloakGetError)
+
+
+async def a_get_userinfo(access_token: str) -> dict:
+    """
+    Async version of `get_userinfo`.
+    """
+
+    from keycloak.exceptions import KeycloakGetError, raise_error_from_response
+
+    response = await get_keycloak_transport().a_request(
+        "userinfo",
+        "GET",
+        get_openid_connect_url("userinfo"),
+        headers={"Authorization": f"Bearer {access_token}"},
+    )
+
+    return raise_error_from_response(response, KeycloakGetError)
+
+
+TOKEN_EXCHANGE_GRANT = "urn:ietf:params:oauth:grant-type:token-exchange"
+ACCESS_TOKEN_TYPE = "urn:ietf:params:oauth:token-type:access_token"
+
+
+def get_token_operation(grant_type: str) -> str:
+    # Name the operation after the grant, so that refreshes and exchanges are counted apart from logins
+    if grant_type == "refresh_token":
+        return "refresh_token"
+    if grant_type == TOKEN_EXCHANGE_GRANT:
+        return "token_exchange"
+    return "token"
+
+
+def request_token(grant_type: str, **data) -> dict:
+    """
+    Request tokens from the token endpoint, e.g. `request_token("authorization_code", code=..., redirect_uri=...)`.
+
+    return:
+    - The token response
+    - raise KeycloakPostError if failed
+    """
+
+    from keycloak.exceptions import KeycloakPostError, raise_error_from_response
+
+    response = get_keycloak_transport().request(
+        get_token_operation(grant_type),
+        "POST",
+        get_openid_connect_url("token"),
+        data=_with_client_credentials({"grant_type": grant_type, **data}),
+    )
+
+    return raise_error_from_response(response, KeycloakPostError)
+
+
+async def a_request_token(grant_type: str, **data) -> dict:
+    """
+    Async version of `request_token`.
+    """
+
+    from keycloak.exceptions import KeycloakPostError, raise_error_from_response
+
+    response = await get_keycloak_transport().a_request(
+        get_token_operation(grant_type),
+        "POST",
+        get_openid_connect_url("token"),
+        data=_with_client_credentials({"grant_type": grant_type, **data}),
+    )
+
+    return raise_error_from_response(response, KeycloakPostError)
+
+
+def refresh_access_token(refresh_token: str) -> dict:
+    """
+    Get new tokens with a refresh token.
+
+    return:
+    - The token response
+    - raise KeycloakPostError if failed
+    """
+
+    return request_token("refresh_token", refresh_token=refresh_token)
+
+
+def exchange_token(
+    subject_token: str, audience: str, scope: Optional[str] = None
+) -> dict:
+    """
+    Exchange an access token for a token of the same user for another client (`audience`),
+    with Keycloak token exchange.
+
+    return:
+    - The token response
+    - raise KeycloakPostError if failed
+    """
+
+    return request_token(
+        TOKEN_EXCHANGE_GRANT, **_get_exchange_data(subject_token, audience, scope)
+    )
+
+
+async def a_exchange_token(
+    subject_token: str, audience: str, scope: Optional[str] = None
+) -> dict:
+    """
+    Async version of `exchange_token`.
+    """
+
+    return await a_request_token(
+        TOKEN_EXCHANGE_GRANT, **_get_exchange_data(subject_token, audience, scope)
+    )
+
+
+def _get_exchange_data(subject_token: str, audience: str, scope: Optional[str]) -> dict:
+    data = {
+        "subject_token": subject_token,
+        "subject_token_type": ACCESS_TOKEN_TYPE,
+        "requested_token_type": ACCESS_TOKEN_TYPE,
+        "audience": audience,
+    }
+    if scope:
+        data["scope"] = scope
+    return data
+
+
+def logout(refresh_token: str):
+    """
+    End the session of a refresh token.
+
+    return:
+    - None if success
+    - raise KeycloakPostError if failed
+    """
+
+    from keycloak.exceptions import KeycloakPostError, raise_error_from_response
+
+    response = get_keycloak_transport().request(
+        "logout",
+        "POST",
+        get_openid_connect_url("logout"),
+        data=_with_client_credentials({"refresh_token": refresh_token}),
+    )
+
+    raise_error_from_response(response, KeycloakPostError, expected_codes=[204])
+
+
+def get_well_known() -> dict:
+    """
+    Get the OpenID Connect discovery document of the realm.
+    """
+
+    from keycloak.exceptions import KeycloakGetError, raise_error_from_response
+
+    response = get_keycloak_transport().request("well_known", "GET", get_well_known_url())
+
+    return raise_error_from_response(response, KeycloakGetError)
+
+
+def get_certs() -> dict:
+    """
+    Get the public keys (JWKS) of the realm.
+    """
+
+    from keycloak.exceptions import KeycloakGetError, raise_error_from_response
+
+    response = get_keycloak_transport().request(
+        "certs", "GET", get_openid_connect_url("certs")
+    )
+
+    return raise_error_from_response(response, KeycloakGetError)
+
+
 def revoke_token(
     token: str,
     token_type_hint: str,
@@ -76,20 +923,21 @@ def revoke_token(
     - raise ValidationError if failed
     """
 
-    revoke_url = urljoin(
-        KEYCLOAK_SERVER_URL.rstrip("/"),
-        f"/realms/{KEYCLOAK_REALM}/protocol/openid-connect/revoke",
-    )
+    from rest_framework import status
+    from rest_framework.exceptions import ValidationError
+
+    realm_settings = get_settings()
+
+    revoke_url = get_openid_connect_url("revoke")
 
     data = {
         "token": token,
         "token_type_hint": token_type_hint,
-        "client_id": KEYCLOAK_CLIENT_ID,
-        "client_secret": KEYCLOAK_CLIENT_SECRET,
+        "client_id": realm_settings.KEYCLOAK_CLIENT_ID,
+        "client_secret": realm_settings.KEYCLOAK_CLIENT_SECRET,
     }
 
-    with httpx.Client() as client:
-        response = client.post(revoke_url, data=data)
+    response = get_keycloak_transport().request("revoke", "POST", revoke_url, data=data)
 
     response.raise_for_status()
 
@@ -112,20 +960,23 @@ async def a_revoke_token(
     - raise ValidationError if failed
     """
 
-    revoke_url = urljoin(
-        KEYCLOAK_SERVER_URL.rstrip("/"),
-        f"/realms/{KEYCLOAK_REALM}/protocol/openid-connect/revoke",
-    )
+    from rest_framework import status
+    from rest_framework.exceptions import ValidationError
+
+    realm_settings = get_settings()
+
+    revoke_url = get_openid_connect_url("revoke")
 
     data = {
         "token": token,
-        "token_type_hint": token_type_hint.value,
-        "client_id": KEYCLOAK_CLIENT_ID,
-        "client_secret": KEYCLOAK_CLIENT_SECRET,
+        "token_type_hint": token_type_hint,
+        "client_id": realm_settings.KEYCLOAK_CLIENT_ID,
+        "client_secret": realm_settings.KEYCLOAK_CLIENT_SECRET,
     }
 
-    async with httpx.AsyncClient() as client:
-        response = await client.post(revoke_url, data=data)
+    response = await get_keycloak_transport().a_request(
+        "revoke", "POST", revoke_url, data=data
+    )
 
     response.raise_for_status()
 
@@ -134,3 +985,11 @@ async def a_revoke_token(
         raise ValidationError(
             detail=error.get("error_description"), code=status.HTTP_400_BAD_REQUEST
         )
+
+
+def _with_client_credentials(data: dict) -> dict:
+    realm_settings = get_settings()
+    data["client_id"] = realm_settings.KEYCLOAK_CLIENT_ID
+    if realm_settings.KEYCLOAK_CLIENT_SECRET:
+        data["client_secret"] = realm_settings.KEYCLOAK_CLIENT_SECRET
+    return data
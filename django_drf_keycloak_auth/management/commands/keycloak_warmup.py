@@ -0,0 +1,29 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from django_drf_keycloak_auth.warmup import get_warmup
+
+
+class Command(BaseCommand):
+    help = (
+        "Warm up the Keycloak client, connections, discovery document and realm keys "
+        "of every realm, and check that tokens can be validated."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--timeout",
+            type=float,
+            default=None,
+            help="Seconds to wait for the warm-up (default: no limit).",
+        )
+
+    def handle(self, *args, **options):
+        warmup = get_warmup()
+        ready = warmup.run(timeout=options["timeout"])
+
+        self.stdout.write(json.dumps(warmup.snapshot(), indent=2))
+        if not ready:
+            raise CommandError("The Keycloak warm-up failed")
+        self.stdout.write(self.style.SUCCESS("Keycloak is ready"))
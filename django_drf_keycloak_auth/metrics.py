@@ -0,0 +1,148 @@
+"""
+Metrics of the calls to Keycloak, the authentications and the caches.
+
+Metrics go to a sink, selected with KEYCLOAK_METRICS (see `get_metrics` in keycloak_utils):
+- NullSink (default): nothing is recorded, emitting code is skipped
+- PrometheusSink: counters and histograms of prometheus-client, exposed by MetricsView
+- StatsDSink: counters and timers sent over UDP, with DogStatsD tags
+- any MetricsSink subclass, given by its dotted path
+
+Emitted metrics:
+- keycloak_requests_total{operation, outcome}: calls to Keycloak, the outcome is "ok", "4xx", "5xx",
+  "circuit_open" or the class name of the error (e.g. "ConnectTimeout")
+- keycloak_request_duration_seconds{operation}: latency of the calls to Keycloak
+- keycloak_authentications_total{outcome}: results of `authenticate`, "success", "failed" or "unavailable"
+- keycloak_authentication_duration_seconds{outcome}: latency of `authenticate`
+- keycloak_cache_requests_total{cache, result}: lookups of the caches, "hit", "stale" or "miss"
+
+When several realms are served, every metric also has a "realm" tag.
+"""
+
+import logging
+import socket
+import threading
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+DESCRIPTIONS = {
+    "keycloak_requests_total": "Calls to Keycloak",
+    "keycloak_request_duration_seconds": "Latency of the calls to Keycloak",
+    "keycloak_authentications_total": "Authentications of Keycloak tokens",
+    "keycloak_authentication_duration_seconds": "Latency of the authentications",
+    "keycloak_cache_requests_total": "Lookups of the Keycloak caches",
+}
+
+
+class MetricsSink:
+    """
+    Destination of the metrics. Subclasses override `increment` and `observe`.
+
+    Callers check `enabled` before building the tags, so a disabled sink costs one attribute read.
+    """
+
+    enabled = True
+
+    def increment(self, name: str, value: float = 1, tags: Optional[Dict[str, str]] = None):
+        """Add `value` to a counter."""
+
+    def observe(self, name: str, value: float, tags: Optional[Dict[str, str]] = None):
+        """Record a duration in seconds."""
+
+
+class NullSink(MetricsSink):
+    """Sink that records nothing."""
+
+    enabled = False
+
+
+class TaggedSink(MetricsSink):
+    """Sink adding fixed tags, e.g. the realm, to the metrics it passes to another sink."""
+
+    def __init__(self, sink: MetricsSink, tags: Dict[str, str]):
+        self.sink = sink
+        self.tags = tags
+        self.enabled = sink.enabled
+
+    def increment(self, name: str, value: float = 1, tags: Optional[Dict[str, str]] = None):
+        self.sink.increment(name, value, {**self.tags, **(tags or {})})
+
+    def observe(self, name: str, value: float, tags: Optional[Dict[str, str]] = None):
+        self.sink.observe(name, value, {**self.tags, **(tags or {})})
+
+
+class PrometheusSink(MetricsSink):
+    """
+    Sink backed by prometheus-client (pip install django-drf-keycloak-auth[prometheus]).
+
+    Counters and histograms are created on first use, in `registry` (the default registry of
+    prometheus-client by default), with the tag names as label names.
+    """
+
+    def __init__(self, registry=None):
+        try:
+            import prometheus_client
+        except ImportError as e:
+            raise ImportError(
+                "PrometheusSink requires prometheus-client, "
+                "install django-drf-keycloak-auth[prometheus]"
+            ) from e
+
+        self.prometheus_client = prometheus_client
+        self.registry = registry or prometheus_client.REGISTRY
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def increment(self, name: str, value: float = 1, tags: Optional[Dict[str, str]] = None):
+        self._labels(self.prometheus_client.Counter, name, tags).inc(value)
+
+    def observe(self, name: str, value: float, tags: Optional[Dict[str, str]] = None):
+        self._labels(self.prometheus_client.Histogram, name, tags).observe(value)
+
+    def _labels(self, metric_class, name: str, tags: Optional[Dict[str, str]]):
+        metric = self._metrics.get(name)
+        if metric is None:
+            with self._lock:
+                metric = self._metrics.get(name)
+                if metric is None:
+                    metric = self._metrics[name] = metric_class(
+                        name,
+                        DESCRIPTIONS.get(name, name),
+                        labelnames=sorted(tags or ()),
+                        registry=self.registry,
+                    )
+        return metric.labels(**tags) if tags else metric
+
+
+class StatsDSink(MetricsSink):
+    """
+    Sink sending counters and timers to a StatsD server over UDP, tags use the DogStatsD format.
+
+    Sending never blocks nor raises, metrics are dropped when the server can not be reached.
+    """
+
+    def __init__(self, host: str = "localhost", port: int = 8125, prefix: str = ""):
+        # Resolve once, instead of on every send
+        self.address = (socket.gethostbyname(host), port)
+        self.prefix = f"{prefix}." if prefix else ""
+
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._socket.setblocking(False)
+
+    def increment(self, name: str, value: float = 1, tags: Optional[Dict[str, str]] = None):
+        self._send(f"{self.prefix}{name}:{value}|c{self._format_tags(tags)}")
+
+    def observe(self, name: str, value: float, tags: Optional[Dict[str, str]] = None):
+        self._send(f"{self.prefix}{name}:{value * 1000:.3f}|ms{self._format_tags(tags)}")
+
+    def _send(self, packet: str):
+        try:
+            self._socket.sendto(packet.encode("utf-8"), self.address)
+        except OSError:
+            logger.debug("Failed to send a metric to %s:%s", *self.address)
+
+    @staticmethod
+    def _format_tags(tags: Optional[Dict[str, str]]) -> str:
+        if not tags:
+            return ""
+        return "|#" + ",".join(f"{key}:{value}" for key, value in tags.items())
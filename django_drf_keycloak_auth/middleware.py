@@ -0,0 +1,97 @@
+import logging
+from functools import partial
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.http import HttpRequest
+from django.utils.functional import SimpleLazyObject
+from rest_framework.exceptions import AuthenticationFailed
+
+from django_drf_keycloak_auth.authentication import (
+    AsyncKeycloakAuthentication,
+    KeycloakAuthentication,
+)
+from django_drf_keycloak_auth.resilience import KeycloakUnavailableError
+
+logger = logging.getLogger(__name__)
+
+
+def get_anonymous_user():
+    from django.contrib.auth.models import AnonymousUser
+
+    return AnonymousUser()
+
+
+class KeycloakAuthenticationMiddleware:
+    """
+    Set `request.user` to the user of the Bearer token, for plain Django views.
+
+    The token is only validated on first access of `request.user` (or `await request.auser()`),
+    and the result is memoised on the request: KeycloakAuthentication and AsyncKeycloakAuthentication
+    return it instead of validating the token again in DRF views. Subclasses of them have their own
+    result, set `authentication_class` and `async_authentication_class` to share it with them.
+    Requests without a Bearer token keep the user set by the middlewares before this one,
+    e.g. the session user of django.contrib.auth, and requests with an invalid token get AnonymousUser.
+
+        MIDDLEWARE = [
+            ...
+            "django.contrib.auth.middleware.AuthenticationMiddleware",
+            "django_drf_keycloak_auth.middleware.KeycloakAuthenticationMiddleware",
+        ]
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    authentication_class = KeycloakAuthentication
+    async_authentication_class = AsyncKeycloakAuthentication
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request: HttpRequest):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        self.process_request(request)
+        return self.get_response(request)
+
+    async def __acall__(self, request: HttpRequest):
+        self.process_request(request)
+        return await self.get_response(request)
+
+    def process_request(self, request: HttpRequest):
+        fallback_user = request.__dict__.get("user")
+        fallback_auser = request.__dict__.get("auser")
+
+        request.user = SimpleLazyObject(
+            partial(self.get_user, request, fallback_user)
+        )
+        request.auser = partial(self.aget_user, request, fallback_user, fallback_auser)
+
+    def get_user(self, request: HttpRequest, fallback_user=None):
+        try:
+            user_auth = self.authentication_class().authenticate(request)
+        except (AuthenticationFailed, KeycloakUnavailableError) as e:
+            logger.info("Keycloak authentication failed: %s", e)
+            return get_anonymous_user()
+
+        if user_auth is None:
+            return fallback_user if fallback_user is not None else get_anonymous_user()
+        return user_auth[0]
+
+    async def aget_user(
+        self, request: HttpRequest, fallback_user=None, fallback_auser=None
+    ):
+        try:
+            user_auth = await self.async_authentication_class().authenticate(request)
+        except (AuthenticationFailed, KeycloakUnavailableError) as e:
+            logger.info("Keycloak authentication failed: %s", e)
+            return get_anonymous_user()
+
+        if user_auth is not None:
+            return user_auth[0]
+        if fallback_auser is not None:
+            return await fallback_auser()
+        return fallback_user if fallback_user is not None else get_anonymous_user()
@@ -1,33 +1,64 @@
-from dataclasses import dataclass, field
-from typing import Iterable, List, Optional
+from typing import FrozenSet, Iterable, List, Optional
 
 
-@dataclass
 class User:
+    """
+    User authenticated by a Keycloak token.
 
-    username: str = field(init=False)
-    given_name: Optional[str] = field(init=False)
-    family_name: Optional[str] = field(init=False)
-    preferred_username: Optional[str] = field(init=False)
-    email: Optional[str] = field(init=False)
-    email_verified: bool = field(init=False, default=False)
-    sub: str = field(init=False)
-    claims: dict = field(default_factory=dict)
-    roles: List[str] = field(init=False, default_factory=list)
-
-    def __post_init__(self):
-        self.username = (
+    Only the claims are stored, the other fields are read from them on access.
+    The roles are extracted once, on first use, into a frozenset so that role checks are O(1).
+    """
+
+    __slots__ = ("claims", "_role_set", "_roles")
+
+    def __init__(self, claims: Optional[dict] = None):
+        self.claims: dict = claims if claims is not None else {}
+        self._role_set: Optional[FrozenSet[str]] = None
+        self._roles: Optional[List[str]] = None
+
+    @property
+    def username(self) -> str:
+        return (
             self.claims.get("preferred_username")
             or self.claims.get("email")
             or self.claims.get("sub")
         )
-        self.given_name = self.claims.get("given_name")
-        self.family_name = self.claims.get("family_name")
-        self.preferred_username = self.claims.get("preferred_username")
-        self.email = self.claims.get("email")
-        self.email_verified = self.claims.get("email_verified")
-        self.sub = self.claims.get("sub")
-        self.roles = self.__extract_roles_from_claims()
+
+    @property
+    def given_name(self) -> Optional[str]:
+        return self.claims.get("given_name")
+
+    @property
+    def family_name(self) -> Optional[str]:
+        return self.claims.get("family_name")
+
+    @property
+    def preferred_username(self) -> Optional[str]:
+        return self.claims.get("preferred_username")
+
+    @property
+    def email(self) -> Optional[str]:
+        return self.claims.get("email")
+
+    @property
+    def email_verified(self) -> bool:
+        return self.claims.get("email_verified")
+
+    @property
+    def sub(self) -> str:
+        return self.claims.get("sub")
+
+    @property
+    def role_set(self) -> FrozenSet[str]:
+        if self._role_set is None:
+            self._role_set = self.__extract_roles_from_claims()
+        return self._role_set
+
+    @property
+    def roles(self) -> List[str]:
+        if self._roles is None:
+            self._roles = sorted(self.role_set)
+        return self._roles
 
     @property
     def is_authenticated(self) -> bool:
@@ -45,25 +76,24 @@ class User:
         return self.username
 
     def has_role(self, role: str) -> bool:
-        return role in self.roles
+        return role in self.role_set
 
     def has_any_role(self, roles: Iterable[str]) -> bool:
-        return any(self.has_role(role) for role in roles)
+        return not self.role_set.isdisjoint(roles)
 
     def has_all_roles(self, roles: Iterable[str]) -> bool:
-        return all(self.has_role(role) for role in roles)
+        return self.role_set.issuperset(roles)
 
-    def __extract_roles_from_claims(self) -> List[str]:
+    def __extract_roles_from_claims(self) -> FrozenSet[str]:
         """
         Extract roles from Keycloak userinfo/claims (first realm access, then merge the client roles of resource access).
-        Return a list of de-duplicated role strings (such as ['admin', 'user', 'clientA:roleX']).
+        Return a set of role strings (such as {'admin', 'user', 'clientA:roleX'}).
         """
         roles = set()
 
         # realm roles: {"realm_access": {"roles": ["role1", ...]}}
         realm_access = self.claims.get("realm_access", {}) or {}
-        for r in realm_access.get("roles", []) or []:
-            roles.add(r)
+        roles.update(realm_access.get("roles", []) or [])
 
         # client/resource roles: {"resource_access": {"client-id": {"roles":["r1",...]}, ...}}
         resource_access = self.claims.get("resource_access", {}) or {}
@@ -71,11 +101,10 @@ class User:
             resource_access.items() if isinstance(resource_access, dict) else []
         ):
             client_roles = info.get("roles", []) if isinstance(info, dict) else []
-            for cr in client_roles or []:
-                # To avoid naming conflicts, use the form "client:role"
-                roles.add(f"{client}:{cr}")
+            # To avoid naming conflicts, use the form "client:role"
+            roles.update(f"{client}:{cr}" for cr in client_roles or [])
 
-        return sorted(roles)
+        return frozenset(roles)
 
     def to_dict(self):
         return {
@@ -89,3 +118,13 @@ class User:
             "claims": self.claims,
             "roles": self.roles,
         }
+
+    def __eq__(self, other):
+        if not isinstance(other, User):
+            return NotImplemented
+        return self.claims == other.claims
+
+    __hash__ = None
+
+    def __repr__(self):
+        return f"User(username={self.username!r}, sub={self.sub!r}, roles={self.roles!r})"
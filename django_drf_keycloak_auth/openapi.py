@@ -0,0 +1,45 @@
+"""
+The drf-spectacular helpers the views are documented with.
+
+drf-spectacular is only imported when it is an installed app, as nothing else would generate the schema.
+Otherwise `extend_schema` leaves the views unchanged and the other helpers accept and ignore their arguments.
+"""
+
+from django.apps import apps
+
+if apps.is_installed("drf_spectacular"):
+    from drf_spectacular.utils import (
+        OpenApiExample,
+        OpenApiParameter,
+        OpenApiTypes,
+        extend_schema,
+    )
+else:
+
+    class OpenApiExample:
+        def __init__(self, *args, **kwargs):
+            pass
+
+    class OpenApiParameter:
+        QUERY = "query"
+        PATH = "path"
+        HEADER = "header"
+        COOKIE = "cookie"
+
+        def __init__(self, *args, **kwargs):
+            pass
+
+    class _OpenApiTypes:
+        def __getattr__(self, name: str):
+            return name
+
+    OpenApiTypes = _OpenApiTypes()
+
+    def extend_schema(*args, **kwargs):
+        def decorator(f):
+            return f
+
+        return decorator
+
+
+__all__ = ["OpenApiExample", "OpenApiParameter", "OpenApiTypes", "extend_schema"]
@@ -0,0 +1,76 @@
+from typing import FrozenSet, Optional, Type
+
+from rest_framework.permissions import BasePermission
+from rest_framework.request import Request
+
+
+class RolePermission(BasePermission):
+    """
+    Permission granted by the Keycloak roles of `request.user`.
+
+    Do not use it directly, build subclasses with `HasRole`, `HasAnyRole` or `HasAllRoles`.
+    The required roles are compiled into a frozenset once, when the view class is defined,
+    so a check is a single set operation against `User.role_set`.
+    """
+
+    required_roles: FrozenSet[str] = frozenset()
+    require_all: bool = False
+
+    def has_permission(self, request: Request, view) -> bool:
+        role_set = getattr(request.user, "role_set", None)
+        if role_set is None:
+            return False
+
+        if self.require_all:
+            return self.required_roles <= role_set
+        return not self.required_roles.isdisjoint(role_set)
+
+
+def _role_permission(
+    name: str, roles: tuple, client: Optional[str], require_all: bool
+) -> Type[RolePermission]:
+    if not roles:
+        raise ValueError(f"{name} requires at least one role")
+
+    # Client roles are named "client:role", see User.role_set
+    required_roles = frozenset(f"{client}:{role}" if client else role for role in roles)
+    role_names = ", ".join(sorted(required_roles))
+
+    return type(
+        f"{name}({role_names})",
+        (RolePermission,),
+        {
+            "required_roles": required_roles,
+            "require_all": require_all,
+            "message": f"You need {'all' if require_all else 'one'} of the roles: {role_names}.",
+        },
+    )
+
+
+def HasRole(role: str, client: Optional[str] = None) -> Type[RolePermission]:
+    """
+    Permission class that requires a role.
+
+    Usage examples:
+    permission_classes = [HasRole("admin")]
+    permission_classes = [HasRole("editor", client="my-api")]  # client role "my-api:editor"
+    permission_classes = [HasRole("admin") | (HasRole("editor") & ~HasRole("suspended"))]
+    """
+
+    return _role_permission("HasRole", (role,), client, require_all=True)
+
+
+def HasAnyRole(*roles: str, client: Optional[str] = None) -> Type[RolePermission]:
+    """
+    Permission class that requires at least one of the roles.
+    """
+
+    return _role_permission("HasAnyRole", roles, client, require_all=False)
+
+
+def HasAllRoles(*roles: str, client: Optional[str] = None) -> Type[RolePermission]:
+    """
+    Permission class that requires all of the roles.
+    """
+
+    return _role_permission("HasAllRoles", roles, client, require_all=True)
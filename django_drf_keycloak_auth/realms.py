@@ -0,0 +1,223 @@
+"""
+Realms served by the package.
+
+One deployment can serve several Keycloak realms (tenants), listed in KEYCLOAK_REALMS by name.
+A realm overrides any KEYCLOAK_* setting, given without the prefix, the others are shared:
+
+    KEYCLOAK_REALMS = {
+        "acme": {"SERVER_URL": "https://sso.example.com", "REALM": "acme", "CLIENT_SECRET": "..."},
+        "globex": {"SERVER_URL": "https://sso.example.com", "REALM": "globex", "CLIENT_SECRET": "..."},
+    }
+
+Every realm has its own HTTP transport, keys, caches and metrics (tagged with the realm name).
+The functions of the package act on the current realm: the one activated with `use_realm`,
+otherwise the default realm. KeycloakAuthentication activates the realm of the token's issuer,
+and the views the realm of their "realm" URL kwarg or X-Keycloak-Realm header.
+"""
+
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import cache, wraps
+from typing import Any, Callable, Dict, Iterator, Optional, TypeVar, Union
+
+from django.core.exceptions import ImproperlyConfigured
+
+from django_drf_keycloak_auth.conf import (
+    SETTINGS,
+    KeycloakSettings,
+    RealmSettings,
+    keycloak_settings,
+)
+
+T = TypeVar("T")
+
+DEFAULT_REALM = "default"
+
+
+class Realm:
+    """
+    A realm and the objects built for it, e.g. its HTTP transport and caches (see `realm_cache`).
+    """
+
+    def __init__(self, name: str, settings: KeycloakSettings):
+        self.name = name
+        self.settings = settings
+        self.resources: Dict[Callable, Any] = {}
+        self._lock = threading.RLock()
+
+    @property
+    def issuer(self) -> Optional[str]:
+        return self.settings.KEYCLOAK_ISSUER
+
+    def bind(self, fn: Callable[..., T]) -> Callable[..., T]:
+        """
+        Wrap `fn` so that it always runs in this realm, e.g. for callbacks run later by another thread.
+        """
+
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            with use_realm(self):
+                return fn(*args, **kwargs)
+
+        return wrapper
+
+    def __repr__(self):
+        return f"Realm({self.name!r})"
+
+
+class RealmRegistry:
+    """
+    The realms of the deployment, indexed by name and by issuer.
+    """
+
+    def __init__(self, realms: Dict[str, Realm], default: Optional[str] = None):
+        self.realms = realms
+        self.default_name = default
+        self.by_issuer: Dict[str, Realm] = {}
+        for realm in realms.values():
+            if not realm.issuer:
+                continue
+            if realm.issuer in self.by_issuer:
+                raise ImproperlyConfigured(
+                    f"Realms {self.by_issuer[realm.issuer].name!r} and {realm.name!r} "
+                    f"have the same issuer: {realm.issuer}"
+                )
+            self.by_issuer[realm.issuer] = realm
+
+    @property
+    def default(self) -> Realm:
+        if self.default_name is None:
+            raise ImproperlyConfigured(
+                "No Keycloak realm selected, "
+                "set KEYCLOAK_DEFAULT_REALM or select one with use_realm"
+            )
+        return self.realms[self.default_name]
+
+    def get(self, name: str) -> Realm:
+        """
+        Get a realm by name.
+
+        return:
+        - The realm
+        - raise LookupError if there is no such realm
+        """
+
+        try:
+            return self.realms[name]
+        except KeyError:
+            raise LookupError(f"Unknown realm: {name}") from None
+
+    def get_by_issuer(self, issuer: Optional[str]) -> Optional[Realm]:
+        return self.by_issuer.get(issuer)
+
+    @property
+    def multiple(self) -> bool:
+        return len(self.realms) > 1
+
+    def __iter__(self) -> Iterator[Realm]:
+        return iter(self.realms.values())
+
+    def __len__(self) -> int:
+        return len(self.realms)
+
+
+@cache
+def get_realm_registry() -> RealmRegistry:
+    """
+    Get the realms configured by KEYCLOAK_REALM and KEYCLOAK_REALMS.
+    """
+
+    realms = {}
+    for name, overrides in keycloak_settings.KEYCLOAK_REALMS.items():
+        settings = RealmSettings(overrides, keycloak_settings)
+        unknown = [key for key in settings.overrides if key not in SETTINGS]
+        if unknown:
+            raise ImproperlyConfigured(
+                f"Unknown settings of realm {name!r}: {', '.join(unknown)}"
+            )
+        realms[name] = Realm(name, settings)
+
+    if keycloak_settings.KEYCLOAK_REALM or not realms:
+        realms.setdefault(DEFAULT_REALM, Realm(DEFAULT_REALM, keycloak_settings))
+
+    default = keycloak_settings.KEYCLOAK_DEFAULT_REALM
+    if default is None:
+        if DEFAULT_REALM in realms:
+            default = DEFAULT_REALM
+        elif len(realms) == 1:
+            default = next(iter(realms))
+    elif default not in realms:
+        raise ImproperlyConfigured(
+            f"KEYCLOAK_DEFAULT_REALM is not a configured realm: {default}"
+        )
+
+    return RealmRegistry(realms, default)
+
+
+_current_realm: ContextVar[Optional[Realm]] = ContextVar("keycloak_realm", default=None)
+
+
+def get_current_realm() -> Realm:
+    """
+    Get the realm activated with `use_realm`, otherwise the default realm.
+    """
+
+    realm = _current_realm.get()
+    if realm is None:
+        return get_realm_registry().default
+    return realm
+
+
+def get_settings() -> KeycloakSettings:
+    """
+    Get the settings of the current realm.
+    """
+
+    return get_current_realm().settings
+
+
+@contextmanager
+def use_realm(realm: Union[Realm, str]) -> Iterator[Realm]:
+    """
+    Make a realm, or the realm of that name, the current realm in this thread or task.
+
+        with use_realm("acme"):
+            token = request_token("client_credentials")
+    """
+
+    if isinstance(realm, str):
+        realm = get_realm_registry().get(realm)
+
+    reset_token = _current_realm.set(realm)
+    try:
+        yield realm
+    finally:
+        _current_realm.reset(reset_token)
+
+
+def realm_cache(fn: Callable[[], T]) -> Callable[[], T]:
+    """
+    Like functools.cache for a function without arguments, but with one result per realm.
+    The function runs in the realm it builds the result for.
+    """
+
+    @wraps(fn)
+    def wrapper() -> T:
+        realm = get_current_realm()
+        try:
+            return realm.resources[fn]
+        except KeyError:
+            pass
+
+        with realm._lock:
+            if fn not in realm.resources:
+                realm.resources[fn] = fn()
+            return realm.resources[fn]
+
+    def cache_clear():
+        for realm in get_realm_registry():
+            realm.resources.pop(fn, None)
+
+    wrapper.cache_clear = cache_clear
+    return wrapper
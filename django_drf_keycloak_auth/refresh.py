@@ -0,0 +1,117 @@
+from typing import Optional
+
+from django_drf_keycloak_auth.cache import (
+    SharedCache,
+    TTLCache,
+    get_key_prefix,
+    hash_token,
+)
+from django_drf_keycloak_auth.keycloak_utils import get_metrics, refresh_access_token
+from django_drf_keycloak_auth.realms import get_settings, realm_cache
+from django_drf_keycloak_auth.singleflight import SingleFlight
+
+# Concurrent exchanges of the same refresh token, keyed by token hash
+refresh_flight = SingleFlight()
+
+
+@realm_cache
+def get_refresh_cache() -> TTLCache:
+    """
+    Get the cache of recent refresh token exchanges of the current realm, keyed by refresh token hash.
+    """
+
+    realm_settings = get_settings()
+    return TTLCache(
+        max_size=realm_settings.KEYCLOAK_REFRESH_CACHE_MAX_SIZE,
+        ttl=realm_settings.KEYCLOAK_REFRESH_CACHE_TTL,
+        name="refresh",
+        metrics=get_metrics(),
+    )
+
+
+@realm_cache
+def get_shared_refresh_cache() -> Optional[SharedCache]:
+    """
+    Get the cache of recent refresh token exchanges of the current realm shared between nodes,
+    None if not configured.
+    """
+
+    realm_settings = get_settings()
+    alias = realm_settings.KEYCLOAK_REFRESH_CACHE_ALIAS
+    ttl = realm_settings.KEYCLOAK_REFRESH_CACHE_TTL
+    if not alias or ttl <= 0:
+        return None
+
+    return SharedCache(
+        alias=alias,
+        ttl=ttl,
+        key_prefix=get_key_prefix("refresh"),
+        name="shared_refresh",
+        metrics=get_metrics(),
+    )
+
+
+def refresh_tokens(refresh_token: str) -> dict:
+    """
+    Get new tokens with a refresh token, exchanging it at most once for concurrent and repeated callers.
+
+    With refresh token rotation, Keycloak only accepts a refresh token once. Browser tabs or apps refreshing
+    at the same time all get the result of a single exchange, which is then kept for
+    KEYCLOAK_REFRESH_CACHE_TTL seconds (off by default) for callers arriving just after it,
+    who get it without Keycloak seeing the token again. Failures are not kept.
+
+    return:
+    - The token response
+    - raise KeycloakPostError if failed
+    """
+
+    token_hash = hash_token(refresh_token)
+
+    token = get_cached_refresh(token_hash)
+    if token is not None:
+        return token
+
+    return refresh_flight.do(token_hash, exchange_refresh_token, refresh_token, token_hash)
+
+
+def exchange_refresh_token(refresh_token: str, token_hash: str) -> dict:
+    token = refresh_access_token(refresh_token)
+
+    refresh_cache = get_refresh_cache()
+    if refresh_cache.enabled:
+        refresh_cache.set(token_hash, token)
+    shared_cache = get_shared_refresh_cache()
+    if shared_cache is not None:
+        shared_cache.set(token_hash, token)
+
+    return token
+
+
+def get_cached_refresh(token_hash: str) -> Optional[dict]:
+    refresh_cache = get_refresh_cache()
+    if not refresh_cache.enabled:
+        return None
+
+    token = refresh_cache.get(token_hash)
+    if token is not None:
+        return token
+
+    shared_cache = get_shared_refresh_cache()
+    if shared_cache is None:
+        return None
+    token = shared_cache.get(token_hash)
+    if token is not None:
+        refresh_cache.set(token_hash, token)
+    return token
+
+
+def discard_refresh(refresh_token: str):
+    """
+    Forget the recent exchange of a refresh token, e.g. once its session ended.
+    """
+
+    token_hash = hash_token(refresh_token)
+    get_refresh_cache().delete(token_hash)
+    shared_cache = get_shared_refresh_cache()
+    if shared_cache is not None:
+        shared_cache.delete(token_hash)
@@ -0,0 +1,281 @@
+import contextvars
+import heapq
+import itertools
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Optional
+
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+
+class KeycloakUnavailableError(APIException):
+    """Keycloak could not be reached or failed, as opposed to rejecting the request."""
+
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = "Keycloak is temporarily unavailable."
+    default_code = "keycloak_unavailable"
+
+
+class CircuitOpenError(KeycloakUnavailableError):
+    """Raised instead of calling Keycloak while the circuit breaker is open."""
+
+
+def is_keycloak_unavailable(error: Exception) -> bool:
+    """
+    Whether an error means that Keycloak is unavailable (connection error, timeout, 5xx response).
+    """
+
+    import httpx
+    from keycloak.exceptions import KeycloakError
+
+    if isinstance(error, (KeycloakUnavailableError, httpx.TransportError)):
+        return True
+    if isinstance(error, KeycloakError):
+        return (error.response_code or 0) >= 500
+    return False
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker for the calls to Keycloak.
+
+    The outcome of the last `window` calls is recorded. A call is bad when it failed or took longer
+    than `slow_call_duration` seconds. Once at least `min_calls` are recorded and the rate of bad calls
+    reaches `error_rate`, the breaker opens and calls fail fast with CircuitOpenError.
+    After `reset_timeout` seconds a single trial call is let through (half open):
+    the breaker closes if it is good and opens again otherwise.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(
+        self,
+        window: int = 20,
+        min_calls: int = 10,
+        error_rate: float = 0.5,
+        slow_call_duration: float = 5,
+        reset_timeout: float = 30,
+    ):
+        self.window = window
+        self.min_calls = min_calls
+        self.error_rate = error_rate
+        self.slow_call_duration = slow_call_duration
+        self.reset_timeout = reset_timeout
+
+        self._lock = threading.Lock()
+        self._outcomes: deque = deque(maxlen=window)
+        self._state = self.CLOSED
+        self._opened_at: Optional[float] = None
+        self._trial_in_flight = False
+        self.rejected = 0
+        self.opened = 0
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._current_state()
+
+    def before_call(self):
+        """
+        Check that a call may be made.
+
+        return:
+        - None if the call may be made
+        - raise CircuitOpenError if the breaker is open
+        """
+
+        with self._lock:
+            state = self._current_state()
+            if state == self.CLOSED:
+                return
+            if state == self.HALF_OPEN and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return
+            self.rejected += 1
+
+        raise CircuitOpenError()
+
+    def record(self, success: bool, duration: float):
+        """
+        Record the outcome of a call made after `before_call`.
+        """
+
+        good = success and duration < self.slow_call_duration
+
+        with self._lock:
+            if self._current_state() == self.HALF_OPEN:
+                self._trial_in_flight = False
+                if good:
+                    self._state = self.CLOSED
+                    self._outcomes.clear()
+                else:
+                    self._open()
+                return
+
+            self._outcomes.append(good)
+            bad = self._outcomes.count(False)
+            if (
+                self._state == self.CLOSED
+                and len(self._outcomes) >= self.min_calls
+                and bad / len(self._outcomes) >= self.error_rate
+            ):
+                self._open()
+
+    def abort(self):
+        """
+        Forget a call made after `before_call` that ended without an outcome, e.g. when cancelled.
+        """
+
+        with self._lock:
+            self._trial_in_flight = False
+
+    def snapshot(self) -> dict:
+        """
+        Get the state of the breaker, for monitoring.
+        """
+
+        with self._lock:
+            return {
+                "state": self._current_state(),
+                "calls": len(self._outcomes),
+                "bad_calls": self._outcomes.count(False),
+                "opened": self.opened,
+                "rejected": self.rejected,
+                "opened_at": self._opened_at,
+            }
+
+    def _open(self):
+        self._state = self.OPEN
+        self._opened_at = time.monotonic()
+        self._outcomes.clear()
+        self.opened += 1
+
+    def _current_state(self) -> str:
+        if (
+            self._state == self.OPEN
+            and time.monotonic() - self._opened_at >= self.reset_timeout
+        ):
+            self._state = self.HALF_OPEN
+            self._trial_in_flight = False
+        return self._state
+
+
+_background_executor: Optional[ThreadPoolExecutor] = None
+_background_executor_pid: Optional[int] = None
+_background_executor_lock = threading.Lock()
+
+
+def run_in_background(fn: Callable, *args, **kwargs) -> Future:
+    """
+    Run a function on the small thread pool used for background work, e.g. revalidations.
+
+    The pool is rebuilt after a fork, as its threads do not survive in the child process.
+    The function runs in a copy of the caller's context, e.g. in the caller's realm.
+    """
+
+    global _background_executor, _background_executor_pid
+
+    with _background_executor_lock:
+        if _background_executor is None or _background_executor_pid != os.getpid():
+            _background_executor = ThreadPoolExecutor(
+                max_workers=4, thread_name_prefix="keycloak-background"
+            )
+            _background_executor_pid = os.getpid()
+        executor = _background_executor
+
+    return executor.submit(contextvars.copy_context().run, fn, *args, **kwargs)
+
+
+class ScheduledCall:
+    """
+    A call scheduled with `run_later`.
+    """
+
+    __slots__ = ("when", "fn", "args", "kwargs", "context", "cancelled")
+
+    def __init__(self, when: float, fn: Callable, args: tuple, kwargs: dict):
+        self.when = when
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.context = contextvars.copy_context()
+        self.cancelled = False
+
+    def cancel(self):
+        """
+        Do not run the call if it is not running yet.
+        """
+
+        self.cancelled = True
+
+    def run(self):
+        if not self.cancelled:
+            self.context.run(self.fn, *self.args, **self.kwargs)
+
+
+class _Scheduler:
+    """
+    A single timer thread that hands the calls that are due to the background pool.
+    """
+
+    def __init__(self):
+        self._calls = []
+        self._counter = itertools.count()
+        self._condition = threading.Condition()
+        self._thread = threading.Thread(
+            target=self._loop, name="keycloak-scheduler", daemon=True
+        )
+        self._thread.start()
+
+    def schedule(self, call: ScheduledCall):
+        with self._condition:
+            heapq.heappush(self._calls, (call.when, next(self._counter), call))
+            self._condition.notify()
+
+    def _loop(self):
+        while True:
+            with self._condition:
+                while not self._calls or self._calls[0][0] > time.monotonic():
+                    if self._calls:
+                        self._condition.wait(self._calls[0][0] - time.monotonic())
+                    else:
+                        self._condition.wait()
+                _, _, call = heapq.heappop(self._calls)
+
+            if not call.cancelled:
+                run_in_background(call.run)
+
+
+_scheduler: Optional[_Scheduler] = None
+_scheduler_pid: Optional[int] = None
+
+
+def run_later(delay: float, fn: Callable, *args, **kwargs) -> ScheduledCall:
+    """
+    Run a function on the background pool in `delay` seconds, e.g. a refresh or a retry.
+
+    A single thread waits for all the scheduled calls, it is started again after a fork
+    (the calls scheduled by the parent process are not run in the child).
+    The function runs in a copy of the caller's context, e.g. in the caller's realm.
+
+    return:
+    - The scheduled call, which can be cancelled
+    """
+
+    global _scheduler, _scheduler_pid
+
+    with _background_executor_lock:
+        if _scheduler is None or _scheduler_pid != os.getpid():
+            _scheduler = _Scheduler()
+            _scheduler_pid = os.getpid()
+        scheduler = _scheduler
+
+    call = ScheduledCall(time.monotonic() + max(delay, 0.0), fn, args, kwargs)
+    scheduler.schedule(call)
+    return call
@@ -0,0 +1,153 @@
+import logging
+import math
+import time
+from typing import Iterable, List, Optional
+
+from asgiref.sync import sync_to_async
+from django.core.cache import caches
+
+from django_drf_keycloak_auth.cache import get_key_prefix, hash_token
+from django_drf_keycloak_auth.keycloak_utils import (
+    a_introspect_token,
+    decode_access_token,
+    get_jwks,
+    get_token_header,
+    introspect_token,
+)
+from django_drf_keycloak_auth.realms import get_settings, realm_cache
+
+logger = logging.getLogger(__name__)
+
+# Lifetime of an entry whose token has no "exp", e.g. an offline refresh token
+DEFAULT_TTL = 24 * 60 * 60
+
+
+class RevocationList:
+    """
+    Denylist of revoked tokens and ended sessions, shared by all nodes through a Django cache alias.
+
+    Tokens are denied by hash and by "jti", sessions by "sid", and every entry expires with the token it denies.
+    A lookup is a single `get_many` on the cache backend. Errors of the backend are logged and treated
+    as "not revoked", so an unavailable cache server never fails a request.
+    """
+
+    def __init__(self, alias: str, key_prefix: str = "keycloak:revoked:"):
+        self.alias = alias
+        self.key_prefix = key_prefix
+
+    @property
+    def backend(self):
+        return caches[self.alias]
+
+    def revoke_token(self, token: str, claims: Optional[dict] = None):
+        """
+        Deny a token, by hash and, when its verified claims are given, by "jti".
+        A revoked refresh token also ends its session.
+        """
+
+        claims = claims or {}
+        expires_at = claims.get("exp")
+        keys = self.get_keys(hash_token(token), claims.get("jti"))
+        if claims.get("typ") == "Refresh":
+            keys += self.get_keys(sid=claims.get("sid"))
+        self._deny(keys, expires_at)
+
+    def revoke_session(self, sid: Optional[str], expires_at: Optional[float] = None):
+        """
+        Deny all the tokens of a session, until `expires_at`.
+        """
+
+        self._deny(self.get_keys(sid=sid), expires_at)
+
+    def is_revoked(self, token_hash: str, claims: dict) -> bool:
+        keys = self.get_keys(token_hash, claims.get("jti"), claims.get("sid"))
+        try:
+            return bool(self.backend.get_many(keys))
+        except Exception:
+            logger.warning("Failed to read from cache %r", self.alias, exc_info=True)
+            return False
+
+    async def a_is_revoked(self, token_hash: str, claims: dict) -> bool:
+        keys = self.get_keys(token_hash, claims.get("jti"), claims.get("sid"))
+        try:
+            return bool(await self.backend.aget_many(keys))
+        except Exception:
+            logger.warning("Failed to read from cache %r", self.alias, exc_info=True)
+            return False
+
+    def get_keys(
+        self,
+        token_hash: Optional[str] = None,
+        jti: Optional[str] = None,
+        sid: Optional[str] = None,
+    ) -> List[str]:
+        return [
+            f"{self.key_prefix}{kind}:{value}"
+            for kind, value in (("token", token_hash), ("jti", jti), ("sid", sid))
+            if value
+        ]
+
+    def _deny(self, keys: Iterable[str], expires_at: Optional[float]):
+        timeout = (expires_at or time.time() + DEFAULT_TTL) - time.time()
+        if not keys or timeout <= 0:
+            return
+
+        try:
+            self.backend.set_many(dict.fromkeys(keys, True), timeout=math.ceil(timeout))
+        except Exception:
+            logger.warning("Failed to write to cache %r", self.alias, exc_info=True)
+
+
+@realm_cache
+def get_revocation_list() -> Optional[RevocationList]:
+    """
+    Get the revocation denylist of the current realm, None if not configured.
+    """
+
+    alias = get_settings().KEYCLOAK_REVOCATION_CACHE_ALIAS
+    if not alias:
+        return None
+
+    return RevocationList(alias=alias, key_prefix=get_key_prefix("revoked"))
+
+
+def get_verified_claims(token: str, token_type_hint: str) -> Optional[dict]:
+    """
+    Get the claims of a token that the realm keys or Keycloak vouch for.
+
+    Anyone can post a token to revoke, so only verified claims may deny a "jti" or a session.
+    Access tokens are verified locally, refresh tokens are introspected.
+
+    return:
+    - The claims of the token
+    - None if it can not be verified
+    """
+
+    try:
+        if token_type_hint == "access_token":
+            return decode_access_token(token)
+        result = introspect_token(token)
+    except Exception:
+        return None
+
+    return result if result.get("active") else None
+
+
+async def a_get_verified_claims(token: str, token_type_hint: str) -> Optional[dict]:
+    """
+    Async version of `get_verified_claims`.
+    """
+
+    try:
+        if token_type_hint == "access_token":
+            # Verifying with a known key is CPU only, fetching the key set is moved off the event loop
+            if get_jwks().has_key(get_token_header(token).get("kid")):
+                return decode_access_token(token)
+            return await sync_to_async(decode_access_token, thread_sensitive=False)(
+                token
+            )
+        result = await a_introspect_token(token)
+    except Exception:
+        return None
+
+    return result if result.get("active") else None
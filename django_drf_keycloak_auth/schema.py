@@ -3,7 +3,7 @@ from urllib.parse import urljoin
 from drf_spectacular.extensions import OpenApiAuthenticationExtension
 from drf_spectacular.plumbing import build_bearer_security_scheme_object
 
-from django_drf_keycloak_auth.keycloak_utils import KEYCLOAK_REALM, KEYCLOAK_SERVER_URL
+from django_drf_keycloak_auth.conf import keycloak_settings
 
 
 class KeycloakBearerScheme(OpenApiAuthenticationExtension):
@@ -32,8 +32,8 @@ class KeycloakBearerScheme(OpenApiAuthenticationExtension):
 #         return {
 #             "type": "openIdConnect",
 #             "openIdConnectUrl": urljoin(
-#                 KEYCLOAK_SERVER_URL.rstrip("/"),
-#                 f"/realms/{KEYCLOAK_REALM}/.well-known/openid-configuration",
+#                 keycloak_settings.KEYCLOAK_SERVER_URL.rstrip("/"),
+#                 f"/realms/{keycloak_settings.KEYCLOAK_REALM}/.well-known/openid-configuration",
 #             ),
 #         }
 
@@ -50,12 +50,12 @@ class KeycloakBearerScheme(OpenApiAuthenticationExtension):
 #                 # Use the authorizationCode flow
 #                 "authorizationCode": {
 #                     "authorizationUrl": urljoin(
-#                         KEYCLOAK_SERVER_URL.rstrip("/"),
-#                         f"/realms/{KEYCLOAK_REALM}/protocol/openid-connect/auth",
+#                         keycloak_settings.KEYCLOAK_SERVER_URL.rstrip("/"),
+#                         f"/realms/{keycloak_settings.KEYCLOAK_REALM}/protocol/openid-connect/auth",
 #                     ),
 #                     "tokenUrl": urljoin(
-#                         KEYCLOAK_SERVER_URL.rstrip("/"),
-#                         f"/realms/{KEYCLOAK_REALM}/protocol/openid-connect/token",
+#                         keycloak_settings.KEYCLOAK_SERVER_URL.rstrip("/"),
+#                         f"/realms/{keycloak_settings.KEYCLOAK_REALM}/protocol/openid-connect/token",
 #                     ),
 #                     "scopes": {
 #                         "openid": "OpenID connect scope",
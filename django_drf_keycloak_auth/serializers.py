@@ -1,5 +1,7 @@
 from rest_framework import serializers
 
+from django_drf_keycloak_auth.realms import get_settings
+
 
 class LoginRequestSerializer(serializers.Serializer):
     """Login: request parameters"""
@@ -62,7 +64,23 @@ class UserInfoSerializer(serializers.Serializer):
     sub = serializers.CharField(help_text="User ID / subject")
 
 
-class GenerateTokenRequestSerializer(serializers.Serializer):
+class NonceRequestSerializer(serializers.Serializer):
+    """Nonce of the login, required when userinfo is built from the id_token"""
+
+    nonce = serializers.CharField(
+        required=False,
+        help_text="Nonce sent to the login, checked against the id_token. "
+        "Required with KEYCLOAK_USERINFO_FROM_ID_TOKEN",
+    )
+
+    def validate(self, attrs):
+        # Without it, a replayed id_token would be accepted
+        if get_settings().KEYCLOAK_USERINFO_FROM_ID_TOKEN and not attrs.get("nonce"):
+            raise serializers.ValidationError({"nonce": ["This field is required."]})
+        return attrs
+
+
+class GenerateTokenRequestSerializer(NonceRequestSerializer):
     """Generate Token: by Authorization Code"""
 
     redirect_uri = serializers.URLField(help_text="Redirect URI registered in Keycloak")
@@ -95,6 +113,40 @@ class RevokeTokenRequestSerializer(serializers.Serializer):
     )
 
 
+class BulkRevokeTokenRequestSerializer(serializers.Serializer):
+    """Bulk Revoke Token"""
+
+    tokens = RevokeTokenRequestSerializer(
+        many=True,
+        allow_empty=False,
+        help_text="Tokens to revoke",
+    )
+
+    def validate_tokens(self, value):
+        max_tokens = get_settings().KEYCLOAK_BULK_REVOKE_MAX_TOKENS
+        if len(value) > max_tokens:
+            raise serializers.ValidationError(
+                f"Ensure this field has no more than {max_tokens} elements."
+            )
+        return value
+
+
+class BulkRevokeTokenResultSerializer(serializers.Serializer):
+    """Bulk Revoke Token: Result of one token"""
+
+    index = serializers.IntegerField(help_text="Position of the token in the request")
+    revoked = serializers.BooleanField(help_text="Whether the token was revoked")
+    detail = serializers.CharField(
+        required=False, help_text="Reason of the failure, if not revoked"
+    )
+
+
+class BulkRevokeTokenResponseSerializer(serializers.Serializer):
+    """Bulk Revoke Token: Response"""
+
+    results = BulkRevokeTokenResultSerializer(many=True)
+
+
 class LogoutRequestSerializer(serializers.Serializer):
     """Logout"""
 
@@ -105,6 +157,11 @@ class CallbackRequestSerializer(serializers.Serializer):
     """Callback view"""
 
     code = serializers.CharField(help_text="Authorization code from Keycloak")
+    # Not required: the redirect of Keycloak does not send the nonce back
+    nonce = serializers.CharField(
+        required=False,
+        help_text="Nonce sent to the login, checked against the id_token",
+    )
 
 
 class ErrorResponseSerializer(serializers.Serializer):
@@ -0,0 +1,231 @@
+"""
+Service account tokens (client credentials grant) of the configured client, for calls to other APIs.
+
+    from django_drf_keycloak_auth.service_tokens import get_service_token
+
+    headers = {"Authorization": f"Bearer {get_service_token(audience='billing')}"}
+"""
+
+import logging
+import threading
+import time
+from functools import partial
+from typing import TYPE_CHECKING, Awaitable, Callable, Dict, Optional, Set, Tuple
+
+from django_drf_keycloak_auth.keycloak_utils import a_request_token, request_token
+from django_drf_keycloak_auth.realms import get_current_realm, get_settings, realm_cache
+from django_drf_keycloak_auth.singleflight import AsyncSingleFlight, SingleFlight
+
+if TYPE_CHECKING:
+    from django_drf_keycloak_auth.resilience import ScheduledCall
+
+logger = logging.getLogger(__name__)
+
+TokenKey = Tuple[Optional[str], Optional[str]]
+
+
+class ServiceToken:
+    __slots__ = ("access_token", "expires_at", "refresh_at", "used")
+
+    def __init__(self, access_token: str, expires_at: float, refresh_at: float):
+        self.access_token = access_token
+        self.expires_at = expires_at
+        self.refresh_at = refresh_at
+        self.used = False
+
+
+class ServiceTokenManager:
+    """
+    Process wide cache of client credentials tokens, one per audience and scope.
+
+    A token is fetched on first use, then refreshed in the background `refresh_margin` seconds before
+    it expires (at most half of its lifetime before), so callers get a cached token without waiting on Keycloak.
+    Tokens not used since their last refresh are left to expire, and fetched again on next use.
+    Concurrent fetches of the same token are coalesced.
+    Refreshes are scheduled with `resilience.run_later`, so no thread is started per token.
+    """
+
+    def __init__(
+        self,
+        fetch_token: Callable[..., dict],
+        a_fetch_token: Callable[..., Awaitable[dict]],
+        refresh_margin: float = 30,
+    ):
+        self.fetch_token = fetch_token
+        self.a_fetch_token = a_fetch_token
+        self.refresh_margin = refresh_margin
+
+        self._tokens: Dict[TokenKey, ServiceToken] = {}
+        self._scheduled: Dict[TokenKey, "ScheduledCall"] = {}
+        self._refreshing: Set[TokenKey] = set()
+        self._lock = threading.Lock()
+        self._flight = SingleFlight()
+        self._async_flight = AsyncSingleFlight()
+
+    @staticmethod
+    def get_key(audience: Optional[str], scope: Optional[str]) -> TokenKey:
+        return audience or None, " ".join(sorted(scope.split())) if scope else None
+
+    def get_token(self, audience: Optional[str] = None, scope: Optional[str] = None) -> str:
+        """
+        Get an access token of the client for `audience` and `scope`.
+
+        return:
+        - The access token
+        - raise KeycloakPostError if it could not be fetched
+        """
+
+        key = self.get_key(audience, scope)
+        token = self._get_cached(key)
+        if token is None:
+            token = self._flight.do(key, self.refresh, key)
+            token.used = True
+        return token.access_token
+
+    async def a_get_token(
+        self, audience: Optional[str] = None, scope: Optional[str] = None
+    ) -> str:
+        """
+        Async version of `get_token`.
+        """
+
+        key = self.get_key(audience, scope)
+        token = self._get_cached(key)
+        if token is None:
+            token = await self._async_flight.do(key, self.a_refresh, key)
+            token.used = True
+        return token.access_token
+
+    def refresh(self, key: TokenKey) -> ServiceToken:
+        """
+        Fetch the token of `key` from Keycloak.
+        """
+
+        return self._store(key, self.fetch_token(**self._get_data(key)))
+
+    async def a_refresh(self, key: TokenKey) -> ServiceToken:
+        """
+        Async version of `refresh`.
+        """
+
+        return self._store(key, await self.a_fetch_token(**self._get_data(key)))
+
+    def refresh_in_background(self, key: TokenKey):
+        """
+        Refresh the token of `key` on the background thread pool, at most once at a time.
+        """
+
+        from django_drf_keycloak_auth.resilience import run_in_background
+
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+
+        run_in_background(self._refresh_quietly, key)
+
+    def clear(self):
+        with self._lock:
+            for scheduled in self._scheduled.values():
+                scheduled.cancel()
+            self._scheduled.clear()
+            self._tokens.clear()
+
+    def _get_cached(self, key: TokenKey) -> Optional[ServiceToken]:
+        token = self._tokens.get(key)
+        if token is None:
+            return None
+
+        now = time.monotonic()
+        if now >= token.expires_at:
+            return None
+        token.used = True
+        # The scheduled refresh failed or did not run, e.g. in a forked process
+        if now >= token.refresh_at:
+            self.refresh_in_background(key)
+        return token
+
+    @staticmethod
+    def _get_data(key: TokenKey) -> dict:
+        audience, scope = key
+        data = {}
+        if audience:
+            data["audience"] = audience
+        if scope:
+            data["scope"] = scope
+        return data
+
+    def _store(self, key: TokenKey, response: dict) -> ServiceToken:
+        from django_drf_keycloak_auth.resilience import run_later
+
+        now = time.monotonic()
+        expires_in = float(response.get("expires_in") or 0)
+        token = ServiceToken(
+            response["access_token"],
+            expires_at=now + expires_in,
+            refresh_at=now + expires_in - min(self.refresh_margin, expires_in / 2),
+        )
+
+        with self._lock:
+            self._tokens[key] = token
+            previous = self._scheduled.pop(key, None)
+            self._scheduled[key] = run_later(
+                token.refresh_at - now, self._scheduled_refresh, key, token
+            )
+        if previous is not None:
+            previous.cancel()
+
+        return token
+
+    def _scheduled_refresh(self, key: TokenKey, token: ServiceToken):
+        with self._lock:
+            if self._tokens.get(key) is not token or not token.used:
+                return
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+
+        self._refresh_quietly(key)
+
+    def _refresh_quietly(self, key: TokenKey):
+        try:
+            self._flight.do(key, self.refresh, key)
+        except Exception:
+            # Callers keep getting the current token until it expires
+            logger.warning("Failed to refresh the service token", exc_info=True)
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
+
+
+@realm_cache
+def get_service_tokens() -> ServiceTokenManager:
+    """
+    Get the service token manager of the client of the current realm.
+    """
+
+    return ServiceTokenManager(
+        fetch_token=get_current_realm().bind(
+            partial(request_token, "client_credentials")
+        ),
+        a_fetch_token=partial(a_request_token, "client_credentials"),
+        refresh_margin=get_settings().KEYCLOAK_SERVICE_TOKEN_REFRESH_MARGIN,
+    )
+
+
+def get_service_token(audience: Optional[str] = None, scope: Optional[str] = None) -> str:
+    """
+    Get a client credentials access token of the current realm's client, see `ServiceTokenManager`.
+    """
+
+    return get_service_tokens().get_token(audience, scope)
+
+
+async def a_get_service_token(
+    audience: Optional[str] = None, scope: Optional[str] = None
+) -> str:
+    """
+    Async version of `get_service_token`.
+    """
+
+    return await get_service_tokens().a_get_token(audience, scope)
@@ -0,0 +1,86 @@
+import asyncio
+import threading
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+
+class _Call:
+    __slots__ = ("event", "result", "error")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    """
+    Coalesce concurrent calls for the same key across threads.
+
+    The first caller of a key runs the function, the other callers arriving while it runs
+    wait for it and get its result, or its exception, instead of running the function themselves.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, _Call] = {}
+
+    def do(self, key: Hashable, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn(*args, **kwargs)
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.event.set()
+
+        return call.result
+
+    def __len__(self) -> int:
+        return len(self._calls)
+
+
+class AsyncSingleFlight:
+    """
+    Coalesce concurrent calls for the same key across asyncio tasks.
+
+    The coroutine of the first caller runs in its own task, so cancelling one of the callers
+    does not cancel the call the others are waiting on.
+    """
+
+    def __init__(self):
+        self._calls: Dict[Tuple[int, Hashable], asyncio.Future] = {}
+
+    async def do(
+        self, key: Hashable, fn: Callable[..., Awaitable[Any]], *args, **kwargs
+    ) -> Any:
+        loop = asyncio.get_running_loop()
+        call_key = (id(loop), key)
+
+        task = self._calls.get(call_key)
+        if task is None:
+            task = loop.create_task(fn(*args, **kwargs))
+            self._calls[call_key] = task
+            task.add_done_callback(lambda _: self._forget(call_key, task))
+
+        return await asyncio.shield(task)
+
+    def _forget(self, call_key: Tuple[int, Hashable], task: asyncio.Future):
+        if self._calls.get(call_key) is task:
+            del self._calls[call_key]
+
+    def __len__(self) -> int:
+        return len(self._calls)
@@ -0,0 +1,130 @@
+import contextlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from typing import Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+from django_drf_keycloak_auth.realms import get_settings, realm_cache
+
+logger = logging.getLogger(__name__)
+
+# Realms may share a snapshot file, their updates of it are serialized
+_write_lock = threading.Lock()
+
+
+class RealmSnapshot:
+    """
+    Copy on disk of the realm documents fetched from Keycloak (discovery document and JWKS).
+
+    New processes read it once at startup, so they can validate tokens before Keycloak answers,
+    and revalidate the documents in the background. The file is replaced atomically,
+    so workers sharing it never read a partial write. Documents are stored per issuer,
+    so the realms of a deployment can share the file. Updates are serialized between processes
+    with a lock on "<path>.lock" (where `fcntl` is available), so concurrent writers do not drop
+    each other's documents.
+    """
+
+    VERSION = 1
+
+    def __init__(self, path: str, issuer: Optional[str]):
+        self.path = path
+        self.issuer = issuer
+
+    def load(self, name: str) -> Tuple[Optional[dict], Optional[float]]:
+        """
+        Get a document of the snapshot.
+        It expires a TTL after it was saved, not after it is loaded, see `expires_at`.
+
+        return:
+        - The document and the time it was saved at, (None, None) if not in the snapshot
+        """
+
+        entry = self._read().get(self.issuer, {}).get(name)
+        if not entry:
+            return None, None
+        return entry["document"], entry["saved_at"]
+
+    def save(self, name: str, document: dict):
+        """
+        Store a document in the snapshot. Errors are logged, the snapshot is only an optimization.
+        """
+
+        directory = os.path.dirname(os.path.abspath(self.path))
+        try:
+            os.makedirs(directory, exist_ok=True)
+            with self._lock():
+                issuers = self._read()
+                documents = issuers.setdefault(self.issuer, {})
+                documents[name] = {"saved_at": time.time(), "document": document}
+                data = {"version": self.VERSION, "issuers": issuers}
+
+                fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".keycloak-snapshot-")
+                try:
+                    with os.fdopen(fd, "w") as f:
+                        json.dump(data, f)
+                        f.flush()
+                        os.fsync(f.fileno())
+                    os.replace(tmp_path, self.path)
+                except BaseException:
+                    os.unlink(tmp_path)
+                    raise
+        except Exception:
+            logger.warning("Failed to write the snapshot %s", self.path, exc_info=True)
+
+    @contextlib.contextmanager
+    def _lock(self):
+        with _write_lock:
+            if fcntl is None:
+                yield
+                return
+            # The snapshot itself is replaced on every write, lock a file that stays in place
+            with open(f"{self.path}.lock", "a") as lock_file:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+    def _read(self) -> dict:
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return {}
+        except Exception:
+            logger.warning("Failed to read the snapshot %s", self.path, exc_info=True)
+            return {}
+
+        if data.get("version") != self.VERSION:
+            return {}
+        return data.get("issuers", {})
+
+
+def expires_at(saved_at: float, ttl: float) -> float:
+    """
+    Get the `time.monotonic()` time at which a document saved at `saved_at` (`time.time()`) expires.
+    """
+
+    return time.monotonic() + ttl - max(0.0, time.time() - saved_at)
+
+
+@realm_cache
+def get_snapshot() -> Optional[RealmSnapshot]:
+    """
+    Get the snapshot of the documents of the current realm, None if not configured.
+    """
+
+    realm_settings = get_settings()
+    path = realm_settings.KEYCLOAK_SNAPSHOT_PATH
+    if not path:
+        return None
+
+    return RealmSnapshot(path, issuer=realm_settings.KEYCLOAK_ISSUER)
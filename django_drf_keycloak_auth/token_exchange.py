@@ -0,0 +1,110 @@
+import time
+from typing import Optional
+
+from django_drf_keycloak_auth.cache import TTLCache, hash_token
+from django_drf_keycloak_auth.keycloak_utils import (
+    a_exchange_token,
+    exchange_token,
+    get_metrics,
+)
+from django_drf_keycloak_auth.realms import get_settings, realm_cache
+from django_drf_keycloak_auth.singleflight import AsyncSingleFlight, SingleFlight
+
+# Concurrent exchanges of the same token for the same audience and scope, keyed by cache key
+exchange_flight = SingleFlight()
+async_exchange_flight = AsyncSingleFlight()
+
+
+@realm_cache
+def get_exchange_cache() -> TTLCache:
+    """
+    Get the cache of the tokens exchanged in the current realm, keyed by `get_exchange_key`.
+    """
+
+    realm_settings = get_settings()
+    return TTLCache(
+        max_size=realm_settings.KEYCLOAK_TOKEN_EXCHANGE_CACHE_MAX_SIZE,
+        ttl=realm_settings.KEYCLOAK_TOKEN_EXCHANGE_CACHE_TTL,
+        name="token_exchange",
+        metrics=get_metrics(),
+    )
+
+
+def get_exchange_key(subject_token: str, audience: str, scope: Optional[str]) -> str:
+    scope = " ".join(sorted(scope.split())) if scope else ""
+    return hash_token(f"{subject_token}\n{audience}\n{scope}")
+
+
+def get_downstream_token(
+    subject_token: str, audience: str, scope: Optional[str] = None
+) -> str:
+    """
+    Get a token of the user of `subject_token` for a downstream service (`audience`), with token exchange.
+
+    The exchanged token is kept until it is about to expire, at most KEYCLOAK_TOKEN_EXCHANGE_CACHE_TTL seconds,
+    so calls to the same service on behalf of the same token exchange it once.
+    Concurrent exchanges of the same token are coalesced.
+
+    return:
+    - The access token
+    - raise KeycloakPostError if failed
+    """
+
+    key = get_exchange_key(subject_token, audience, scope)
+    exchange_cache = get_exchange_cache()
+    if exchange_cache.enabled:
+        access_token = exchange_cache.get(key)
+        if access_token is not None:
+            return access_token
+
+    return exchange_flight.do(
+        key, _exchange_and_cache, key, subject_token, audience, scope
+    )
+
+
+async def a_get_downstream_token(
+    subject_token: str, audience: str, scope: Optional[str] = None
+) -> str:
+    """
+    Async version of `get_downstream_token`.
+    """
+
+    key = get_exchange_key(subject_token, audience, scope)
+    exchange_cache = get_exchange_cache()
+    if exchange_cache.enabled:
+        access_token = exchange_cache.get(key)
+        if access_token is not None:
+            return access_token
+
+    return await async_exchange_flight.do(
+        key, _a_exchange_and_cache, key, subject_token, audience, scope
+    )
+
+
+def _exchange_and_cache(
+    key: str, subject_token: str, audience: str, scope: Optional[str]
+) -> str:
+    token = exchange_token(subject_token, audience, scope)
+    _cache(key, token)
+    return token["access_token"]
+
+
+async def _a_exchange_and_cache(
+    key: str, subject_token: str, audience: str, scope: Optional[str]
+) -> str:
+    token = await a_exchange_token(subject_token, audience, scope)
+    _cache(key, token)
+    return token["access_token"]
+
+
+def _cache(key: str, token: dict):
+    exchange_cache = get_exchange_cache()
+    if not exchange_cache.enabled:
+        return
+
+    # Stop serving the token a little before it expires, so that it is still valid downstream
+    expires_in = float(token.get("expires_in") or 0)
+    margin = min(get_settings().KEYCLOAK_TOKEN_EXCHANGE_EXPIRY_MARGIN, expires_in / 2)
+    exchange_cache.set(
+        key, token["access_token"], expires_at=time.time() + expires_in - margin
+    )
@@ -0,0 +1,282 @@
+import asyncio
+import os
+import threading
+import time
+import weakref
+from collections import Counter
+from typing import Dict, Optional
+
+import httpx
+
+from django_drf_keycloak_auth.metrics import MetricsSink, NullSink
+from django_drf_keycloak_auth.resilience import CircuitBreaker, CircuitOpenError
+
+
+class KeycloakTransport:
+    """
+    Pooled HTTP transport shared by all calls to Keycloak.
+
+    One httpx.Client per process and one httpx.AsyncClient per event loop are created lazily,
+    so connections (and TLS sessions) are kept alive and reused between calls.
+    Async connections can not outlive their event loop: close the client of a short-lived loop,
+    e.g. one created by `async_to_sync`, with `aclose` before the loop ends.
+    After a fork (e.g. gunicorn prefork) the child process builds its own clients
+    instead of sharing the sockets of the parent.
+
+    Every request names its operation ("introspect", "token", ...), which selects its timeout
+    and is used to count requests and errors.
+
+    With a circuit breaker, requests fail fast with CircuitOpenError while Keycloak is failing or slow.
+    Connection errors, timeouts and 5xx responses count as failures.
+
+    The count, outcome and latency of every request are also sent to the metrics sink.
+    """
+
+    def __init__(
+        self,
+        max_connections: int = 100,
+        max_keepalive_connections: int = 20,
+        keepalive_expiry: float = 30,
+        http2: bool = False,
+        connect_timeout: float = 5,
+        timeout: float = 10,
+        operation_timeouts: Optional[Dict[str, float]] = None,
+        transport: Optional[httpx.BaseTransport] = None,
+        async_transport: Optional[httpx.AsyncBaseTransport] = None,
+        breaker: Optional[CircuitBreaker] = None,
+        metrics: Optional[MetricsSink] = None,
+    ):
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry,
+        )
+        self.http2 = http2
+        self.connect_timeout = connect_timeout
+        self.timeout = httpx.Timeout(timeout, connect=connect_timeout)
+        self.operation_timeouts = {
+            operation: httpx.Timeout(value, connect=connect_timeout)
+            for operation, value in (operation_timeouts or {}).items()
+        }
+
+        # Custom transports, e.g. httpx.MockTransport for tests and benchmarks
+        self.transport = transport
+        self.async_transport = async_transport
+        self.breaker = breaker
+        self.metrics = metrics or NullSink()
+
+        self._lock = threading.Lock()
+        # Guards the counters, which are updated by every request of every thread
+        self._counters_lock = threading.Lock()
+        self._pid = os.getpid()
+        self._client: Optional[httpx.Client] = None
+        # Event loop -> httpx.AsyncClient
+        self._async_clients = weakref.WeakKeyDictionary()
+
+        self.requests = Counter()
+        self.errors = Counter()
+        self.in_flight = 0
+
+    @property
+    def client(self) -> httpx.Client:
+        self._check_pid()
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    self._client = httpx.Client(
+                        limits=self.limits,
+                        http2=self.http2,
+                        timeout=self.timeout,
+                        transport=self.transport,
+                    )
+        return self._client
+
+    @property
+    def async_client(self) -> httpx.AsyncClient:
+        """
+        The async client of the running event loop.
+        """
+
+        self._check_pid()
+        loop = asyncio.get_running_loop()
+        client = self._async_clients.get(loop)
+        if client is None:
+            with self._lock:
+                client = self._async_clients.get(loop)
+                if client is None:
+                    client = self._async_clients[loop] = httpx.AsyncClient(
+                        limits=self.limits,
+                        http2=self.http2,
+                        timeout=self.timeout,
+                        transport=self.async_transport,
+                    )
+        return client
+
+    def get_timeout(self, operation: str) -> httpx.Timeout:
+        return self.operation_timeouts.get(operation, self.timeout)
+
+    def request(self, operation: str, method: str, url: str, **kwargs) -> httpx.Response:
+        """
+        Send a request to Keycloak on the pooled client.
+        """
+
+        kwargs.setdefault("timeout", self.get_timeout(operation))
+        self._before_call(operation)
+
+        self._count_start(operation)
+        start = time.monotonic()
+        try:
+            response = self.client.request(method, url, **kwargs)
+        except Exception as e:
+            self._count_end(operation, failed=True)
+            self._record(operation, False, type(e).__name__, start)
+            raise
+        except BaseException:
+            self._count_end(operation)
+            if self.breaker is not None:
+                self.breaker.abort()
+            raise
+        self._count_end(operation)
+
+        self._record(
+            operation, response.status_code < 500, self._outcome(response), start
+        )
+        return response
+
+    async def a_request(
+        self, operation: str, method: str, url: str, **kwargs
+    ) -> httpx.Response:
+        """
+        Async version of `request`.
+        """
+
+        kwargs.setdefault("timeout", self.get_timeout(operation))
+        self._before_call(operation)
+
+        self._count_start(operation)
+        start = time.monotonic()
+        try:
+            response = await self.async_client.request(method, url, **kwargs)
+        except Exception as e:
+            self._count_end(operation, failed=True)
+            self._record(operation, False, type(e).__name__, start)
+            raise
+        except BaseException:
+            self._count_end(operation)
+            if self.breaker is not None:
+                self.breaker.abort()
+            raise
+        self._count_end(operation)
+
+        self._record(
+            operation, response.status_code < 500, self._outcome(response), start
+        )
+        return response
+
+    def stats(self) -> dict:
+        """
+        Get the request counters and the state of the connection pools.
+        """
+
+        with self._counters_lock:
+            in_flight = self.in_flight
+            requests = dict(self.requests)
+            errors = dict(self.errors)
+
+        return {
+            "pid": self._pid,
+            "in_flight": in_flight,
+            "requests": requests,
+            "errors": errors,
+            "breaker": self.breaker.snapshot() if self.breaker is not None else None,
+            "pool": {
+                "max_connections": self.limits.max_connections,
+                "max_keepalive_connections": self.limits.max_keepalive_connections,
+                "connections": self._count_connections(self._client),
+                "async_connections": sum(
+                    self._count_connections(client) or 0
+                    for client in list(self._async_clients.values())
+                ),
+            },
+        }
+
+    def close(self):
+        with self._lock:
+            client, self._client = self._client, None
+        if client is not None:
+            client.close()
+
+    async def aclose(self):
+        """
+        Close the async client of the running event loop.
+        """
+
+        with self._lock:
+            client = self._async_clients.pop(asyncio.get_running_loop(), None)
+        if client is not None:
+            await client.aclose()
+
+    def _before_call(self, operation: str):
+        if self.breaker is None:
+            return
+        try:
+            self.breaker.before_call()
+        except CircuitOpenError:
+            if self.metrics.enabled:
+                self.metrics.increment(
+                    "keycloak_requests_total",
+                    tags={"operation": operation, "outcome": "circuit_open"},
+                )
+            raise
+
+    def _count_start(self, operation: str):
+        with self._counters_lock:
+            self.requests[operation] += 1
+            self.in_flight += 1
+
+    def _count_end(self, operation: str, failed: bool = False):
+        with self._counters_lock:
+            self.in_flight -= 1
+            if failed:
+                self.errors[operation] += 1
+
+    def _record(self, operation: str, success: bool, outcome: str, start: float):
+        duration = time.monotonic() - start
+        if self.breaker is not None:
+            self.breaker.record(success, duration)
+        if self.metrics.enabled:
+            self.metrics.increment(
+                "keycloak_requests_total",
+                tags={"operation": operation, "outcome": outcome},
+            )
+            self.metrics.observe(
+                "keycloak_request_duration_seconds",
+                duration,
+                tags={"operation": operation},
+            )
+
+    @staticmethod
+    def _outcome(response: httpx.Response) -> str:
+        if response.status_code < 400:
+            return "ok"
+        return f"{response.status_code // 100}xx"
+
+    def _check_pid(self):
+        pid = os.getpid()
+        if pid != self._pid:
+            # Forked: the connections belong to the parent process, drop them without closing
+            with self._lock:
+                self._pid = pid
+                self._client = None
+                self._async_clients.clear()
+                with self._counters_lock:
+                    self.requests.clear()
+                    self.errors.clear()
+                    self.in_flight = 0
+
+    @staticmethod
+    def _count_connections(client) -> Optional[int]:
+        # httpx does not expose the pool, read it from httpcore when available
+        pool = getattr(getattr(client, "_transport", None), "_pool", None)
+        connections = getattr(pool, "connections", None)
+        return len(connections) if connections is not None else None
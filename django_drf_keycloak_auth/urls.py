@@ -15,20 +15,37 @@ Including another URLconf
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
 
-from django.urls import path
+from django.apps import apps
+from django.urls import include, path
+
+from . import views
 
 # Do not remove this import.
 #
-# This import ensures that drf-spectacular registers the Keycloak authentication scheme when the module is loaded
-import django_drf_keycloak_auth.schema
-
-from . import views
+# This import ensures that drf-spectacular registers the Keycloak authentication scheme when the module is loaded.
+# It is skipped when drf-spectacular is not an installed app, as nothing would generate the schema.
+if apps.is_installed("drf_spectacular"):
+    import django_drf_keycloak_auth.schema
 
-urlpatterns = [
+oauth2_urlpatterns = [
     path("oauth2/login/", views.LoginView.as_view(), name="login"),
     path("oauth2/token/", views.GenerateTokenView.as_view(), name="login"),
     path("oauth2/refresh/", views.RefreshTokenView.as_view(), name="refresh_token"),
     path("oauth2/revoke/", views.RevokeTokenView.as_view(), name="revoke_token"),
+    path(
+        "oauth2/revoke/bulk/",
+        views.BulkRevokeTokenView.as_view(),
+        name="bulk_revoke_token",
+    ),
     path("oauth2/logout/", views.LogoutView.as_view(), name="logout"),
     path("oauth2/callback/", views.CallbackView.as_view(), name="callback"),
 ]
+
+urlpatterns = [
+    *oauth2_urlpatterns,
+    # The same endpoints for one of the realms of KEYCLOAK_REALMS, e.g. "realms/acme/oauth2/token/",
+    # named in their own namespace, e.g. reverse("keycloak_realm:refresh_token", kwargs={"realm": "acme"})
+    path("realms/<str:realm>/", include((oauth2_urlpatterns, "keycloak_realm"))),
+    path("keycloak/metrics/", views.MetricsView.as_view(), name="keycloak_metrics"),
+    path("keycloak/ready/", views.ReadinessView.as_view(), name="keycloak_ready"),
+]
@@ -1,16 +1,14 @@
+import asyncio
 import secrets
 
+from asgiref.sync import async_to_sync
+from django.core.exceptions import BadRequest, ImproperlyConfigured
+from django.http import Http404, HttpResponse
 from django.shortcuts import redirect
 from django.utils.decorators import method_decorator
 from django.views.decorators.csrf import csrf_exempt
-from drf_spectacular.utils import (
-    OpenApiExample,
-    OpenApiParameter,
-    OpenApiTypes,
-    extend_schema,
-)
-from keycloak.exceptions import KeycloakPostError
 from rest_framework import permissions, status
+from rest_framework.exceptions import APIException
 from rest_framework.parsers import JSONParser
 from rest_framework.renderers import JSONRenderer
 from rest_framework.request import Request
@@ -18,11 +16,35 @@ from rest_framework.response import Response
 from rest_framework.views import APIView, Request, Response
 
 from django_drf_keycloak_auth.keycloak_utils import (
+    InvalidNonceError,
+    a_revoke_token,
+    get_authorization_url,
     get_keycloak_error_description,
-    get_keycloak_openid,
+    get_keycloak_transport,
+    get_login_userinfo,
+    get_metrics_sink,
+    get_token_payload,
+    logout,
+    request_token,
     revoke_token,
 )
+from django_drf_keycloak_auth.metrics import PrometheusSink
+from django_drf_keycloak_auth.openapi import (
+    OpenApiExample,
+    OpenApiParameter,
+    OpenApiTypes,
+    extend_schema,
+)
+from django_drf_keycloak_auth.realms import get_realm_registry, get_settings, use_realm
+from django_drf_keycloak_auth.refresh import discard_refresh, refresh_tokens
+from django_drf_keycloak_auth.revocation import (
+    a_get_verified_claims,
+    get_revocation_list,
+    get_verified_claims,
+)
 from django_drf_keycloak_auth.serializers import (
+    BulkRevokeTokenRequestSerializer,
+    BulkRevokeTokenResponseSerializer,
     CallbackRequestSerializer,
     ErrorResponseSerializer,
     GenerateTokenRequestSerializer,
@@ -33,9 +55,39 @@ from django_drf_keycloak_auth.serializers import (
     RefreshTokenTokenInfoResponseSerializer,
     RevokeTokenRequestSerializer,
 )
+from django_drf_keycloak_auth.warmup import Warmup, get_warmup
 
 
-class LoginView(APIView):
+class RealmMixin:
+    """
+    Run the view in the realm named by the "realm" URL kwarg or the X-Keycloak-Realm header,
+    otherwise in the default realm.
+    Returns 404 if there is no such realm, and 400 if none is selected and there is no default realm.
+    """
+
+    realm_header = "HTTP_X_KEYCLOAK_REALM"
+
+    def dispatch(self, request, *args, **kwargs):
+        name = kwargs.pop("realm", None) or request.META.get(self.realm_header)
+        registry = get_realm_registry()
+        if not name:
+            try:
+                realm = registry.default
+            except ImproperlyConfigured:
+                raise BadRequest(
+                    "No Keycloak realm selected, set the X-Keycloak-Realm header"
+                )
+        else:
+            try:
+                realm = registry.get(name)
+            except LookupError:
+                raise Http404(f"Unknown realm: {name}")
+
+        with use_realm(realm):
+            return super().dispatch(request, *args, **kwargs)
+
+
+class LoginView(RealmMixin, APIView):
 
     # No authentication required
     permission_classes = [permissions.AllowAny]
@@ -132,8 +184,7 @@ class LoginView(APIView):
         # code_challenge = data["code_challenge"]
 
         # 2️⃣ Build an authorization URL
-        keycloak_openid = get_keycloak_openid()
-        auth_url = keycloak_openid.auth_url(
+        auth_url = get_authorization_url(
             redirect_uri=redirect_uri,
             nonce=nonce,
             state=state,
@@ -147,7 +198,7 @@ class LoginView(APIView):
 
 
 @method_decorator(csrf_exempt, name="dispatch")
-class GenerateTokenView(APIView):
+class GenerateTokenView(RealmMixin, APIView):
 
     # No authentication required
     permission_classes = [permissions.AllowAny]
@@ -171,6 +222,14 @@ class GenerateTokenView(APIView):
                 required=True,
                 description="The code is the value returned by the Keycloak server after successful authentication",
             ),
+            OpenApiParameter(
+                name="nonce",
+                type=OpenApiTypes.STR,
+                location=OpenApiParameter.QUERY,
+                required=False,
+                description="The nonce sent to the login, checked against the id_token when userinfo is built from it "
+                "(required with KEYCLOAK_USERINFO_FROM_ID_TOKEN)",
+            ),
             # OpenApiParameter(
             #     name="code_verifier",
             #     type=OpenApiTypes.STR,
@@ -207,17 +266,16 @@ class GenerateTokenView(APIView):
     )
     def get(self, request: Request):
 
+        from keycloak.exceptions import KeycloakPostError
+
         # 1️⃣ Validate request query params
         serializer = GenerateTokenRequestSerializer(data=request.query_params)
         serializer.is_valid(raise_exception=True)
         data = serializer.validated_data
 
-        # 2️⃣ Get Keycloak OpenID client
-        keycloak_openid = get_keycloak_openid()
-
         try:
-            # 3️⃣ Get token by code
-            token: dict = keycloak_openid.token(
+            # 2️⃣ Get token by code
+            token: dict = request_token(
                 grant_type="authorization_code",
                 redirect_uri=data["redirect_uri"],
                 code=data["code"],
@@ -230,25 +288,25 @@ class GenerateTokenView(APIView):
             )
 
         try:
-            # 4️⃣ Get user info
-            userinfo = keycloak_openid.userinfo(token.get("access_token"))
-        except Exception:
-            userinfo = {}
+            # 3️⃣ Get user info
+            userinfo = get_login_userinfo(token, data.get("nonce"))
+        except InvalidNonceError as e:
+            return Response({"detail": str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
-        # 5️⃣ Combine the returned data
+        # 4️⃣ Combine the returned data
         response_data = {
             **token,
             "userinfo": userinfo,
         }
 
-        # 6️⃣ Serialize response data
+        # 5️⃣ Serialize response data
         response_serializer = GenerateTokenResponseSerializer(data=response_data)
         response_serializer.is_valid(raise_exception=True)
 
         return Response(response_serializer.data, status=status.HTTP_200_OK)
 
 
-class RefreshTokenView(APIView):
+class RefreshTokenView(RealmMixin, APIView):
 
     # No authentication required
     permission_classes = [permissions.AllowAny]
@@ -284,17 +342,16 @@ class RefreshTokenView(APIView):
     )
     def post(self, request: Request):
 
+        from keycloak.exceptions import KeycloakPostError
+
         # 1️⃣ Validate request body data
         serializer = RefreshTokenRequestSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
         refresh_token = serializer.validated_data["refresh_token"]
 
-        # 2️⃣ Get Keycloak OpenID client
-        keycloak_openid = get_keycloak_openid()
-
         try:
-            # 3️⃣ Get access token by refresh token
-            token: dict = keycloak_openid.refresh_token(refresh_token)
+            # 2️⃣ Get access token by refresh token, once for concurrent refreshes of the same token
+            token: dict = refresh_tokens(refresh_token)
         except KeycloakPostError as e:
             return Response(
                 {
@@ -309,7 +366,7 @@ class RefreshTokenView(APIView):
         return Response(response_serializer.data, status=status.HTTP_200_OK)
 
 
-class RevokeTokenView(APIView):
+class RevokeTokenView(RealmMixin, APIView):
     """
     Stateless endpoint to revoke an access_token or refresh_token in Keycloak.
 
@@ -321,6 +378,8 @@ class RevokeTokenView(APIView):
     Behavior:
     - Returns 204 No Content if the revoke call succeeded.
     - Returns 400 if failed
+    - With KEYCLOAK_REVOCATION_CACHE_ALIAS, the token (and the session of a refresh token)
+      is also added to the revocation denylist
     """
 
     # No authentication required
@@ -364,13 +423,154 @@ class RevokeTokenView(APIView):
         token = serializer.validated_data["token"]
         token_type_hint = serializer.validated_data["token_type_hint"]
 
+        # Verify the token before it is revoked, only verified claims may deny its "jti" or session
+        revocation_list = get_revocation_list()
+        if revocation_list is not None:
+            claims = get_verified_claims(token, token_type_hint)
+
+        # Recent refreshes of the token must not be served anymore, even if Keycloak rejects it
+        if token_type_hint == "refresh_token":
+            discard_refresh(token)
+
         # 5️⃣ Revoke access token
         revoke_token(token, token_type_hint)
 
+        # 6️⃣ Deny the token on all nodes, as it may still be validated locally or from a cache
+        if revocation_list is not None:
+            revocation_list.revoke_token(token, claims)
+
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 
-class LogoutView(APIView):
+class BulkRevokeTokenView(RealmMixin, APIView):
+    """
+    Endpoint to revoke many access_tokens or refresh_tokens in Keycloak at once,
+    e.g. when offboarding a user or a compromised device.
+
+    Usage examples:
+    POST /oauth2/revoke/bulk/
+    Body: {"tokens": [{"token": "<refresh_token>", "token_type_hint": "refresh_token"}, ...]}
+
+    Behavior:
+    - The tokens are revoked concurrently over the pooled async client,
+      at most KEYCLOAK_BULK_REVOKE_CONCURRENCY at a time
+    - The view is synchronous, so every request runs in its own event loop, with an async client
+      that is closed at the end of the request: connections are only reused within a request
+    - Returns 200 with the result of every token, in the order of the request
+    - Returns 400 if the body is invalid, 401 or 403 if the caller is not authenticated
+
+    Every token costs up to two calls to Keycloak, so the caller must be authenticated.
+    Subclass it with stricter `permission_classes`, e.g. `HasRole("admin")`.
+    """
+
+    permission_classes = [permissions.IsAuthenticated]
+    parser_classes = [JSONParser]
+    renderer_classes = [JSONRenderer]
+
+    @extend_schema(
+        request=BulkRevokeTokenRequestSerializer,
+        responses={
+            200: BulkRevokeTokenResponseSerializer,
+            400: [ErrorResponseSerializer],
+        },
+        examples=[
+            OpenApiExample(
+                "Partial failure",
+                summary="One of the tokens could not be revoked",
+                value={
+                    "results": [
+                        {"index": 0, "revoked": True},
+                        {"index": 1, "revoked": False, "detail": "Invalid token"},
+                    ]
+                },
+                request_only=False,
+                response_only=True,
+                status_codes=[status.HTTP_200_OK],
+            ),
+        ],
+        description="Revoke many access or refresh tokens in Keycloak concurrently",
+    )
+    def post(self, request: Request):
+
+        # 1️⃣ Validate request body data
+        serializer = BulkRevokeTokenRequestSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        items = serializer.validated_data["tokens"]
+
+        # Recent refreshes of the tokens must not be served anymore, even if Keycloak rejects them
+        for item in items:
+            if item.get("token_type_hint") in (None, "refresh_token"):
+                discard_refresh(item["token"])
+
+        # 2️⃣ Revoke all tokens concurrently
+        revocation_list = get_revocation_list()
+        # In a new event loop even under ASGI, so that its async client can be closed with it
+        outcomes = async_to_sync(self.revoke_all, force_new_loop=True)(
+            items, revocation_list
+        )
+
+        # 3️⃣ Deny the revoked tokens on all nodes, and collect the results
+        results = []
+        for index, (item, outcome) in enumerate(zip(items, outcomes)):
+            if isinstance(outcome, BaseException):
+                results.append(
+                    {
+                        "index": index,
+                        "revoked": False,
+                        "detail": self.get_error_description(outcome),
+                    }
+                )
+                continue
+
+            if revocation_list is not None:
+                revocation_list.revoke_token(item["token"], outcome)
+            results.append({"index": index, "revoked": True})
+
+        return Response({"results": results}, status=status.HTTP_200_OK)
+
+    async def revoke_all(self, items: list, revocation_list) -> list:
+        """
+        Revoke the tokens concurrently.
+
+        return:
+        - For every token, its verified claims (None if not needed or not verified) if revoked,
+          or the exception raised if not
+        """
+
+        concurrency = get_settings().KEYCLOAK_BULK_REVOKE_CONCURRENCY
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def revoke(item: dict):
+            async with semaphore:
+                claims = None
+                if revocation_list is not None:
+                    claims = await a_get_verified_claims(
+                        item["token"], item["token_type_hint"]
+                    )
+                await a_revoke_token(item["token"], item["token_type_hint"])
+                return claims
+
+        try:
+            return await asyncio.gather(
+                *(revoke(item) for item in items), return_exceptions=True
+            )
+        finally:
+            # The event loop ends with the request, its client would never be used again
+            await get_keycloak_transport().aclose()
+
+    @staticmethod
+    def get_error_description(error: BaseException) -> str:
+        if isinstance(error, APIException):
+            detail = error.detail
+            return str(detail[0] if isinstance(detail, list) and detail else detail)
+        import httpx
+
+        if isinstance(error, httpx.HTTPStatusError):
+            return f"Keycloak responded with status {error.response.status_code}"
+        return "Failed to revoke token"
+
+
+class LogoutView(RealmMixin, APIView):
 
     # No authentication required
     permission_classes = [permissions.AllowAny]
@@ -406,27 +606,36 @@ class LogoutView(APIView):
     )
     def post(self, request: Request):
 
+        from keycloak.exceptions import KeycloakPostError
+
         # 1️⃣ Validate request body data
         serializer = LogoutRequestSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
         refresh_token = serializer.validated_data["refresh_token"]
 
-        # 2️⃣ Get Keycloak OpenID client
-        keycloak_openid = get_keycloak_openid()
+        # Recent refreshes of the token must not be served anymore, even if Keycloak rejects it
+        discard_refresh(refresh_token)
 
         try:
-            # 3️⃣ Logout by refresh token
-            keycloak_openid.logout(refresh_token)
+            # 2️⃣ Logout by refresh token
+            logout(refresh_token)
         except KeycloakPostError as e:
             return Response(
                 {"detail": f"Failed to logout: {get_keycloak_error_description(e)}"},
                 status=status.HTTP_400_BAD_REQUEST,
             )
 
+        # 3️⃣ Deny the access tokens of the session on all nodes.
+        # Keycloak accepted the refresh token, so its session id can be trusted.
+        revocation_list = get_revocation_list()
+        if revocation_list is not None:
+            claims = get_token_payload(refresh_token)
+            revocation_list.revoke_session(claims.get("sid"), claims.get("exp"))
+
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 
-class CallbackView(APIView):
+class CallbackView(RealmMixin, APIView):
 
     # No authentication required
     permission_classes = [permissions.AllowAny]
@@ -464,17 +673,16 @@ class CallbackView(APIView):
     )
     def get(self, request: Request):
 
+        from keycloak.exceptions import KeycloakPostError
+
         # 1️⃣ Validate request query params
         serializer = CallbackRequestSerializer(data=request.query_params)
         serializer.is_valid(raise_exception=True)
         data = serializer.validated_data
 
-        # 2️⃣ Get Keycloak OpenID client
-        keycloak_openid = get_keycloak_openid()
-
         try:
-            # 3️⃣ Get token by code
-            token: dict = keycloak_openid.token(
+            # 2️⃣ Get token by code
+            token: dict = request_token(
                 code=data["code"],
                 grant_type="authorization_code",
                 redirect_uri="http://localhost:3000/auth/callback",
@@ -486,19 +694,83 @@ class CallbackView(APIView):
             )
 
         try:
-            # 4️⃣ Get user info
-            userinfo = keycloak_openid.userinfo(token.get("access_token"))
-        except Exception:
-            userinfo = {}
+            # 3️⃣ Get user info
+            userinfo = get_login_userinfo(token, data.get("nonce"))
+        except InvalidNonceError as e:
+            return Response({"detail": str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
-        # 5️⃣ Combine the returned data
+        # 4️⃣ Combine the returned data
         response_data = {
             **token,
             "userinfo": userinfo,
         }
 
-        # 6️⃣ Serialize response data
+        # 5️⃣ Serialize response data
         response_serializer = GenerateTokenResponseSerializer(data=response_data)
         response_serializer.is_valid(raise_exception=True)
 
         return Response(response_serializer.data, status=status.HTTP_200_OK)
+
+
+class MetricsView(APIView):
+    """
+    Prometheus scrape endpoint of the Keycloak metrics, enabled by KEYCLOAK_METRICS=prometheus.
+
+    Behavior:
+    - Returns the metrics in the Prometheus text format
+    - Returns 404 if the metrics sink is not PrometheusSink
+
+    Expose it on an internal network only, or subclass it with stricter `permission_classes`.
+    """
+
+    # No authentication required, and scrapes are not counted as authentications
+    authentication_classes = []
+    permission_classes = [permissions.AllowAny]
+
+    @extend_schema(exclude=True)
+    def get(self, request: Request):
+
+        metrics = get_metrics_sink()
+        if not isinstance(metrics, PrometheusSink):
+            return Response(
+                {"detail": "Prometheus metrics are not enabled."},
+                status=status.HTTP_404_NOT_FOUND,
+            )
+
+        prometheus_client = metrics.prometheus_client
+        return HttpResponse(
+            prometheus_client.generate_latest(metrics.registry),
+            content_type=prometheus_client.CONTENT_TYPE_LATEST,
+        )
+
+
+class ReadinessView(APIView):
+    """
+    Readiness probe: the process answers requests at full speed once the Keycloak warm-up passed.
+
+    Behavior:
+    - Starts the warm-up if it was not started yet. A failed warm-up is not started again by the probe,
+      it retries on its own backoff schedule
+    - Returns 200 with the checks of every realm once the warm-up passed
+    - Returns 503 with its state otherwise
+    """
+
+    # No authentication required, and probes are not counted as authentications
+    authentication_classes = []
+    permission_classes = [permissions.AllowAny]
+
+    @extend_schema(exclude=True)
+    def get(self, request: Request):
+
+        warmup = get_warmup()
+        warmup.start(again=False)
+
+        state = warmup.snapshot()
+        return Response(
+            state,
+            status=(
+                status.HTTP_200_OK
+                if state["status"] == Warmup.READY
+                else status.HTTP_503_SERVICE_UNAVAILABLE
+            ),
+        )
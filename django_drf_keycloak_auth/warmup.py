@@ -0,0 +1,226 @@
+"""
+Warm-up of the Keycloak state of a process before it serves traffic.
+
+The first requests after a deploy would otherwise pay for building the client, DNS, TLS handshakes
+and fetching the discovery document and the realm keys. The warm-up does all of it up front for every
+realm, then checks the result, and the readiness probe (`keycloak/ready/`) only answers 200 once it passed.
+A failed warm-up is retried in the background with an exponential backoff.
+"""
+
+import contextvars
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import cache
+from typing import TYPE_CHECKING, Dict, Optional
+
+from django_drf_keycloak_auth.keycloak_utils import (
+    get_discovery,
+    get_jwks,
+    get_keycloak_openid,
+    get_keycloak_transport,
+    get_well_known,
+)
+from django_drf_keycloak_auth.realms import get_realm_registry, get_settings, use_realm
+
+if TYPE_CHECKING:
+    from django_drf_keycloak_auth.resilience import ScheduledCall
+
+logger = logging.getLogger(__name__)
+
+
+class WarmupError(Exception):
+    """
+    A realm failed the self-check of the warm-up.
+    """
+
+
+def warm_up_realm() -> dict:
+    """
+    Warm up the current realm and check it can validate tokens.
+
+    return:
+    - The result of the checks
+    - raise an exception if the realm can not validate tokens
+    """
+
+    realm_settings = get_settings()
+    get_keycloak_openid()
+    get_keycloak_transport()
+    discovery = get_discovery()
+    jwks = get_jwks()
+
+    result = {"ok": True, "keycloak": "ok"}
+    try:
+        # Concurrent requests, so that as many connections are opened and then kept alive in the pool
+        connections = max(realm_settings.KEYCLOAK_WARMUP_CONNECTIONS - 1, 0)
+        if connections:
+            with ThreadPoolExecutor(max_workers=connections) as executor:
+                futures = [
+                    executor.submit(contextvars.copy_context().run, get_well_known)
+                    for _ in range(connections)
+                ]
+                for future in futures:
+                    future.result()
+        discovery.refresh()
+        jwks.refresh()
+    except Exception as e:
+        # Tokens can still be validated locally with the documents of the snapshot
+        if realm_settings.KEYCLOAK_AUTH_MODE != "local" or not jwks.key_ids:
+            raise
+        logger.warning("Warming up without Keycloak, from the snapshot", exc_info=True)
+        result["keycloak"] = f"{type(e).__name__}: {e}"
+
+    issuer = discovery.get().get("issuer")
+    if issuer != realm_settings.KEYCLOAK_ISSUER:
+        raise WarmupError(
+            f"The issuer of the discovery document is {issuer}, "
+            f"KEYCLOAK_ISSUER is {realm_settings.KEYCLOAK_ISSUER}"
+        )
+    if not jwks.key_ids:
+        raise WarmupError("The realm has no signing key")
+    result["keys"] = len(jwks.key_ids)
+
+    return result
+
+
+class Warmup:
+    """
+    State of the warm-up of the current process.
+
+    A failed warm-up starts again after `retry_interval` seconds, doubled after every failure
+    up to `max_retry_interval` (0 does not retry).
+    A forked process starts over, as the connections of its parent are not shared with it.
+    """
+
+    NOT_STARTED = "not_started"
+    RUNNING = "running"
+    READY = "ready"
+    FAILED = "failed"
+
+    def __init__(self, retry_interval: float = 5, max_retry_interval: float = 300):
+        self.retry_interval = retry_interval
+        self.max_retry_interval = max_retry_interval
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self.status = self.NOT_STARTED
+        self.checks: Dict[str, dict] = {}
+        self.duration: Optional[float] = None
+        self.failures = 0
+        self._retry: Optional["ScheduledCall"] = None
+        self._done = threading.Event()
+        self._pid = os.getpid()
+
+    def _check_pid(self):
+        if self._pid != os.getpid():
+            self._reset()
+
+    @property
+    def ready(self) -> bool:
+        with self._lock:
+            self._check_pid()
+            return self.status == self.READY
+
+    def start(self, again: bool = True) -> bool:
+        """
+        Start the warm-up in the background, unless it is running or passed.
+        A failed warm-up starts again right away, unless `again` is False (it is then left to its retries).
+
+        return:
+        - Whether the warm-up was started
+        """
+
+        from django_drf_keycloak_auth.resilience import run_in_background
+
+        with self._lock:
+            self._check_pid()
+            if self.status in (self.RUNNING, self.READY):
+                return False
+            if self.status == self.FAILED and not again:
+                return False
+            if self._retry is not None:
+                self._retry.cancel()
+                self._retry = None
+            self.status = self.RUNNING
+            self._done = threading.Event()
+
+        run_in_background(self._run)
+        return True
+
+    def run(self, timeout: Optional[float] = None) -> bool:
+        """
+        Warm up and wait for the result, e.g. from a management command or a server hook.
+
+        return:
+        - Whether the warm-up passed
+        """
+
+        self.start()
+        self._done.wait(timeout)
+        return self.ready
+
+    def _run(self):
+        started = time.monotonic()
+        checks = {}
+        ok = False
+        try:
+            for realm in get_realm_registry():
+                with use_realm(realm):
+                    try:
+                        checks[realm.name] = warm_up_realm()
+                    except Exception as e:
+                        logger.error(
+                            "Failed to warm up the realm %s", realm.name, exc_info=True
+                        )
+                        checks[realm.name] = {"ok": False, "error": f"{type(e).__name__}: {e}"}
+            ok = all(check["ok"] for check in checks.values())
+        finally:
+            with self._lock:
+                self.checks = checks
+                self.duration = time.monotonic() - started
+                self.status = self.READY if ok else self.FAILED
+                self.failures = 0 if ok else self.failures + 1
+                if not ok:
+                    self._schedule_retry()
+                self._done.set()
+
+    def _schedule_retry(self):
+        from django_drf_keycloak_auth.resilience import run_later
+
+        if self.retry_interval <= 0:
+            return
+        delay = min(
+            self.retry_interval * 2 ** (self.failures - 1),
+            max(self.max_retry_interval, self.retry_interval),
+        )
+        self._retry = run_later(delay, self.start)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            self._check_pid()
+            retry = self._retry
+            return {
+                "status": self.status,
+                "duration": self.duration,
+                "failures": self.failures,
+                "retry_in": (
+                    max(retry.when - time.monotonic(), 0.0)
+                    if self.status == self.FAILED and retry is not None
+                    else None
+                ),
+                "realms": dict(self.checks),
+            }
+
+
+@cache
+def get_warmup() -> Warmup:
+    from django_drf_keycloak_auth.conf import keycloak_settings
+
+    return Warmup(
+        retry_interval=keycloak_settings.KEYCLOAK_WARMUP_RETRY_INTERVAL,
+        max_retry_interval=keycloak_settings.KEYCLOAK_WARMUP_MAX_RETRY_INTERVAL,
+    )
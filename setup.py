@@ -34,7 +34,13 @@ setup(
         "python-keycloak>=5.8.1",
         "pydantic>=2.12.1",
         "pydantic-settings>=2.11.0",
+        "drf-spectacular>=0.28.0",
+        "httpx>=0.28.1",
     ],
+    extras_require={
+        "http2": ["httpx[http2]>=0.28.1"],
+        "prometheus": ["prometheus-client>=0.20.0"],
+    },
     python_requires=">=3.11",
     license="MIT",
     classifiers=[
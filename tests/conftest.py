@@ -0,0 +1,110 @@
+import django
+import pytest
+from django.conf import settings
+
+
+def pytest_configure(config):
+    config.addinivalue_line(
+        "markers",
+        "keycloak_settings(**values): KEYCLOAK_* settings of the test, set before the emulator is installed",
+    )
+
+    settings.configure(
+        SECRET_KEY="tests",
+        ALLOWED_HOSTS=["*"],
+        ROOT_URLCONF="django_drf_keycloak_auth.urls",
+        INSTALLED_APPS=[
+            "django.contrib.contenttypes",
+            "django.contrib.auth",
+            "rest_framework",
+        ],
+        CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}},
+        REST_FRAMEWORK={"UNAUTHENTICATED_USER": None},
+    )
+    django.setup()
+
+
+def configure(request, monkeypatch, emulator):
+    """
+    Point the package at the emulator, with the KEYCLOAK_* settings of the test, in a fresh realm.
+    """
+
+    from django.core.cache import cache
+
+    from django_drf_keycloak_auth.conf import keycloak_settings
+    from django_drf_keycloak_auth.realms import get_realm_registry
+
+    values = emulator.environ()
+    # From the module markers to the test markers, the closest one wins
+    for marker in reversed(list(request.node.iter_markers("keycloak_settings"))):
+        values.update(marker.kwargs)
+    for name, value in values.items():
+        monkeypatch.setenv(name, str(value))
+
+    # The realm, and everything built from its settings, is rebuilt from the new settings
+    keycloak_settings.reload()
+    get_realm_registry.cache_clear()
+    cache.clear()
+
+
+def reset():
+    from django_drf_keycloak_auth.conf import keycloak_settings
+    from django_drf_keycloak_auth.realms import get_realm_registry
+
+    keycloak_settings.reload()
+    get_realm_registry.cache_clear()
+
+
+@pytest.fixture
+def emulator(request, monkeypatch):
+    """
+    A Keycloak emulator with the user "alice", installed in the shared transport of a fresh realm.
+    """
+
+    from django_drf_keycloak_auth.emulator import KeycloakEmulator
+
+    emulator = KeycloakEmulator(key_size=1024)
+    emulator.add_user("alice", password="secret", roles=["admin"])
+    configure(request, monkeypatch, emulator)
+
+    emulator.install()
+    yield emulator
+    reset()
+
+
+@pytest.fixture
+def served_emulator(request, monkeypatch):
+    """
+    Like `emulator`, but served on localhost, so that calls to Keycloak go over real sockets.
+    """
+
+    from django_drf_keycloak_auth.emulator import KeycloakEmulator
+
+    emulator = KeycloakEmulator(key_size=1024)
+    emulator.add_user("alice", password="secret", roles=["admin"])
+    emulator.serve()
+    configure(request, monkeypatch, emulator)
+
+    yield emulator
+    reset()
+    emulator.stop()
+
+
+@pytest.fixture
+def authenticate():
+    """
+    Authenticate a request with a Bearer token, return the user.
+    """
+
+    from rest_framework.test import APIRequestFactory
+
+    from django_drf_keycloak_auth.authentication import KeycloakAuthentication
+
+    factory = APIRequestFactory()
+
+    def authenticate(access_token: str):
+        request = factory.get("/", HTTP_AUTHORIZATION=f"Bearer {access_token}")
+        user, _ = KeycloakAuthentication().authenticate(request)
+        return user
+
+    return authenticate
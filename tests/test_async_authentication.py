@@ -0,0 +1,70 @@
+import asyncio
+
+import pytest
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.test import APIRequestFactory
+
+from django_drf_keycloak_auth.authentication import AsyncKeycloakAuthentication
+from django_drf_keycloak_auth.keycloak_utils import get_keycloak_transport
+from django_drf_keycloak_auth.resilience import KeycloakUnavailableError
+
+
+def run(*access_tokens: str):
+    """
+    Authenticate requests concurrently on a new event loop, return the users.
+    """
+
+    factory = APIRequestFactory()
+
+    async def authenticate(access_token: str):
+        request = factory.get("/", HTTP_AUTHORIZATION=f"Bearer {access_token}")
+        user, _ = await AsyncKeycloakAuthentication().authenticate(request)
+        return user
+
+    async def main():
+        try:
+            return await asyncio.gather(*map(authenticate, access_tokens))
+        finally:
+            await get_keycloak_transport().aclose()
+
+    return asyncio.run(main())
+
+
+def test_valid_token(emulator):
+    (user,) = run(emulator.issue_tokens("alice")["access_token"])
+
+    assert user.username == "alice"
+    assert user.has_role("admin")
+    assert emulator.requests["token/introspect"] == 1
+
+
+def test_coalesced(emulator):
+    access_token = emulator.issue_tokens("alice")["access_token"]
+    emulator.latency = 0.05
+
+    users = run(*[access_token] * 8)
+
+    assert {user.username for user in users} == {"alice"}
+    assert emulator.requests["token/introspect"] == 1
+
+
+def test_invalid_token(emulator):
+    with pytest.raises(AuthenticationFailed):
+        run("invalid")
+
+
+def test_unavailable(emulator):
+    access_token = emulator.issue_tokens("alice")["access_token"]
+    emulator.fail_next(1)
+
+    with pytest.raises(KeycloakUnavailableError):
+        run(access_token)
+
+
+@pytest.mark.keycloak_settings(KEYCLOAK_AUTH_MODE="local")
+def test_local(emulator):
+    (user,) = run(emulator.issue_tokens("alice")["access_token"])
+
+    assert user.username == "alice"
+    assert emulator.requests["token/introspect"] == 0
+    assert emulator.requests["certs"] == 1
@@ -0,0 +1,148 @@
+import time
+
+import pytest
+from jwcrypto import jwk, jwt
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.test import APIClient
+
+from django_drf_keycloak_auth.conf import keycloak_settings
+from django_drf_keycloak_auth.emulator import KeycloakEmulator
+from django_drf_keycloak_auth.realms import get_realm_registry
+from django_drf_keycloak_auth.resilience import KeycloakUnavailableError
+
+pytestmark = pytest.mark.keycloak_settings(KEYCLOAK_AUTH_MODE="local")
+
+
+def sign(claims: dict, key: jwk.JWK, kid: str) -> str:
+    token = jwt.JWT(header={"alg": "RS256", "kid": kid, "typ": "JWT"}, claims=claims)
+    token.make_signed_token(key)
+    return token.serialize()
+
+
+def test_valid_token(emulator, authenticate):
+    tokens = emulator.issue_tokens("alice")
+
+    user = authenticate(tokens["access_token"])
+
+    assert user.username == "alice"
+    assert user.has_role("admin")
+    assert emulator.requests["token/introspect"] == 0
+
+
+def test_introspect_by_default(emulator, authenticate, monkeypatch):
+    monkeypatch.delenv("KEYCLOAK_AUTH_MODE")
+    keycloak_settings.reload()
+    get_realm_registry.cache_clear()
+    emulator.install()
+
+    assert authenticate(emulator.issue_tokens("alice")["access_token"]).username == "alice"
+    assert emulator.requests["token/introspect"] == 1
+
+
+def test_keys_unavailable(emulator, authenticate):
+    access_token = emulator.issue_tokens("alice")["access_token"]
+    emulator.fail_next(2)
+
+    # Keycloak could not be asked for the keys, the token is not known to be invalid
+    for _ in range(2):
+        with pytest.raises(KeycloakUnavailableError):
+            authenticate(access_token)
+
+
+def test_expired_token(emulator, authenticate):
+    now = int(time.time())
+    access_token = emulator.issue_access_token(
+        {"sub": "alice", "iat": now - 600, "exp": now - 300}
+    )
+
+    with pytest.raises(AuthenticationFailed):
+        authenticate(access_token)
+
+
+def test_wrong_issuer(emulator, authenticate):
+    access_token = emulator.issue_access_token(
+        {"sub": "alice", "iss": "http://evil.local/realms/test"}
+    )
+
+    with pytest.raises(AuthenticationFailed):
+        authenticate(access_token)
+
+
+def test_forged_token(emulator, authenticate):
+    # Signed by another key, under the kid of the realm key
+    other = KeycloakEmulator(key_size=1024)
+    claims = emulator.get_active_claims(emulator.issue_tokens("alice")["access_token"])
+    access_token = sign(
+        {**claims, "realm_access": {"roles": ["superuser"]}},
+        other.key,
+        emulator.key["kid"],
+    )
+
+    with pytest.raises(AuthenticationFailed):
+        authenticate(access_token)
+
+
+def test_unknown_kid(emulator, authenticate):
+    authenticate(emulator.issue_tokens("alice")["access_token"])
+    other = KeycloakEmulator(key_size=1024)
+    claims = emulator.get_active_claims(emulator.issue_tokens("alice")["access_token"])
+
+    for _ in range(3):
+        with pytest.raises(AuthenticationFailed):
+            authenticate(sign(claims, other.key, other.key["kid"]))
+
+    # The key set is fetched again at most once per KEYCLOAK_JWKS_MIN_REFRESH_INTERVAL
+    assert emulator.requests["certs"] <= 2
+
+
+@pytest.mark.keycloak_settings(KEYCLOAK_REVOCATION_CACHE_ALIAS="default")
+def test_revoked_token(emulator, authenticate):
+    access_token = emulator.issue_tokens("alice")["access_token"]
+    assert authenticate(access_token).username == "alice"
+
+    response = APIClient().post(
+        "/oauth2/revoke/",
+        {"token": access_token, "token_type_hint": "access_token"},
+        format="json",
+    )
+    assert response.status_code == 204
+
+    # Still valid by its signature and claims, but denied on every node
+    with pytest.raises(AuthenticationFailed, match="revoked"):
+        authenticate(access_token)
+
+
+@pytest.mark.keycloak_settings(KEYCLOAK_AUTH_MODE="introspect")
+def test_revoked_token_introspected(emulator, authenticate):
+    access_token = emulator.issue_tokens("alice")["access_token"]
+    emulator.revoked.add(emulator.get_active_claims(access_token)["jti"])
+
+    with pytest.raises(AuthenticationFailed):
+        authenticate(access_token)
+
+
+@pytest.mark.keycloak_settings(
+    KEYCLOAK_AUTH_MODE="introspect",
+    KEYCLOAK_TOKEN_CACHE_TTL=0.2,
+    KEYCLOAK_TOKEN_CACHE_GRACE=30,
+    KEYCLOAK_CIRCUIT_BREAKER_WINDOW=3,
+    KEYCLOAK_CIRCUIT_BREAKER_MIN_CALLS=3,
+)
+def test_stale_user_served_while_circuit_open(emulator, authenticate):
+    from django_drf_keycloak_auth.keycloak_utils import get_keycloak_transport
+
+    access_token = emulator.issue_tokens("alice")["access_token"]
+    assert authenticate(access_token).username == "alice"
+    time.sleep(0.3)
+
+    emulator.failure_rate = 1
+    for _ in range(3):
+        with pytest.raises(KeycloakUnavailableError):
+            authenticate(emulator.issue_tokens("alice")["access_token"])
+    assert get_keycloak_transport().stats()["breaker"]["state"] == "open"
+
+    # The cached user is past its TTL but within its grace period
+    calls = sum(emulator.requests.values())
+    assert authenticate(access_token).username == "alice"
+    time.sleep(0.1)
+    assert sum(emulator.requests.values()) == calls
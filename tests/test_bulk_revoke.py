@@ -0,0 +1,74 @@
+import pytest
+from rest_framework.test import APIClient
+
+from django_drf_keycloak_auth.keycloak_utils import get_keycloak_transport
+from django_drf_keycloak_auth.models.user import User
+
+
+@pytest.fixture
+def client():
+    client = APIClient()
+    client.force_authenticate(User(claims={"sub": "admin", "preferred_username": "admin"}))
+    return client
+
+
+def test_anonymous_rejected(emulator):
+    tokens = emulator.issue_tokens("alice")
+
+    response = APIClient().post(
+        "/oauth2/revoke/bulk/",
+        {"tokens": [{"token": tokens["refresh_token"], "token_type_hint": "refresh_token"}]},
+        format="json",
+    )
+
+    assert response.status_code in (401, 403)
+    assert emulator.requests["revoke"] == 0
+
+
+def test_revoke(emulator, client):
+    tokens = emulator.issue_tokens("alice")
+    emulator.fail_next(1)
+
+    response = client.post(
+        "/oauth2/revoke/bulk/",
+        {
+            "tokens": [
+                {"token": tokens["access_token"], "token_type_hint": "access_token"},
+                {"token": tokens["refresh_token"], "token_type_hint": "refresh_token"},
+            ]
+        },
+        format="json",
+    )
+
+    assert response.status_code == 200
+    results = sorted(response.json()["results"], key=lambda result: result["index"])
+    assert [result["index"] for result in results] == [0, 1]
+    assert sum(result["revoked"] for result in results) == 1
+    # The first request to Keycloak got a 503
+    assert emulator.requests["revoke"] == 1
+
+
+@pytest.mark.keycloak_settings(KEYCLOAK_BULK_REVOKE_MAX_TOKENS=2)
+def test_max_tokens(emulator, client):
+    item = {"token": "token", "token_type_hint": "access_token"}
+
+    response = client.post("/oauth2/revoke/bulk/", {"tokens": [item] * 3}, format="json")
+
+    assert response.status_code == 400
+    assert emulator.requests["revoke"] == 0
+
+
+def test_async_clients_closed(served_emulator, client):
+    transport = get_keycloak_transport()
+
+    for _ in range(5):
+        tokens = served_emulator.issue_tokens("alice")
+        response = client.post(
+            "/oauth2/revoke/bulk/",
+            {"tokens": [{"token": tokens["refresh_token"], "token_type_hint": "refresh_token"}]},
+            format="json",
+        )
+        assert response.status_code == 200
+
+    # Every request runs in its own event loop, its client must not outlive it
+    assert len(transport._async_clients) == 0
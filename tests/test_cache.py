@@ -0,0 +1,129 @@
+import pytest
+
+from django_drf_keycloak_auth.cache import (
+    SharedCache,
+    TTLCache,
+    get_shared_token_cache,
+    get_token_cache,
+)
+
+
+class Clock:
+    def __init__(self, now: float = 1000.0):
+        self.now = now
+
+    def time(self) -> float:
+        return self.now
+
+    def monotonic(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr("django_drf_keycloak_auth.cache.time", clock)
+    return clock
+
+
+def test_ttl(clock):
+    cache = TTLCache(max_size=10, ttl=60)
+    cache.set("a", 1)
+
+    clock.now += 59
+    assert cache.get("a") == 1
+    clock.now += 1
+    assert cache.get("a") is None
+    assert cache.stats()["size"] == 0
+
+
+def test_never_past_expires_at(clock):
+    cache = TTLCache(max_size=10, ttl=60, grace=60)
+    cache.set("a", 1, expires_at=clock.now + 10)
+    cache.set("b", 2, expires_at=clock.now - 1)
+
+    assert cache.get("b") is None
+    clock.now += 10
+    assert cache.get_entry("a") is None
+
+
+def test_grace(clock):
+    cache = TTLCache(max_size=10, ttl=60, grace=30)
+    cache.set("a", 1)
+
+    clock.now += 60
+    assert cache.get("a") is None
+    assert cache.get_entry("a") == (1, True)
+    clock.now += 30
+    assert cache.get_entry("a") is None
+
+
+def test_lru_eviction(clock):
+    cache = TTLCache(max_size=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+    assert cache.stats()["evictions"] == 1
+
+
+@pytest.mark.keycloak_settings(KEYCLOAK_TOKEN_CACHE_TTL="60")
+def test_user_cached(emulator, authenticate):
+    access_token = emulator.issue_tokens("alice")["access_token"]
+
+    assert authenticate(access_token) is authenticate(access_token)
+    assert emulator.requests["token/introspect"] == 1
+
+
+def test_disabled_by_default(emulator, authenticate):
+    access_token = emulator.issue_tokens("alice")["access_token"]
+
+    authenticate(access_token)
+    authenticate(access_token)
+    assert emulator.requests["token/introspect"] == 2
+
+
+class BrokenBackend:
+    def get(self, key):
+        raise ConnectionError("cache server is down")
+
+    def set(self, key, value, timeout=None):
+        raise ConnectionError("cache server is down")
+
+
+def test_shared_cache_bounded_by_expires_at(clock):
+    cache = SharedCache(alias="default", ttl=60, key_prefix="keycloak:test:")
+    cache.set("a", {"sub": "alice"}, expires_at=clock.now + 10.5)
+    cache.set("b", {"sub": "bob"}, expires_at=clock.now - 1)
+
+    assert cache.backend.get("keycloak:test:a") == {"sub": "alice"}
+    assert cache.get("b") is None
+    assert cache.stats()["misses"] == 1
+
+
+def test_shared_cache_errors_are_misses(monkeypatch):
+    cache = SharedCache(alias="default", ttl=60, key_prefix="keycloak:test:")
+    monkeypatch.setattr(SharedCache, "backend", BrokenBackend())
+
+    cache.set("a", {"sub": "alice"})
+    assert cache.get("a") is None
+    assert cache.stats()["errors"] == 2
+
+
+@pytest.mark.keycloak_settings(
+    KEYCLOAK_TOKEN_CACHE_TTL="60", KEYCLOAK_TOKEN_CACHE_ALIAS="default"
+)
+def test_shared_between_nodes(emulator, authenticate):
+    access_token = emulator.issue_tokens("alice")["access_token"]
+
+    authenticate(access_token)
+    # Another node: its own in-process cache, the same shared cache
+    get_token_cache().clear()
+    assert authenticate(access_token).username == "alice"
+
+    assert emulator.requests["token/introspect"] == 1
+    assert get_shared_token_cache().stats()["hits"] == 1
@@ -0,0 +1,92 @@
+import time
+
+import pytest
+
+from django_drf_keycloak_auth.keycloak_utils import get_keycloak_transport
+from django_drf_keycloak_auth.resilience import (
+    CircuitBreaker,
+    CircuitOpenError,
+    KeycloakUnavailableError,
+)
+
+
+@pytest.fixture
+def breaker():
+    breaker = CircuitBreaker(window=4, min_calls=4, error_rate=0.5, reset_timeout=0.05)
+    for success in (True, True, False, False):
+        breaker.before_call()
+        breaker.record(success, 0.01)
+    assert breaker.state == CircuitBreaker.OPEN
+    return breaker
+
+
+def test_opens():
+    breaker = CircuitBreaker(window=4, min_calls=4, error_rate=0.5, slow_call_duration=1)
+
+    for _ in range(3):
+        breaker.before_call()
+        breaker.record(False, 0.01)
+    # Not enough calls yet
+    assert breaker.state == CircuitBreaker.CLOSED
+
+    breaker.before_call()
+    # Slow calls are bad calls
+    breaker.record(True, 2)
+    assert breaker.state == CircuitBreaker.OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+    assert breaker.snapshot()["rejected"] == 1
+
+
+def test_half_open_single_trial(breaker):
+    time.sleep(0.06)
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+
+    breaker.before_call()
+    # Only one trial call at a time
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+    breaker.record(True, 0.01)
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.snapshot()["calls"] == 0
+    breaker.before_call()
+
+
+def test_half_open_trial_fails(breaker):
+    time.sleep(0.06)
+
+    breaker.before_call()
+    breaker.record(False, 0.01)
+
+    assert breaker.state == CircuitBreaker.OPEN
+    assert breaker.snapshot()["opened"] == 2
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+
+def test_half_open_trial_aborted(breaker):
+    time.sleep(0.06)
+
+    breaker.before_call()
+    breaker.abort()
+
+    # The trial was cancelled, another one may be made
+    breaker.before_call()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+
+
+@pytest.mark.keycloak_settings(
+    KEYCLOAK_CIRCUIT_BREAKER_WINDOW="2", KEYCLOAK_CIRCUIT_BREAKER_MIN_CALLS="2"
+)
+def test_fails_fast(emulator, authenticate):
+    access_token = emulator.issue_tokens("alice")["access_token"]
+    emulator.fail_next(2)
+    for _ in range(2):
+        with pytest.raises(KeycloakUnavailableError):
+            authenticate(access_token)
+
+    with pytest.raises(CircuitOpenError):
+        authenticate(access_token)
+    assert get_keycloak_transport().stats()["breaker"]["state"] == CircuitBreaker.OPEN
+    assert emulator.requests["token/introspect"] == 0
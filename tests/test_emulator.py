@@ -0,0 +1,57 @@
+import httpx
+
+from django_drf_keycloak_auth.emulator import KeycloakEmulator
+
+
+def make_emulator() -> KeycloakEmulator:
+    emulator = KeycloakEmulator(key_size=1024)
+    emulator.add_user("alice", password="secret", roles=["admin"])
+    return emulator
+
+
+def openid_url(emulator: KeycloakEmulator, path: str) -> str:
+    return f"{emulator.issuer}/protocol/openid-connect/{path}"
+
+
+def test_password_grant_and_introspection():
+    emulator = make_emulator()
+    client = httpx.Client(transport=emulator.transport())
+    credentials = {"client_id": emulator.client_id, "client_secret": emulator.client_secret}
+    login = {**credentials, "grant_type": "password", "username": "alice"}
+
+    response = client.post(openid_url(emulator, "token"), data={**login, "password": "secret"})
+    assert response.status_code == 200
+    access_token = response.json()["access_token"]
+
+    response = client.post(
+        openid_url(emulator, "token/introspect"), data={**credentials, "token": access_token}
+    )
+    assert response.json()["active"]
+    assert response.json()["preferred_username"] == "alice"
+
+    response = client.post(openid_url(emulator, "token"), data={**login, "password": "x"})
+    assert response.status_code == 401
+    assert emulator.requests == {"token": 2, "token/introspect": 1}
+
+
+def test_injected_failures():
+    emulator = make_emulator()
+    client = httpx.Client(transport=emulator.transport())
+    url = f"{emulator.issuer}/.well-known/openid-configuration"
+
+    emulator.fail_next(2, status_code=502)
+    assert [client.get(url).status_code for _ in range(3)] == [502, 502, 200]
+    # Injected failures are not counted
+    assert emulator.requests[".well-known/openid-configuration"] == 1
+
+
+def test_served():
+    emulator = make_emulator()
+    url = emulator.serve()
+    try:
+        response = httpx.get(f"{url}/realms/{emulator.realm}/protocol/openid-connect/certs")
+        assert response.status_code == 200
+        assert response.json()["keys"][0]["kid"] == emulator.key["kid"]
+        assert emulator.issuer == f"{url}/realms/{emulator.realm}"
+    finally:
+        emulator.stop()
@@ -0,0 +1,121 @@
+import socket
+
+import pytest
+from prometheus_client import CollectorRegistry
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.test import APIClient
+
+from django_drf_keycloak_auth.keycloak_utils import get_keycloak_transport, get_metrics
+from django_drf_keycloak_auth.metrics import (
+    MetricsSink,
+    PrometheusSink,
+    StatsDSink,
+    TaggedSink,
+)
+from django_drf_keycloak_auth.resilience import KeycloakUnavailableError
+
+
+class RecordingSink(MetricsSink):
+    def __init__(self):
+        self.counters = []
+        self.observations = []
+
+    def increment(self, name, value=1, tags=None):
+        self.counters.append((name, tags))
+
+    def observe(self, name, value, tags=None):
+        self.observations.append((name, tags))
+
+
+def use_sink(monkeypatch, sink: MetricsSink):
+    # Before the emulator fixture, which builds the transport of the realm
+    monkeypatch.setattr(
+        "django_drf_keycloak_auth.keycloak_utils.get_metrics_sink", lambda: sink
+    )
+    monkeypatch.setattr("django_drf_keycloak_auth.views.get_metrics_sink", lambda: sink)
+    return sink
+
+
+@pytest.fixture
+def sink(monkeypatch):
+    return use_sink(monkeypatch, RecordingSink())
+
+
+def test_authentication(sink, emulator, authenticate):
+    authenticate(emulator.issue_tokens("alice")["access_token"])
+    with pytest.raises(AuthenticationFailed):
+        authenticate("invalid")
+
+    assert ("keycloak_authentications_total", {"outcome": "success"}) in sink.counters
+    assert ("keycloak_authentications_total", {"outcome": "failed"}) in sink.counters
+    assert (
+        "keycloak_requests_total",
+        {"operation": "introspect", "outcome": "ok"},
+    ) in sink.counters
+    assert ("keycloak_request_duration_seconds", {"operation": "introspect"}) in (
+        sink.observations
+    )
+
+
+@pytest.mark.keycloak_settings(KEYCLOAK_TOKEN_CACHE_TTL="60")
+def test_cache(sink, emulator, authenticate):
+    access_token = emulator.issue_tokens("alice")["access_token"]
+    authenticate(access_token)
+    authenticate(access_token)
+
+    lookups = [tags["result"] for _, tags in sink.counters if tags.get("cache") == "token"]
+    assert lookups == ["miss", "hit"]
+
+
+def test_unavailable(sink, emulator, authenticate):
+    access_token = emulator.issue_tokens("alice")["access_token"]
+    emulator.fail_next(1)
+
+    with pytest.raises(KeycloakUnavailableError):
+        authenticate(access_token)
+
+    assert ("keycloak_authentications_total", {"outcome": "unavailable"}) in sink.counters
+    assert (
+        "keycloak_requests_total",
+        {"operation": "introspect", "outcome": "5xx"},
+    ) in sink.counters
+
+
+def test_tagged():
+    sink = RecordingSink()
+
+    TaggedSink(sink, {"realm": "acme"}).increment("keycloak_requests_total", tags={"a": "b"})
+
+    assert sink.counters == [("keycloak_requests_total", {"realm": "acme", "a": "b"})]
+
+
+def test_statsd():
+    server = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    server.bind(("127.0.0.1", 0))
+    server.settimeout(5)
+    sink = StatsDSink(host="127.0.0.1", port=server.getsockname()[1], prefix="api")
+
+    sink.increment("keycloak_requests_total", tags={"operation": "token"})
+    sink.observe("keycloak_request_duration_seconds", 0.25)
+
+    assert server.recv(1024) == b"api.keycloak_requests_total:1|c|#operation:token"
+    assert server.recv(1024) == b"api.keycloak_request_duration_seconds:250.000|ms"
+    server.close()
+
+
+def test_prometheus_view(monkeypatch, emulator, authenticate):
+    client = APIClient()
+    assert client.get("/keycloak/metrics/").status_code == 404
+
+    use_sink(monkeypatch, PrometheusSink(registry=CollectorRegistry()))
+    # Build the realm's transport again, with the new sink
+    get_metrics.cache_clear()
+    get_keycloak_transport.cache_clear()
+    emulator.install()
+    authenticate(emulator.issue_tokens("alice")["access_token"])
+
+    response = client.get("/keycloak/metrics/")
+    assert response.status_code == 200
+    assert (
+        'keycloak_authentications_total{outcome="success"} 1.0' in response.content.decode()
+    )
@@ -0,0 +1,53 @@
+import asyncio
+
+from django.http import HttpResponse
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from django_drf_keycloak_auth.authentication import (
+    AsyncKeycloakAuthentication,
+    KeycloakAuthentication,
+)
+from django_drf_keycloak_auth.middleware import KeycloakAuthenticationMiddleware
+
+
+class HeaderAuthentication(KeycloakAuthentication):
+    def get_access_token(self, request):
+        return request.META.get("HTTP_X_ACCESS_TOKEN")
+
+
+def process(request):
+    middleware = KeycloakAuthenticationMiddleware(lambda request: HttpResponse())
+    middleware.process_request(request)
+    return request
+
+
+def test_validated_once(emulator):
+    access_token = emulator.issue_tokens("alice")["access_token"]
+    request = process(
+        APIRequestFactory().get("/", HTTP_AUTHORIZATION=f"Bearer {access_token}")
+    )
+
+    assert request.user.username == "alice"
+    user, _ = KeycloakAuthentication().authenticate(Request(request))
+    assert user is request.user._wrapped
+    user, _ = asyncio.run(AsyncKeycloakAuthentication().authenticate(Request(request)))
+    assert user is request.user._wrapped
+    assert emulator.requests["token/introspect"] == 1
+
+
+def test_subclass_not_shared(emulator):
+    access_token = emulator.issue_tokens("alice")["access_token"]
+    request = process(APIRequestFactory().get("/", HTTP_X_ACCESS_TOKEN=access_token))
+
+    # No Bearer token for the middleware
+    assert request.user.is_anonymous
+    user, _ = HeaderAuthentication().authenticate(Request(request))
+    assert user.username == "alice"
+
+
+def test_invalid_token_is_anonymous(emulator):
+    request = process(APIRequestFactory().get("/", HTTP_AUTHORIZATION="Bearer invalid"))
+
+    assert request.user.is_anonymous
+    assert asyncio.run(request.auser()).is_anonymous
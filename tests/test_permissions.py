@@ -0,0 +1,57 @@
+import pytest
+from django.contrib.auth.models import AnonymousUser
+from rest_framework.test import APIRequestFactory
+
+from django_drf_keycloak_auth.models.user import User
+from django_drf_keycloak_auth.permissions import HasAllRoles, HasAnyRole, HasRole
+
+USER = User(
+    claims={
+        "sub": "f1d6c6a8",
+        "realm_access": {"roles": ["user", "admin"]},
+        "resource_access": {"billing": {"roles": ["viewer"]}},
+    }
+)
+
+
+def allowed(permission_class, user=USER) -> bool:
+    request = APIRequestFactory().get("/")
+    request.user = user
+    return permission_class().has_permission(request, None)
+
+
+def test_has_role():
+    assert allowed(HasRole("admin"))
+    assert not allowed(HasRole("owner"))
+    assert allowed(HasRole("viewer", client="billing"))
+    assert not allowed(HasRole("viewer"))
+
+
+def test_has_any_role():
+    assert allowed(HasAnyRole("owner", "user"))
+    assert not allowed(HasAnyRole("owner", "guest"))
+    assert allowed(HasAnyRole("editor", "viewer", client="billing"))
+
+
+def test_has_all_roles():
+    assert allowed(HasAllRoles("user", "admin"))
+    assert not allowed(HasAllRoles("user", "owner"))
+
+
+def test_combined():
+    assert allowed(HasRole("owner") | (HasRole("admin") & ~HasRole("suspended")))
+    assert not allowed(HasRole("owner") | ~HasRole("admin"))
+
+
+def test_anonymous():
+    assert not allowed(HasRole("admin"), user=AnonymousUser())
+    assert not allowed(HasRole("admin"), user=None)
+
+
+def test_message_and_name():
+    permission_class = HasAnyRole("user", "admin")
+
+    assert permission_class.__name__ == "HasAnyRole(admin, user)"
+    assert permission_class.message == "You need one of the roles: admin, user."
+    with pytest.raises(ValueError):
+        HasAnyRole()
@@ -0,0 +1,96 @@
+import asyncio
+import json
+import threading
+
+import pytest
+from django.urls import reverse
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.test import APIClient
+
+from django_drf_keycloak_auth.emulator import KeycloakEmulator
+from django_drf_keycloak_auth.realms import get_current_realm, get_realm_registry, use_realm
+from django_drf_keycloak_auth.resilience import run_in_background
+
+pytestmark = pytest.mark.keycloak_settings(
+    KEYCLOAK_REALMS=json.dumps({"acme": {"REALM": "acme"}})
+)
+
+
+@pytest.fixture
+def acme(emulator):
+    acme = KeycloakEmulator(server_url=emulator.server_url, realm="acme", key_size=1024)
+    acme.add_user("bob", password="secret")
+    with use_realm("acme"):
+        acme.install()
+    return acme
+
+
+def test_registry(emulator):
+    registry = get_realm_registry()
+
+    assert [realm.name for realm in registry] == ["acme", "default"]
+    assert registry.default.name == "default"
+    assert registry.get_by_issuer(emulator.issuer).name == "default"
+    assert registry.get_by_issuer(f"{emulator.server_url}/realms/acme").name == "acme"
+    with pytest.raises(LookupError):
+        registry.get("globex")
+
+
+def test_use_realm(emulator):
+    assert get_current_realm().name == "default"
+    with use_realm("acme") as acme:
+        assert get_current_realm() is acme
+        with use_realm("default"):
+            assert get_current_realm().name == "default"
+        assert get_current_realm() is acme
+
+        # Threads start in the default realm, background work in the caller's realm
+        names = []
+        thread = threading.Thread(target=lambda: names.append(get_current_realm().name))
+        thread.start()
+        thread.join()
+        assert names == ["default"]
+        assert run_in_background(get_current_realm).result() is acme
+    assert get_current_realm().name == "default"
+
+
+def test_use_realm_per_task(emulator):
+    async def current(name: str):
+        with use_realm(name):
+            await asyncio.sleep(0.01)
+            return get_current_realm().name
+
+    async def main():
+        return await asyncio.gather(current("acme"), current("default"))
+
+    assert asyncio.run(main()) == ["acme", "default"]
+
+
+def test_tokens_routed_by_issuer(emulator, acme, authenticate):
+    alice = authenticate(emulator.issue_tokens("alice")["access_token"])
+    bob = authenticate(acme.issue_tokens("bob")["access_token"])
+
+    assert alice.username == "alice"
+    assert bob.username == "bob"
+    assert emulator.requests["token/introspect"] == 1
+    assert acme.requests["token/introspect"] == 1
+
+    other = KeycloakEmulator(server_url=emulator.server_url, realm="globex", key_size=1024)
+    other.add_user("carol", password="secret")
+    with pytest.raises(AuthenticationFailed):
+        authenticate(other.issue_tokens("carol")["access_token"])
+
+
+def test_realm_urls(emulator, acme):
+    client = APIClient()
+    data = {"refresh_token": acme.issue_tokens("bob")["refresh_token"]}
+
+    assert reverse("refresh_token") == "/oauth2/refresh/"
+    url = reverse("keycloak_realm:refresh_token", kwargs={"realm": "acme"})
+    assert url == "/realms/acme/oauth2/refresh/"
+
+    assert client.post(url, data, format="json").status_code == 200
+    assert acme.requests["token"] == 1
+    assert emulator.requests["token"] == 0
+    response = client.post("/realms/globex/oauth2/refresh/", data, format="json")
+    assert response.status_code == 404
@@ -0,0 +1,56 @@
+import pytest
+from keycloak.exceptions import KeycloakPostError
+
+from django_drf_keycloak_auth.refresh import (
+    discard_refresh,
+    get_refresh_cache,
+    refresh_tokens,
+)
+
+
+@pytest.fixture
+def refresh_token(emulator):
+    emulator.rotate_refresh_tokens = True
+    return emulator.issue_tokens("alice")["refresh_token"]
+
+
+def test_not_kept_by_default(emulator, refresh_token):
+    refresh_tokens(refresh_token)
+
+    # The used refresh token is rejected by Keycloak, it is not served from a cache
+    with pytest.raises(KeycloakPostError):
+        refresh_tokens(refresh_token)
+    assert emulator.requests["token"] == 2
+
+
+@pytest.mark.keycloak_settings(KEYCLOAK_REFRESH_CACHE_TTL=5)
+def test_cache_hit(emulator, refresh_token):
+    token = refresh_tokens(refresh_token)
+
+    assert refresh_tokens(refresh_token) == token
+    assert emulator.requests["token"] == 1
+
+
+@pytest.mark.keycloak_settings(
+    KEYCLOAK_REFRESH_CACHE_TTL=5, KEYCLOAK_REFRESH_CACHE_ALIAS="default"
+)
+def test_shared_cache_hit(emulator, refresh_token):
+    token = refresh_tokens(refresh_token)
+    # As if the next call reached another node
+    get_refresh_cache().clear()
+
+    assert refresh_tokens(refresh_token) == token
+    assert emulator.requests["token"] == 1
+
+
+@pytest.mark.keycloak_settings(
+    KEYCLOAK_REFRESH_CACHE_TTL=5, KEYCLOAK_REFRESH_CACHE_ALIAS="default"
+)
+def test_discard(emulator, refresh_token):
+    refresh_tokens(refresh_token)
+
+    discard_refresh(refresh_token)
+
+    with pytest.raises(KeycloakPostError):
+        refresh_tokens(refresh_token)
+    assert emulator.requests["token"] == 2
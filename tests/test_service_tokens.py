@@ -0,0 +1,110 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from django_drf_keycloak_auth.service_tokens import ServiceTokenManager
+
+
+class Fetcher:
+    def __init__(self, expires_in: float = 300, delay: float = 0):
+        self.expires_in = expires_in
+        self.delay = delay
+        self.calls = []
+
+    def __call__(self, **data) -> dict:
+        self.calls.append(data)
+        time.sleep(self.delay)
+        return {"access_token": f"token-{len(self.calls)}", "expires_in": self.expires_in}
+
+    async def a_call(self, **data) -> dict:
+        self.calls.append(data)
+        await asyncio.sleep(self.delay)
+        return {"access_token": f"token-{len(self.calls)}", "expires_in": self.expires_in}
+
+
+def wait_for(condition, timeout: float = 5):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+@pytest.fixture
+def manager():
+    managers = []
+
+    def make(fetcher: Fetcher, refresh_margin: float = 30) -> ServiceTokenManager:
+        manager = ServiceTokenManager(fetcher, fetcher.a_call, refresh_margin=refresh_margin)
+        managers.append(manager)
+        return manager
+
+    yield make
+    for manager in managers:
+        manager.clear()
+
+
+def test_cached(manager):
+    fetcher = Fetcher()
+    tokens = manager(fetcher)
+
+    assert tokens.get_token("billing", "b a") == "token-1"
+    assert tokens.get_token("billing", "a b") == "token-1"
+    assert tokens.get_token() == "token-2"
+    assert fetcher.calls == [{"audience": "billing", "scope": "a b"}, {}]
+
+
+def test_coalesced(manager):
+    fetcher = Fetcher(delay=0.1)
+    tokens = manager(fetcher)
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        results = list(executor.map(lambda _: tokens.get_token(), range(8)))
+
+    assert results == ["token-1"] * 8
+    assert len(fetcher.calls) == 1
+
+
+def test_refreshed_after_first_fetch(manager):
+    fetcher = Fetcher(expires_in=0.4)
+    tokens = manager(fetcher, refresh_margin=0.3)
+
+    assert tokens.get_token() == "token-1"
+
+    # The token was used, it is refreshed before it expires without a call to get_token
+    assert wait_for(lambda: len(fetcher.calls) == 2)
+    assert tokens.get_token() == "token-2"
+
+
+def test_unused_not_refreshed(manager):
+    fetcher = Fetcher(expires_in=0.2)
+    tokens = manager(fetcher, refresh_margin=0.15)
+
+    tokens.refresh(tokens.get_key(None, None))
+    time.sleep(0.3)
+
+    assert len(fetcher.calls) == 1
+
+
+def test_async(manager):
+    fetcher = Fetcher(expires_in=0.4, delay=0.05)
+    tokens = manager(fetcher, refresh_margin=0.3)
+
+    async def get_tokens():
+        return await asyncio.gather(*(tokens.a_get_token("billing") for _ in range(4)))
+
+    assert asyncio.run(get_tokens()) == ["token-1"] * 4
+    assert wait_for(lambda: len(fetcher.calls) == 2)
+
+
+def test_no_thread_per_token(manager):
+    tokens = manager(Fetcher())
+    threads = threading.active_count()
+
+    for i in range(20):
+        tokens.get_token(f"audience-{i}")
+
+    # At most the scheduler thread and one background thread
+    assert threading.active_count() <= threads + 2
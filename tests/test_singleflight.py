@@ -0,0 +1,116 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from django_drf_keycloak_auth.singleflight import AsyncSingleFlight, SingleFlight
+
+
+def test_coalesced():
+    flight = SingleFlight()
+    calls = []
+
+    def fetch(key):
+        calls.append(key)
+        time.sleep(0.1)
+        return f"result-{key}"
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        results = list(executor.map(lambda i: flight.do(i % 2, fetch, i % 2), range(8)))
+
+    assert results == ["result-0", "result-1"] * 4
+    assert sorted(calls) == [0, 1]
+    assert len(flight) == 0
+
+
+def test_error_shared():
+    flight = SingleFlight()
+    started = threading.Event()
+    calls = []
+
+    def fail():
+        calls.append(1)
+        started.set()
+        time.sleep(0.1)
+        raise ValueError("invalid")
+
+    def follow():
+        started.wait()
+        return flight.do("key", fail)
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        futures = [executor.submit(flight.do, "key", fail)]
+        futures += [executor.submit(follow) for _ in range(3)]
+        for future in futures:
+            with pytest.raises(ValueError):
+                future.result()
+
+    assert len(calls) == 1
+    # Not kept: the next call runs again
+    with pytest.raises(ValueError):
+        flight.do("key", fail)
+    assert len(calls) == 2
+
+
+def test_async_coalesced():
+    flight = AsyncSingleFlight()
+    calls = []
+
+    async def fetch():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return "result"
+
+    async def main():
+        return await asyncio.gather(*(flight.do("key", fetch) for _ in range(8)))
+
+    assert asyncio.run(main()) == ["result"] * 8
+    assert len(calls) == 1
+
+
+def test_async_cancelled_caller():
+    flight = AsyncSingleFlight()
+
+    async def fetch():
+        await asyncio.sleep(0.05)
+        return "result"
+
+    async def main():
+        first = asyncio.ensure_future(flight.do("key", fetch))
+        second = asyncio.ensure_future(flight.do("key", fetch))
+        await asyncio.sleep(0)
+        first.cancel()
+        return await second
+
+    # Cancelling one caller does not cancel the call the others wait on
+    assert asyncio.run(main()) == "result"
+
+
+def test_async_per_loop():
+    flight = AsyncSingleFlight()
+
+    async def fetch():
+        await asyncio.sleep(0.05)
+        return id(asyncio.get_running_loop())
+
+    def run():
+        return asyncio.run(flight.do("key", fetch))
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        results = list(executor.map(lambda _: run(), range(2)))
+
+    # Each event loop runs its own call, a task can not be awaited from another loop
+    assert results[0] != results[1]
+
+
+def test_authentications_coalesced(emulator, authenticate):
+    access_token = emulator.issue_tokens("alice")["access_token"]
+    emulator.latency = 0.1
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        users = list(executor.map(lambda _: authenticate(access_token), range(8)))
+
+    assert {user.username for user in users} == {"alice"}
+    assert emulator.requests["token/introspect"] == 1
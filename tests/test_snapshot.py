@@ -0,0 +1,62 @@
+import json
+import time
+from multiprocessing import get_context
+
+from jwcrypto import jwk
+
+from django_drf_keycloak_auth.keycloak_utils import JWKSManager, WellKnownManager
+from django_drf_keycloak_auth.snapshot import RealmSnapshot
+
+
+def save_documents(path: str, issuer: str, count: int):
+    snapshot = RealmSnapshot(path, issuer=issuer)
+    for i in range(count):
+        snapshot.save(f"document-{i}", {"i": i})
+
+
+def test_concurrent_processes(tmp_path):
+    path = str(tmp_path / "snapshot.json")
+    context = get_context("spawn")
+    processes = [
+        context.Process(target=save_documents, args=(path, f"issuer-{i}", 20))
+        for i in range(4)
+    ]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+
+    # No process overwrote the documents of another
+    with open(path) as f:
+        issuers = json.load(f)["issuers"]
+    assert sorted(issuers) == [f"issuer-{i}" for i in range(4)]
+    assert all(len(documents) == 20 for documents in issuers.values())
+
+
+ISSUER = "http://keycloak/realms/test"
+
+
+def test_expires_from_saved_at(tmp_path):
+    path = str(tmp_path / "snapshot.json")
+    key = jwk.JWK.generate(kty="RSA", size=1024, kid="key-1")
+    certs = {"keys": [key.export_public(as_dict=True)]}
+    snapshot = RealmSnapshot(path, issuer=ISSUER)
+    snapshot.save("certs", certs)
+    snapshot.save("well_known", {"issuer": ISSUER})
+
+    with open(path) as f:
+        data = json.load(f)
+    for entry in data["issuers"][ISSUER].values():
+        entry["saved_at"] = time.time() - 3000
+    with open(path, "w") as f:
+        json.dump(data, f)
+
+    jwks = JWKSManager(fetch_certs=lambda: certs, ttl=3600, snapshot=snapshot)
+    assert jwks.load_snapshot()
+    assert jwks.has_key("key-1")
+    assert jwks._expires_at - time.monotonic() < 601
+
+    discovery = WellKnownManager(fetch_well_known=dict, ttl=1800, snapshot=snapshot)
+    assert discovery.load_snapshot()
+    # Older than the TTL: fetched again on first use
+    assert discovery.get() == {}
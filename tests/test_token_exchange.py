@@ -0,0 +1,89 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from keycloak.exceptions import KeycloakPostError
+
+from django_drf_keycloak_auth.keycloak_utils import get_keycloak_transport
+from django_drf_keycloak_auth.token_exchange import (
+    a_get_downstream_token,
+    get_downstream_token,
+    get_exchange_cache,
+)
+
+
+def test_exchanged(emulator):
+    subject_token = emulator.issue_tokens("alice")["access_token"]
+
+    access_token = get_downstream_token(subject_token, "billing", scope="read write")
+
+    claims = emulator.get_active_claims(access_token)
+    assert claims["aud"] == "billing"
+    assert claims["preferred_username"] == "alice"
+    assert emulator.requests["token"] == 1
+
+
+def test_cached(emulator):
+    subject_token = emulator.issue_tokens("alice")["access_token"]
+
+    first = get_downstream_token(subject_token, "billing", scope="read write")
+    assert get_downstream_token(subject_token, "billing", scope="write read") == first
+    assert get_downstream_token(subject_token, "shipping") != first
+    assert emulator.requests["token"] == 2
+
+
+@pytest.mark.keycloak_settings(KEYCLOAK_TOKEN_EXCHANGE_CACHE_TTL="0")
+def test_not_cached(emulator):
+    subject_token = emulator.issue_tokens("alice")["access_token"]
+
+    get_downstream_token(subject_token, "billing")
+    get_downstream_token(subject_token, "billing")
+    assert emulator.requests["token"] == 2
+
+
+@pytest.mark.keycloak_settings(KEYCLOAK_TOKEN_EXCHANGE_EXPIRY_MARGIN="10")
+def test_not_served_close_to_expiry(emulator):
+    emulator.access_token_lifespan = 15
+    subject_token = emulator.issue_tokens("alice")["access_token"]
+
+    get_downstream_token(subject_token, "billing")
+
+    # Kept until 10 seconds before it expires, but at most for half of its lifetime
+    [(_, fresh_until, _)] = get_exchange_cache()._entries.values()
+    assert 7 <= fresh_until - time.time() <= 7.5
+
+
+def test_coalesced(emulator):
+    subject_token = emulator.issue_tokens("alice")["access_token"]
+    emulator.latency = 0.1
+
+    def exchange(_):
+        return get_downstream_token(subject_token, "billing")
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        tokens = set(executor.map(exchange, range(8)))
+
+    assert len(tokens) == 1
+    assert emulator.requests["token"] == 1
+
+
+def test_async(emulator):
+    subject_token = emulator.issue_tokens("alice")["access_token"]
+    emulator.latency = 0.05
+
+    async def main():
+        try:
+            return await asyncio.gather(
+                *(a_get_downstream_token(subject_token, "billing") for _ in range(8))
+            )
+        finally:
+            await get_keycloak_transport().aclose()
+
+    assert len(set(asyncio.run(main()))) == 1
+    assert emulator.requests["token"] == 1
+
+
+def test_inactive_subject(emulator):
+    with pytest.raises(KeycloakPostError):
+        get_downstream_token("invalid", "billing")
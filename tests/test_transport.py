@@ -0,0 +1,46 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+
+from django_drf_keycloak_auth.transport import KeycloakTransport
+
+
+def handler(request: httpx.Request) -> httpx.Response:
+    if request.url.path == "/fail":
+        raise httpx.ConnectError("refused", request=request)
+    return httpx.Response(200, json={})
+
+
+def test_counters_under_concurrency():
+    transport = KeycloakTransport(transport=httpx.MockTransport(handler))
+
+    def call(i):
+        path = "fail" if i % 4 == 0 else "ok"
+        try:
+            transport.request("token", "GET", f"http://keycloak/{path}")
+        except httpx.ConnectError:
+            pass
+
+    with ThreadPoolExecutor(max_workers=16) as executor:
+        list(executor.map(call, range(400)))
+
+    stats = transport.stats()
+    assert stats["requests"] == {"token": 400}
+    assert stats["errors"] == {"token": 100}
+    assert stats["in_flight"] == 0
+    transport.close()
+
+
+def test_async_clients_per_loop():
+    transport = KeycloakTransport(async_transport=httpx.MockTransport(handler))
+
+    async def call():
+        response = await transport.a_request("certs", "GET", "http://keycloak/ok")
+        await transport.aclose()
+        return response.status_code
+
+    assert asyncio.run(call()) == 200
+    assert asyncio.run(call()) == 200
+    assert transport.stats()["requests"] == {"certs": 2}
+    assert len(transport._async_clients) == 0
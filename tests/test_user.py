@@ -0,0 +1,58 @@
+import pickle
+
+import pytest
+
+from django_drf_keycloak_auth.models.user import User
+
+CLAIMS = {
+    "sub": "f1d6c6a8",
+    "preferred_username": "alice",
+    "email": "alice@example.com",
+    "realm_access": {"roles": ["user", "admin"]},
+    "resource_access": {"billing": {"roles": ["viewer"]}, "broken": None},
+}
+
+
+def test_fields():
+    user = User(claims=CLAIMS)
+
+    assert user.username == "alice"
+    assert user.pk == "alice"
+    assert user.email == "alice@example.com"
+    assert user.is_authenticated and not user.is_anonymous
+    assert User(claims={"sub": "f1d6c6a8"}).username == "f1d6c6a8"
+
+
+def test_slotted():
+    user = User(claims=CLAIMS)
+
+    assert not hasattr(user, "__dict__")
+    with pytest.raises(AttributeError):
+        user.extra = 1
+
+
+def test_roles():
+    user = User(claims=CLAIMS)
+
+    assert user.role_set == {"user", "admin", "billing:viewer"}
+    assert user.roles == ["admin", "billing:viewer", "user"]
+    # Extracted once
+    assert user.role_set is user.role_set
+    assert user.has_role("admin")
+    assert not user.has_role("viewer")
+    assert user.has_any_role(["guest", "billing:viewer"])
+    assert user.has_all_roles({"user", "admin"})
+    assert not user.has_all_roles({"user", "owner"})
+
+
+def test_no_roles():
+    assert User().role_set == frozenset()
+    assert User(claims={"realm_access": None, "resource_access": []}).roles == []
+
+
+def test_pickle():
+    # Slotted, but still picklable
+    user = pickle.loads(pickle.dumps(User(claims=CLAIMS)))
+
+    assert user == User(claims=CLAIMS)
+    assert user.has_role("billing:viewer")
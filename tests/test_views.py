@@ -0,0 +1,100 @@
+import pytest
+from rest_framework.test import APIClient
+
+REDIRECT_URI = "http://localhost:3000/auth/callback"
+
+
+@pytest.mark.keycloak_settings(KEYCLOAK_USERINFO_FROM_ID_TOKEN=True)
+def test_token_userinfo_from_id_token(emulator):
+    code = emulator.create_code("alice", REDIRECT_URI, nonce="n-0S6_WzA2Mj")
+
+    response = APIClient().get(
+        "/oauth2/token/",
+        {"code": code, "redirect_uri": REDIRECT_URI, "nonce": "n-0S6_WzA2Mj"},
+    )
+
+    assert response.status_code == 200
+    assert response.json()["userinfo"]["preferred_username"] == "alice"
+    assert emulator.requests["userinfo"] == 0
+
+
+@pytest.mark.keycloak_settings(KEYCLOAK_USERINFO_FROM_ID_TOKEN=True)
+def test_token_nonce_mismatch(emulator):
+    code = emulator.create_code("alice", REDIRECT_URI, nonce="n-0S6_WzA2Mj")
+
+    response = APIClient().get(
+        "/oauth2/token/",
+        {"code": code, "redirect_uri": REDIRECT_URI, "nonce": "replayed"},
+    )
+
+    assert response.status_code == 400
+    assert response.json() == {"detail": "Invalid id_token nonce"}
+
+
+def test_token_invalid_code(emulator):
+    response = APIClient().get(
+        "/oauth2/token/", {"code": "unknown", "redirect_uri": REDIRECT_URI}
+    )
+
+    assert response.status_code == 400
+
+
+@pytest.mark.keycloak_settings(KEYCLOAK_USERINFO_FROM_ID_TOKEN=True)
+def test_token_nonce_required(emulator):
+    code = emulator.create_code("alice", REDIRECT_URI, nonce="n-0S6_WzA2Mj")
+
+    response = APIClient().get(
+        "/oauth2/token/", {"code": code, "redirect_uri": REDIRECT_URI}
+    )
+
+    assert response.status_code == 400
+    assert "nonce" in response.json()
+    # The code is not exchanged
+    assert emulator.requests["token"] == 0
+
+
+@pytest.mark.keycloak_settings(KEYCLOAK_USERINFO_FROM_ID_TOKEN=True)
+def test_token_non_ascii_nonce(emulator):
+    code = emulator.create_code("alice", REDIRECT_URI, nonce="n-0S6_WzA2Mj")
+
+    response = APIClient().get(
+        "/oauth2/token/",
+        {"code": code, "redirect_uri": REDIRECT_URI, "nonce": "é-attacker"},
+    )
+
+    assert response.status_code == 400
+    assert emulator.requests["userinfo"] == 0
+
+
+@pytest.mark.keycloak_settings(KEYCLOAK_USERINFO_FROM_ID_TOKEN=True)
+def test_token_tampered_id_token(emulator, monkeypatch):
+    issue_tokens = emulator.issue_tokens
+
+    def issue_tampered_tokens(*args, **kwargs):
+        tokens = issue_tokens(*args, **kwargs)
+        header, payload, signature = tokens["id_token"].split(".")
+        tokens["id_token"] = f"{header}.{payload}.{signature[::-1]}"
+        return tokens
+
+    monkeypatch.setattr(emulator, "issue_tokens", issue_tampered_tokens)
+    code = emulator.create_code("alice", REDIRECT_URI, nonce="n-0S6_WzA2Mj")
+
+    response = APIClient().get(
+        "/oauth2/token/",
+        {"code": code, "redirect_uri": REDIRECT_URI, "nonce": "n-0S6_WzA2Mj"},
+    )
+
+    # The nonce can not be checked, the userinfo endpoint is not a fallback
+    assert response.status_code == 400
+    assert response.json() == {"detail": "Invalid id_token"}
+    assert emulator.requests["userinfo"] == 0
+
+
+@pytest.mark.keycloak_settings(KEYCLOAK_USERINFO_FROM_ID_TOKEN=True)
+def test_callback_without_nonce(emulator):
+    code = emulator.create_code("alice", REDIRECT_URI, nonce="n-0S6_WzA2Mj")
+
+    response = APIClient().get("/oauth2/callback/", {"code": code})
+
+    assert response.status_code == 200
+    assert response.json()["userinfo"]["preferred_username"] == "alice"
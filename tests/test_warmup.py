@@ -0,0 +1,67 @@
+import time
+
+import pytest
+from rest_framework.test import APIClient
+
+from django_drf_keycloak_auth.warmup import get_warmup
+
+
+@pytest.fixture
+def warmup():
+    get_warmup.cache_clear()
+    yield get_warmup()
+    get_warmup.cache_clear()
+
+
+def wait_for(warmup, status: str, timeout: float = 5):
+    deadline = time.monotonic() + timeout
+    while warmup.snapshot()["status"] != status and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return warmup.snapshot()
+
+
+def test_ready(emulator, warmup):
+    client = APIClient()
+
+    assert warmup.run(timeout=5)
+    response = client.get("/keycloak/ready/")
+
+    assert response.status_code == 200
+    assert response.data["realms"]["default"]["ok"]
+
+
+@pytest.mark.keycloak_settings(
+    KEYCLOAK_WARMUP_RETRY_INTERVAL="0.3", KEYCLOAK_WARMUP_MAX_RETRY_INTERVAL="10"
+)
+def test_probe_does_not_restart_failed_warmup(emulator, warmup):
+    client = APIClient()
+    emulator.fail_next(1)
+
+    assert client.get("/keycloak/ready/").status_code == 503
+    state = wait_for(warmup, "failed")
+    assert state["failures"] == 1
+    assert state["retry_in"] > 0
+
+    # Probes only report the state
+    for _ in range(20):
+        assert client.get("/keycloak/ready/").status_code == 503
+    assert emulator.requests[".well-known/openid-configuration"] == 0
+
+    # The retry starts on its own
+    assert wait_for(warmup, "ready")["failures"] == 0
+    assert client.get("/keycloak/ready/").status_code == 200
+    assert emulator.requests[".well-known/openid-configuration"] == 1
+
+
+def test_backoff(warmup):
+    warmup.retry_interval = 5
+    warmup.max_retry_interval = 12
+
+    delays = []
+    for failures in range(1, 5):
+        warmup.failures = failures
+        warmup._schedule_retry()
+        delays.append(round(warmup._retry.when - time.monotonic()))
+        warmup._retry.cancel()
+
+    assert delays == [5, 10, 12, 12]